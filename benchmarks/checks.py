@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import tempfile
+
+# بررسی‌های درستی رفتارهایی که بنچمارک‌ها فقط سرعتشان را می‌سنجند (بدون شبکه، روی دیتابیس موقت)
+#   notify_reload  → reload ایندکس /notify درخواست تکرارشونده‌ی ارسال‌شده را دوباره مسلح نمی‌کند
+#   notify_session → نوتیف session با اولین شروع بازی بعد از آنلاین شدن ارسال می‌شود، مستقل از فاصله‌ی pollها
+#   leaderboards   → به‌روزرسانی تفاضلی جدول‌های رتبه‌بندی با عملیات تصادفی همان rebuild_leaderboards است
+# هر بررسی با AssertionError شکست می‌خورد؛ کد خروج غیرصفر یعنی حداقل یکی شکست خورده
+# مثال:
+#   python -m benchmarks.checks
+#   python -m benchmarks.checks --only notify_reload
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeSummaries:
+    # فقط get_player_summaries که NotifyPoller.sweep لازم دارد؛ وضعیت هر steam_id دستی تنظیم می‌شود
+    def __init__(self):
+        self.players = {}
+
+    def play(self, steam_id, gameid=None, game_name=None, personastate=1):
+        player = {"steamid": steam_id, "personastate": personastate}
+        if gameid:
+            player.update(gameid=str(gameid), gameextrainfo=game_name)
+        self.players[steam_id] = player
+
+    async def get_player_summaries(self, steam_ids, fresh=False):
+        return {steam_id: self.players[steam_id] for steam_id in steam_ids if steam_id in self.players}
+
+
+def notify_poller(db, steam):
+    from notifier import NotifyPoller
+    from presence import PresenceTracker
+    from ratelimit import QuotaTracker
+    from scheduler import PollScheduler
+
+    sent = []
+    poller = NotifyPoller(db, steam, PollScheduler(QuotaTracker(db), daily_budget=10 ** 9), PresenceTracker(db),
+                          lambda chat_id, text, **kw: sent.append((chat_id, kw.get("ref"))))
+    return poller, sent
+
+
+# یک sweep که همه‌ی هدف‌ها در آن سررسیدند (scheduler تازه، مثل دور تغییر وضعیت notify_sweep)
+async def sweep_all(poller):
+    from scheduler import PollScheduler
+    poller.scheduler = PollScheduler(poller.scheduler.quota, daily_budget=10 ** 9)
+    await poller.sweep()
+
+
+# ---- notify_reload ----
+
+async def check_notify_reload():
+    from db import Database
+
+    db = Database("notify_reload.db")
+    db.save_user_data(telegram_id="1", username="target", steam_id="76561198000000001",
+                      display_name="", last_data={})
+    steam = FakeSummaries()
+    steam.play("76561198000000001", 570, "Dota 2")
+    poller, sent = notify_poller(db, steam)
+    poller.load_watches()
+    await sweep_all(poller)
+
+    # هدف وسط بازی است؛ درخواست تکرارشونده‌ی تازه یک‌بار با وضعیت فعلی مقایسه و ارسال می‌شود
+    recurring = db.add_notify_request("10", "target", "Dota 2", "private", appid=570, cooldown=600)
+    poller.add_watch(recurring, "10", "target", "Dota 2", "private", appid=570, cooldown=600)
+    await sweep_all(poller)
+    assert [ref for _, ref in sent] == [str(recurring)], sent
+
+    # cooldown تمام شده و هدف هنوز همان بازی است: نه sweep و نه reload نباید دوباره بفرستند
+    db.mark_notify_fired(recurring, int(time.time()) - 3600)
+    poller.watches._by_id[recurring].ready_at = 0
+    await sweep_all(poller)
+    await poller.reload_watches()
+    await sweep_all(poller)
+    assert len(sent) == 1, f"reload re-armed a fired watch: {sent}"
+
+    # استارت دوباره‌ی پروسه (بدون ایندکس قبلی) هم همین‌طور
+    poller, sent = notify_poller(db, steam)
+    poller.load_watches()
+    await sweep_all(poller)
+    assert not sent, f"restart re-armed a fired watch: {sent}"
+
+    # درخواستی که قبل از reload ثبت شده ولی هنوز مقایسه نشده، بعد از reload هم مقایسه می‌شود
+    fresh = db.add_notify_request("11", "target", "Dota 2", "private", appid=570, cooldown=600)
+    poller.add_watch(fresh, "11", "target", "Dota 2", "private", appid=570, cooldown=600)
+    await poller.reload_watches()
+    await sweep_all(poller)
+    assert [ref for _, ref in sent] == [str(fresh)], sent
+
+    # شروع دوباره‌ی بازی بعد از cooldown یک رویداد واقعی است و ارسال می‌شود
+    db.mark_notify_fired(recurring, int(time.time()) - 3600)
+    await poller.reload_watches()
+    steam.play("76561198000000001")
+    await sweep_all(poller)
+    steam.play("76561198000000001", 570, "Dota 2")
+    await sweep_all(poller)
+    assert [ref for _, ref in sent] == [str(fresh), str(recurring)], sent
+    db.close()
+
+
+# ---- notify_session ----
+
+async def check_notify_session():
+    from db import Database
+    from notifier import parse_watch_options
+
+    _, options = parse_watch_options(["Dota", "2", "session"])
+    assert options["session_only"] and options["cooldown"] is None, f"session must stay one-shot: {options}"
+
+    db = Database("notify_session.db")
+    db.save_user_data(telegram_id="1", username="target", steam_id="76561198000000001",
+                      display_name="", last_data={})
+    steam = FakeSummaries()
+    steam.play("76561198000000001", personastate=0)
+    poller, sent = notify_poller(db, steam)
+    poller.load_watches()
+    await sweep_all(poller)
+
+    session = db.add_notify_request("10", "target", "Dota 2", "private", appid=570, session_only=True)
+    poller.add_watch(session, "10", "target", "Dota 2", "private", appid=570, session_only=True)
+    recurring = db.add_notify_request("11", "target", "Dota 2", "private", appid=570, cooldown=600,
+                                      session_only=True)
+    poller.add_watch(recurring, "11", "target", "Dota 2", "private", appid=570, cooldown=600, session_only=True)
+
+    # آنلاین شدن و شروع بازی در دو poll جدا هم شروع session است
+    steam.play("76561198000000001")
+    await sweep_all(poller)
+    assert not sent, sent
+    steam.play("76561198000000001", 570, "Dota 2")
+    await sweep_all(poller)
+    assert sorted(ref for _, ref in sent) == [str(session), str(recurring)], sent
+    assert db.get_notify_requests_for_watcher("10") == [], "session watch without every= must be one-shot"
+
+    # بازی دوم همان session (بعد از پایان cooldown) شروع session نیست
+    poller.watches._by_id[recurring].ready_at = 0
+    steam.play("76561198000000001")
+    await sweep_all(poller)
+    steam.play("76561198000000001", 570, "Dota 2")
+    await sweep_all(poller)
+    assert len(sent) == 2, f"fired mid-session: {sent}"
+
+    # آفلاین و دوباره آنلاین: session تازه
+    steam.play("76561198000000001", personastate=0)
+    await sweep_all(poller)
+    steam.play("76561198000000001")
+    await sweep_all(poller)
+    steam.play("76561198000000001", 570, "Dota 2")
+    await sweep_all(poller)
+    assert [ref for _, ref in sent][2:] == [str(recurring)], sent
+    db.close()
+
+
+# ---- leaderboards ----
+
+# محتوای جدول‌های رتبه‌بندی بدون ردیف‌های صفر (rebuild آن‌ها را نمی‌سازد، تفاضل‌ها ممکن است نگه دارند)
+def leaderboard_rows(db):
+    queries = {
+        "user_stats": "SELECT steam_id, game_count, total_minutes, recent_minutes FROM user_stats"
+                      " WHERE game_count > 0",
+        "group_stats": "SELECT group_id, members, game_count, total_minutes, recent_minutes FROM group_stats"
+                       " WHERE members > 0",
+        "group_games": "SELECT group_id, appid, players, total_minutes FROM group_games WHERE players > 0",
+    }
+    return {table: sorted(db.conn.execute(sql).fetchall()) for table, sql in queries.items()}
+
+
+# عملیات تصادفی (همگام‌سازی کتابخانه، وصل/عوض کردن Steam، ورود/خروج گروه) با به‌روزرسانی تفاضلی؛
+# نتیجه باید دقیقاً همان rebuild_leaderboards از روی user_games و user_groups باشد
+async def check_leaderboards(seed=7, rounds=20, ops=150):
+    import random
+    from db import Database
+
+    rnd = random.Random(seed)
+    db = Database("leaderboards.db")
+    users = [str(i) for i in range(1, 16)]
+    groups = ["-1001", "-1002", "-1003"]
+    appids = list(range(10, 200, 10))
+    next_steam_id = 76561198000000000
+    for round_no in range(rounds):
+        for _ in range(ops):
+            op = rnd.random()
+            telegram_id = rnd.choice(users)
+            if op < 0.1:
+                # وصل کردن Steam یا عوض کردن آن به حساب تازه
+                next_steam_id += 1
+                db.save_user_data(telegram_id, f"user{telegram_id}", str(next_steam_id), "", {})
+            elif op < 0.55:
+                steam_id = db.get_steam_id_by_telegram_id(telegram_id)
+                if not steam_id:
+                    continue
+                local = db.get_playtimes(steam_id)
+                upserts = [
+                    (appid, rnd.randrange(0, 5000), rnd.choice((0, 0, rnd.randrange(1, 600))))
+                    for appid in rnd.sample(appids, rnd.randrange(0, 6))
+                ]
+                upserted = {appid for appid, _, _ in upserts}
+                removed = [appid for appid in local if appid not in upserted and rnd.random() < 0.2]
+                db.apply_library_delta(steam_id, upserts, removed, full=rnd.random() < 0.5)
+            elif op < 0.7:
+                db.link_user_to_group(telegram_id, rnd.choice(groups), f"user{telegram_id}")
+            elif op < 0.85:
+                db.touch_group_members([
+                    (member, rnd.choice(groups), f"user{member}", "2026-01-01 00:00:00")
+                    for member in rnd.sample(users, rnd.randrange(1, 5))
+                ])
+            else:
+                db.remove_group_members([(member, rnd.choice(groups)) for member in rnd.sample(users, 2)])
+        db.flush()
+        incremental = leaderboard_rows(db)
+        db.rebuild_leaderboards()
+        rebuilt = leaderboard_rows(db)
+        for table in rebuilt:
+            assert incremental[table] == rebuilt[table], (
+                f"round {round_no}: {table} differs from rebuild_leaderboards "
+                f"(incremental-only {sorted(set(incremental[table]) - set(rebuilt[table]))[:3]}, "
+                f"rebuild-only {sorted(set(rebuilt[table]) - set(incremental[table]))[:3]})"
+            )
+    db.close()
+
+
+CHECKS = {
+    "notify_reload": check_notify_reload,
+    "notify_session": check_notify_session,
+    "leaderboards": check_leaderboards,
+}
+
+
+async def run(names):
+    failed = []
+    for name, check in CHECKS.items():
+        if names and name not in names:
+            continue
+        try:
+            await check()
+        except AssertionError as e:
+            failed.append(name)
+            print(f"FAIL {name}: {e}", file=sys.stderr)
+        else:
+            print(f"ok   {name}", file=sys.stderr)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Correctness checks against fake Steam backends")
+    parser.add_argument("--only", nargs="*", choices=sorted(CHECKS))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    for name in ("NOTIFY_WORKERS", "RECORD_UPDATES", "STEAM_CACHE_DB"):
+        os.environ.pop(name, None)
+
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp(prefix="steamsync-checks-")
+    os.chdir(workdir)
+    try:
+        failed = asyncio.run(run(args.only))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import json
+import time
+import random
+import asyncio
+from io import BytesIO
+import httpx
+from PIL import Image
+from telegram.request import BaseRequest
+
+# جایگزین‌های محلی Steam Web API، صفحه‌ی جستجوی فروشگاه و Bot API تلگرام
+# (برای benchmarks/run.py و loadtest.py)؛ هیچ درخواستی به بیرون نمی‌رود
+
+FAKE_GAMES = [(730, "Counter-Strike 2"), (570, "Dota 2"), (252490, "Rust"), (440, "Team Fortress 2"),
+              (1172470, "Apex Legends"), (578080, "PUBG: BATTLEGROUNDS"), (271590, "Grand Theft Auto V")]
+
+
+class StubTelegramRequest(BaseRequest):
+    # پاسخ ساختگی برای همه‌ی متدهای Bot API
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = 0
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "SteamSyncBot", "username": "steamsyncbot"}
+        elif api_method.startswith("send") or api_method.startswith("edit"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id", 0) or 0)
+            result = {
+                "message_id": self._message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+                "text": params.get("text", ""),
+            }
+            if api_method == "sendPhoto":
+                result["photo"] = [{"file_id": f"fake-{self._message_id}", "file_unique_id": "u",
+                                    "width": 800, "height": 300}]
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+class FakeSteam:
+    # Steam Web API + store search + آواتار روی httpx.MockTransport
+    # latency: تأخیر هر پاسخ (ثانیه)، error_rate: احتمال پاسخ 429 (با Retry-After)
+    def __init__(self, latency=0.02, error_rate=0.0, retry_after=0.05, online_ratio=0.3,
+                 games_per_user=200, deals=500, seed=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.online_ratio = online_ratio
+        self.games_per_user = games_per_user
+        self.deals = deals
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.throttled = 0
+        self.generation = 0
+        self._avatar = None
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.throttled += 1
+            return httpx.Response(429, headers={"Retry-After": str(self.retry_after)})
+
+        path = request.url.path
+        params = request.url.params
+        if "GetPlayerSummaries" in path:
+            players = [self.player(steam_id) for steam_id in params.get("steamids", "").split(",") if steam_id]
+            return httpx.Response(200, json={"response": {"players": players}})
+        if "GetOwnedGames" in path:
+            return httpx.Response(200, json={"response": {
+                "game_count": self.games_per_user, "games": self.owned_games(params.get("steamid", "0"))
+            }})
+        if "GetRecentlyPlayedGames" in path:
+            games = self.owned_games(params.get("steamid", "0"))[:3]
+            return httpx.Response(200, json={"response": {"total_count": len(games), "games": games}})
+        if "ResolveVanityURL" in path:
+            return httpx.Response(200, json={"response": {"success": 1, "steamid": "76561198000000001"}})
+        if "GetAppList" in path:
+            apps = [{"appid": appid, "name": name} for appid, name in FAKE_GAMES]
+            return httpx.Response(200, json={"response": {"apps": apps, "have_more_results": False}})
+        if "search/results" in path:
+            start, count = int(params.get("start", 0)), int(params.get("count", 100))
+            return httpx.Response(200, json={
+                "results_html": self.search_html(start, min(count, max(0, self.deals - start))),
+                "total_count": self.deals,
+            })
+        if "avatar" in request.url.host or path.endswith(".jpg"):
+            return httpx.Response(200, content=self.avatar())
+        return httpx.Response(200, json={"response": {}})
+
+    # وضعیت همه‌ی بازیکن‌ها تا فراخوانی بعدی advance ثابت می‌ماند
+    def advance(self):
+        self.generation += 1
+
+    def player(self, steam_id):
+        rnd = random.Random(f"{steam_id}:{self.generation}")
+        player = {
+            "steamid": steam_id, "personaname": f"player{steam_id[-5:]}",
+            "personastate": 1 if rnd.random() < self.online_ratio else 0,
+            "avatarfull": f"https://avatars.fake/{steam_id[-3:]}.jpg", "avatarhash": steam_id[-3:],
+            "lastlogoff": int(time.time()) - 3600,
+        }
+        if player["personastate"] and rnd.random() < 0.5:
+            appid, name = rnd.choice(FAKE_GAMES)
+            player["gameid"], player["gameextrainfo"] = str(appid), name
+        return player
+
+    def owned_games(self, steam_id):
+        rnd = random.Random(steam_id)
+        games = []
+        for i in range(self.games_per_user):
+            appid, name = FAKE_GAMES[i] if i < len(FAKE_GAMES) else (100000 + i * 10, f"Game {i}")
+            game = {"appid": appid, "name": name, "img_icon_url": "icon", "playtime_forever": rnd.randrange(0, 50000)}
+            if i < 3:
+                game["playtime_2weeks"] = rnd.randrange(1, 600)
+            games.append(game)
+        return games
+
+    def search_html(self, start, count):
+        rows = []
+        for i in range(start, start + count):
+            discount = 10 + (i * 7) % 85
+            rows.append(
+                f'<a href="https://store.steampowered.com/app/{200000 + i}/Deal_{i}/?snr=1" '
+                f'data-ds-appid="{200000 + i}" class="search_result_row ds_collapse_flag">'
+                f'<div class="responsive_search_name_combined"><div class="col search_name ellipsis">'
+                f'<span class="title">Deal Game {i}</span></div>'
+                f'<div class="search_price_discount_combined responsive_secondrow" data-price-final="{999 - i % 900}" '
+                f'data-discount="{discount}"><div class="search_discount_block">'
+                f'<div class="discount_pct">-{discount}%</div><div class="discount_prices">'
+                f'<div class="discount_original_price">$19.99</div>'
+                f'<div class="discount_final_price">${(999 - i % 900) / 100:.2f}</div></div></div></div></div></a>'
+            )
+        return "".join(rows)
+
+    def avatar(self):
+        if self._avatar is None:
+            buffer = BytesIO()
+            Image.new("RGB", (184, 184), color=(90, 120, 160)).save(buffer, format="JPEG")
+            self._avatar = buffer.getvalue()
+        return self._avatar
@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import datetime
+
+from benchmarks.fakes import FakeSteam, StubTelegramRequest
+
+# مجموعه‌ی بنچمارک مسیرهای داغ بات روی Steam و تلگرام ساختگی (بدون شبکه):
+#   notify_sweep   → یک دور NotifyPoller.sweep با ۱k/۱۰k/۱۰۰k درخواست /notify
+#   online_command → /online برای گروه‌های بزرگ (از handler واقعی بات)
+#   profile_card   → رندر کارت پروفایل (sync و async همزمان)
+#   db_writes      → نرخ نوشتن‌های پرتکرار Database
+#   deals_ingest   → دریافت و ذخیره‌ی همه‌ی صفحات تخفیف
+# خروجی JSON است (stdout یا --output) تا نتیجه‌ی دو commit قابل مقایسه باشد
+# مثال:
+#   python -m benchmarks.run --quick
+#   python -m benchmarks.run --only notify_sweep --latency 0.05 --error-rate 0.05 --output before.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WATCHES_PER_TARGET = 10
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def steam_id_of(i):
+    return str(76561198000000000 + i)
+
+
+# کاربران ثبت‌شده (user{i}) با steam_id ساختگی، همه عضو group_id
+def seed_users(db, count, group_id=None):
+    db.conn.executemany(
+        "INSERT OR IGNORE INTO users (telegram_id, username, steam_id, display_name) VALUES (?, ?, ?, ?)",
+        [(str(i), f"user{i}", steam_id_of(i), f"User {i}") for i in range(1, count + 1)]
+    )
+    if group_id:
+        db.conn.executemany(
+            "INSERT OR IGNORE INTO user_groups (telegram_id, group_id, username) VALUES (?, ?, ?)",
+            [(str(i), group_id, f"user{i}") for i in range(1, count + 1)]
+        )
+    db.conn.commit()
+
+
+def steam_api_for(fake, limiter=None, quota=None):
+    from cache import ResponseCache
+    from http_client import HttpClient
+    from steam_api import AsyncSteamAPI
+    return AsyncSteamAPI(
+        "bench", http=HttpClient(transport=fake.transport()), cache=ResponseCache(), limiter=limiter, quota=quota
+    )
+
+
+# ---- notify_sweep ----
+
+async def bench_notify_sweep(args, watches):
+    from db import Database
+    from notifier import NotifyPoller
+    from presence import PresenceTracker
+    from ratelimit import QuotaTracker
+    from scheduler import PollScheduler
+    from benchmarks.fakes import FAKE_GAMES
+
+    db = Database(f"notify_{watches}.db")
+    targets = max(1, watches // WATCHES_PER_TARGET)
+    seed_users(db, targets)
+    db.conn.executemany(
+        "INSERT INTO notify_requests (watcher_telegram_id, target_username, game_name, scope, group_id, appid)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (str(100000 + i), f"user{i % targets + 1}", FAKE_GAMES[i % len(FAKE_GAMES)][1], "group", "-100",
+             FAKE_GAMES[i % len(FAKE_GAMES)][0])
+            for i in range(watches)
+        ]
+    )
+    db.conn.commit()
+
+    fake = FakeSteam(latency=args.latency, error_rate=args.error_rate)
+    quota = QuotaTracker(db)
+    steam_api = steam_api_for(fake, quota=quota)
+    enqueued = []
+    # بودجه‌ی بزرگ: همه‌ی هدف‌ها در همان دور اول سررسیدند
+    poller = NotifyPoller(db, steam_api, PollScheduler(quota, daily_budget=10 ** 9), PresenceTracker(db),
+                          lambda *a, **kw: enqueued.append(a))
+
+    # ساخت ایندکس درخواست‌ها در حافظه (یک‌بار هنگام استارت) و حافظه‌ی آن
+    t0 = time.perf_counter()
+    poller.load_watches()
+    load = time.perf_counter() - t0
+    poller.watches = None
+    tracemalloc.start()
+    poller.load_watches()
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # دور اول: همه‌ی هدف‌ها poll می‌شوند و درخواست‌ها با وضعیت فعلی مقایسه می‌شوند
+    t0 = time.perf_counter()
+    await poller.sweep()
+    cold = time.perf_counter() - t0
+    cold_requests = fake.requests
+
+    # دور بی‌کار: هیچ هدفی سررسید نشده (هزینه‌ی ثابت هر NOTIFY_TICK)
+    idle = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        await poller.sweep()
+        idle.append(time.perf_counter() - t0)
+
+    # دور با تغییر وضعیت: همه دوباره سررسید و بخشی از هدف‌ها بازی جدیدی شروع کرده‌اند
+    fake.advance()
+    poller.scheduler = PollScheduler(quota, daily_budget=10 ** 9)
+    fired_before = len(enqueued)
+    t0 = time.perf_counter()
+    await poller.sweep()
+    changed = time.perf_counter() - t0
+    db.flush()
+
+    await steam_api.close()
+    db.close()
+    return {
+        "index_load_ms": ms(load),
+        "index_bytes_per_watch": round(index_bytes / watches),
+        "cold_sweep_ms": ms(cold),
+        "idle_sweep_p50_ms": ms(percentile(idle, 50)),
+        "changed_sweep_ms": ms(changed),
+        "targets": targets,
+        "steam_requests_cold": cold_requests,
+        "steam_requests_total": fake.requests,
+        "throttled": fake.throttled,
+        "notifications_cold": fired_before,
+        "notifications_changed": len(enqueued) - fired_before,
+    }
+
+
+# ---- online_command ----
+
+def group_message(update_id, group_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+            "chat": {"id": int(group_id), "type": "supergroup", "title": "bench"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Bench", "username": "user1"},
+        },
+    }
+
+
+async def bench_online_command(args, members):
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+    from bot import build_application
+    from http_client import HttpClient
+
+    fake = FakeSteam(latency=args.latency, error_rate=args.error_rate)
+    telegram_request = StubTelegramRequest(latency=args.telegram_latency)
+    builder = ApplicationBuilder().token("123456:bench").request(telegram_request).updater(None)
+    app, bot = build_application(builder=builder, http=HttpClient(transport=fake.transport()))
+    group_id = str(-1000000000000 - members)
+    seed_users(bot.db, members, group_id)
+
+    timings = {}
+    async with app:
+        for label in ("cold", "warm"):
+            update = Update.de_json(group_message(len(timings) + 1, group_id, "/online"), app.bot)
+            t0 = time.perf_counter()
+            await app.process_update(update)
+            timings[label] = time.perf_counter() - t0
+    await bot.close()
+    return {
+        "cold_ms": ms(timings["cold"]),
+        "warm_ms": ms(timings["warm"]),
+        "steam_requests": fake.requests,
+        "throttled": fake.throttled,
+        "telegram_calls": telegram_request.calls,
+    }
+
+
+# ---- profile_card ----
+
+async def bench_profile_card(args, cards):
+    from PIL import Image
+    from http_client import HttpClient
+    import imagegen
+
+    avatar = Image.new("RGB", (120, 120), color=(90, 120, 160))
+    t0 = time.perf_counter()
+    for i in range(cards):
+        imagegen.render_profile_card(f"Player {i}", avatar, i, "2026-01-01 12:00")
+    render = time.perf_counter() - t0
+
+    # مسیر handler: دانلود آواتار (هر کارت با hash جدا، یعنی بدون کش) + رندر در thread pool
+    fake = FakeSteam(latency=args.latency)
+    http = HttpClient(transport=fake.transport())
+    t0 = time.perf_counter()
+    await asyncio.gather(*(
+        imagegen.generate_profile_card_async(
+            http, f"Player {i}", f"https://avatars.fake/{i}.jpg", f"bench-{time.time()}-{i}", i, "2026-01-01 12:00"
+        )
+        for i in range(cards)
+    ))
+    pipeline = time.perf_counter() - t0
+    await http.close()
+    return {
+        "render_cards_per_s": round(cards / render, 1),
+        "render_ms_per_card": ms(render / cards),
+        "async_cards_per_s": round(cards / pipeline, 1),
+        "avatar_requests": fake.requests,
+    }
+
+
+# ---- db_writes ----
+
+def bench_db_writes(args, ops):
+    from db import Database
+
+    db = Database("writes.db")
+    seed_users(db, 100)
+    results = {}
+
+    def timed(name, fn):
+        t0 = time.perf_counter()
+        for i in range(ops):
+            fn(i)
+        db.flush()
+        results[f"{name}_per_s"] = round(ops / (time.perf_counter() - t0), 1)
+
+    timed("enqueue_message", lambda i: db.enqueue_message(-100, f"message {i}", kind="bench", ref=str(i)))
+    timed("increment_api_usage", lambda i: db.increment_api_usage("2026-01-01", [(f"endpoint{i % 5}", 1, 0)]))
+    timed("save_presence_states", lambda i: db.save_presence_states(
+        [(steam_id_of(i % 1000), i % 2, None, None)]
+    ))
+    timed("apply_library_delta", lambda i: db.apply_library_delta(
+        steam_id_of(i % 100 + 1), [(100000 + i % 500, i, i % 60)]
+    ))
+    db.close()
+    return results
+
+
+# ---- deals_ingest ----
+
+async def bench_deals_ingest(args, deals):
+    from db import Database
+    from http_client import HttpClient
+    from steam_deals import DealsIngestor
+
+    db = Database(f"deals_{deals}.db")
+    fake = FakeSteam(latency=args.latency, error_rate=args.error_rate, deals=deals)
+    http = HttpClient(transport=fake.transport())
+    ingestor = DealsIngestor(http, db, max_deals=deals)
+    timings = []
+    for _ in range(2):
+        t0 = time.perf_counter()
+        await ingestor.ingest()
+        timings.append(time.perf_counter() - t0)
+    await http.close()
+    db.close()
+    return {"first_ms": ms(timings[0]), "diff_ms": ms(timings[1]), "store_requests": fake.requests}
+
+
+BENCHMARKS = {
+    "notify_sweep": (bench_notify_sweep, "watches", [1000, 10000, 100000], [1000, 10000]),
+    "online_command": (bench_online_command, "members", [100, 500, 2000], [100, 500]),
+    "profile_card": (bench_profile_card, "cards", [200], [50]),
+    "db_writes": (bench_db_writes, "ops", [20000], [2000]),
+    "deals_ingest": (bench_deals_ingest, "deals", [500], [200]),
+}
+
+
+async def run(args):
+    results = []
+    for name, (fn, param, sizes, quick_sizes) in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        for size in (quick_sizes if args.quick else sizes):
+            outcome = fn(args, size)
+            if asyncio.iscoroutine(outcome):
+                outcome = await outcome
+            results.append({
+                "benchmark": name,
+                "params": {param: size, "latency": args.latency, "error_rate": args.error_rate},
+                "metrics": outcome,
+            })
+            print(f"{name} {param}={size}: {json.dumps(outcome)}", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot paths against fake Steam and Telegram backends")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="smaller sizes")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake Steam response latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Steam responses that are 429")
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--steam-rate", type=float, default=5, help="STEAM_RATE_LIMIT used by bot handlers")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    logging.basicConfig(level=logging.ERROR)
+    os.environ["STEAM_RATE_LIMIT"] = str(args.steam_rate)
+    for name in ("NOTIFY_WORKERS", "RECORD_UPDATES", "STEAM_CACHE_DB"):
+        os.environ.pop(name, None)
+
+    # دیتابیس‌های موقت؛ بات در cwd فایل steamsync_users.db می‌سازد
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp(prefix="steamsync-bench-")
+    os.chdir(workdir)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
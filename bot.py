@@ -1,30 +1,106 @@
+import time
+# لحظه‌ی شروع پروسه (قبل از ایمپورت‌های سنگین) برای گزارش زمان راه‌اندازی
+STARTUP_T0 = time.perf_counter()
 import os
+import json
 import logging
 import asyncio
-import nest_asyncio
 from telegram.ext import (
-    ApplicationBuilder, CommandHandler, CallbackQueryHandler
+    ApplicationBuilder, CommandHandler, CallbackQueryHandler, TypeHandler, MessageHandler, filters
 )
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from steam_api import SteamAPI
+from steam_api import AsyncSteamAPI
+from http_client import HttpClient
+from cache import ResponseCache
+from presence import PresenceTracker
+from scheduler import PollScheduler, run_every
+from ratelimit import TokenBucket, QuotaTracker
+from dispatcher import MessageDispatcher
 from db import Database
-from imagegen import generate_profile_card
 from dotenv import load_dotenv
 import random
-from datetime import datetime
-from steam_deals import fetch_discounted_games
+from datetime import datetime, timedelta
+from catalog import AppCatalog
+from library_sync import LibrarySync
+from notifier import NotifyPoller, NOTIFY_TICK, parse_watch_options, describe_watch_options
+from membership import MembershipTracker, PRUNE_INTERVAL
+import metrics
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
+# httpx هر درخواست را با URL کامل (شامل کلید API) لاگ می‌کند
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# سقف زمانی (ثانیه) برای جمع‌آوری وضعیت اعضا در /online
+ONLINE_LOOKUP_TIMEOUT = 8
+# فاصله‌ی ارسال تخفیف‌ها
+DEALS_INTERVAL = 86400
+# فاصله‌ی به‌روزرسانی افزایشی کاتالوگ اپ‌ها
+CATALOG_REFRESH_INTERVAL = 6 * 3600
+# هر چند ثانیه کتابخانه‌های قدیمی کاربران بررسی می‌شوند
+LIBRARY_SYNC_TICK = 300
+# هر چند ثانیه فعالیت اخیر اعضای گروه‌ها (/activity) به‌روز می‌شود
+ACTIVITY_REFRESH_TICK = 600
+# تعداد پروسه‌های poller جدا (worker.py)؛ صفر یعنی همه‌چیز در همین پروسه
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "0"))
+# تعداد updateهایی که همزمان پردازش می‌شوند (۱ = ترتیبی)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))
+# پورت endpoint متریک‌ها (/metrics با فرمت Prometheus)؛ صفر یعنی غیرفعال
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# آدرس bind آن؛ پیش‌فرض فقط loopback
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+HANDLER_SECONDS = metrics.histogram(
+    "handler_seconds", "Telegram update handling time per command", ("command", "status")
+)
 
 class SteamBot:
-    def __init__(self, app):
+    def __init__(self, app, http=None):
+        # مدت هر مرحله‌ی راه‌اندازی (ثانیه)؛ در post_init و با اولین update گزارش می‌شود
+        self.startup = {}
+        self._startup_mark = STARTUP_T0
+        self._first_update_seen = False
+        self.mark_startup("imports")
         self.db = Database()
-        self.steam_api = SteamAPI(os.getenv("STEAM_API_KEY"))
+        self.mark_startup("database")
+        # استخر اتصال مشترک برای Steam API و صفحه‌ی فروشگاه
+        self.http = http or HttpClient()
+        # کش پاسخ‌های Steam؛ با STEAM_CACHE_DB لایه‌ی SQLite هم فعال می‌شود
+        self.cache = ResponseCache(db_path=os.getenv("STEAM_CACHE_DB"))
+        # نرخ مجاز و شمارش مصرف روزانه‌ی Steam API، مشترک بین همه‌ی فراخوانی‌ها
+        # (در حالت worker، نرخ بین این پروسه و pollerها تقسیم می‌شود)
+        self.rate_limiter = TokenBucket(rate=float(os.getenv("STEAM_RATE_LIMIT", "5")) / (NOTIFY_WORKERS + 1))
+        self.quota = QuotaTracker(self.db)
+        self.steam_api = AsyncSteamAPI(
+            os.getenv("STEAM_API_KEY"), http=self.http, cache=self.cache,
+            limiter=self.rate_limiter, quota=self.quota
+        )
         self.bot = app.bot
+        # صف پایدار پیام‌های خروجی تسک‌های پس‌زمینه
+        self.dispatcher = MessageDispatcher(self.bot, self.db)
+        # آخرین وضعیت حضور هر هدف، برای تشخیص تغییرات بین دو poll
+        self.presence = PresenceTracker(self.db)
+        # دریافت صفحه‌به‌صفحه‌ی تخفیف‌ها (در اولین استفاده ساخته می‌شود؛ property deals)
+        self._deals = None
+        # کاتالوگ اپ‌های Steam برای تبدیل نام بازی به appid
+        self.catalog = AppCatalog(self.db, self.steam_api)
+        # همگام‌سازی افزایشی کتابخانه‌ی بازی‌ها (handlerها فقط از نسخه‌ی محلی می‌خوانند)
+        self.library = LibrarySync(self.db, self.steam_api)
+        # زمان‌بندی تطبیقی poll هر هدف + سقف مصرف روزانه‌ی Steam API
+        self.scheduler = PollScheduler(self.quota, daily_budget=int(os.getenv("STEAM_DAILY_BUDGET", "90000")))
+        # بررسی درخواست‌های /notify (فقط وقتی worker جدا اجرا نمی‌شود)
+        # ایندکس درخواست‌ها در حافظه با /notify، /removenotif و /linksteam همگام می‌ماند
+        self.notifier = NotifyPoller(self.db, self.steam_api, self.scheduler, self.presence, self.dispatcher.enqueue)
+        # عضویت اعضا در گروه‌ها (برای /online، /rank و /activity) از پیام‌های گروه
+        self.membership = MembershipTracker(self.db)
+        self._tasks = []
+        self.record_path = os.getenv("RECORD_UPDATES")
+        self._register_metrics()
+        self.mark_startup("setup")
         # لیست adminها (در صورت نیاز)
         self.ADMINS = [40746772]
         self.nicknames = [
@@ -65,6 +141,10 @@ class SteamBot:
     • وقتی آن یوزر بازی خاص رو پلی کرد، خبر بده
       - اگر بنویسی “here”، خبر در گروه اعلام می‌شه
       - در غیر این صورت، خبر در پیام خصوصی (PV) شما می‌ره
+      - نام بازی می‌تونه چندکلمه‌ای باشه (مثلاً Counter-Strike 2) و با کاتالوگ استیم تطبیق داده می‌شه
+      - به‌طور پیش‌فرض یک‌باره‌ست؛ با every=2h هر بار که بازی رو شروع کنه (حداکثر هر ۲ ساعت) خبر می‌ده
+      - quiet=23-8: بین این ساعت‌ها (وقت ایران) پیامی نمی‌فرسته
+      - session: فقط وقتی اولین بازیِ بعد از آنلاین شدنش باشه (نه وسط یک session)؛ مثل بقیه یک‌باره‌ست مگر با every=
   /mynotifs
     • فهرست نوتیف‌های ثبت‌شده توسط شما
   /removenotif [ID]
@@ -73,15 +153,20 @@ class SteamBot:
 📌 دستورات گروهی:
   /online
     • نمایش اعضای آنلاین گروهی که قبلاً /linksteam زدن
+  /activity
+    • چه کسی در دو هفته‌ی اخیر چه بازی‌ای کرده (هر ساعت به‌روز می‌شه)
+  /rank [recent|games|top|GameName]
+    • رتبه‌بندی اعضای گروه بر اساس ساعت بازی (کل / دو هفته‌ی اخیر / تعداد بازی)
+    • top: پرطرفدارترین بازی‌های گروه | نام بازی: بهترین بازیکن‌های همان بازی
+  /compare @user1 @user2
+    • مقایسه‌ی آمار دو کاربر و بازی‌های مشترکشون
   /setdeals [topic_id]
     • تنظیم تاپیک مخصوص ارسال روزانه تخفیف‌ها
     • مثال: /setdeals 45 
 
-  🔔 هر ۵ دقیقه: بات بررسی می‌کنه ببینه آیا کاربری درخواست `/notify` داره یا نه
+  🔔 بین ۳۰ ثانیه تا ۳۰ دقیقه (بسته به فعالیت هر کاربر): بات درخواست‌های `/notify` رو بررسی می‌کنه
   ⏲️ هر ۲۴ ساعت: بات لیست تخفیف‌ها رو توی تاپیک تعریف‌شده ارسال می‌کنه
   🧾 دیگه چی؟ بزودی:
-- /compare
-- /rank
 - ...
 
 """
@@ -103,23 +188,26 @@ class SteamBot:
 
         input_id = context.args[0]
         try:
-            steam_id = input_id if input_id.isdigit() else self.steam_api.resolve_vanity_url(input_id)
+            steam_id = input_id if input_id.isdigit() else await self.steam_api.resolve_vanity_url(input_id)
         except Exception:
             await update.message.reply_text("🔑 این آیدی استیم معتبر نیست. دوباره امتحان کن.")
             return
 
-        # فراخوانی API برای دریافت پروفایل و ذخیره در دیتابیس
+        # فراخوانی API برای دریافت پروفایل و ذخیره در دیتابیس (کتابخانه کامل همگام می‌شود)
         try:
-            summary = self.steam_api.get_player_summary(steam_id)
-            games = self.steam_api.get_owned_games(steam_id)
+            summary, _ = await asyncio.gather(
+                self.steam_api.get_player_summary(steam_id),
+                self.library.sync(steam_id, force=True)
+            )
 
             self.db.save_user_data(
                 telegram_id=user_id,
                 username=username,
                 steam_id=steam_id,
                 display_name=summary.get("personaname", ""),
-                last_data={"summary": summary, "games": games}
+                last_data={"summary": summary}
             )
+            self.notifier.link_target(username, steam_id)
             await update.message.reply_text("✅ آیدی استیم شما با موفقیت ثبت شد!")
         except Exception as e:
             logging.error(e)
@@ -137,15 +225,17 @@ class SteamBot:
         if context.args:
             input_id = context.args[0]
             try:
-                steam_id = input_id if input_id.isdigit() else self.steam_api.resolve_vanity_url(input_id)
+                steam_id = input_id if input_id.isdigit() else await self.steam_api.resolve_vanity_url(input_id)
             except Exception:
                 await update.message.reply_text("🔑 این آیدی استیم معتبر نیست. دوباره امتحان کن.")
                 return
 
-            # دریافت پروفایل برای آن SteamID
+            # دریافت پروفایل برای آن SteamID (کتابخانه‌ی حساب‌های وصل‌نشده ذخیره نمی‌شود)
             try:
-                summary = self.steam_api.get_player_summary(steam_id)
-                games = self.steam_api.get_owned_games(steam_id)
+                summary, library = await asyncio.gather(
+                    self.steam_api.get_player_summary(steam_id),
+                    self.library.overview(steam_id, refresh=True)
+                )
             except Exception as e:
                 logging.error(e)
                 await update.message.reply_text("❌ مشکلی پیش اومد. دوباره تلاش کن!")
@@ -153,25 +243,27 @@ class SteamBot:
 
         # اگر آرگومان نداشته باشد → سعی کن SteamID خودِ کاربر را از دیتابیس بگیری
         else:
-            row = self.db.conn.execute(
-                "SELECT steam_id FROM users WHERE telegram_id = ?", (user_id,)
-            ).fetchone()
-            if not row:
+            steam_id = self.db.get_steam_id_by_telegram_id(user_id)
+            if not steam_id:
                 await update.message.reply_text(
                     "👀 اول باید آیدی استیم خودتو ثبت کنی:\n"
                     "/linksteam [SteamID یا vanity URL]"
                 )
                 return
 
-            steam_id = row[0]
             try:
-                summary = self.steam_api.get_player_summary(steam_id)
-                games = self.steam_api.get_owned_games(steam_id)
+                summary, library = await asyncio.gather(
+                    self.steam_api.get_player_summary(steam_id),
+                    self.library.overview(steam_id, refresh=True)
+                )
             except Exception as e:
                 logging.error(e)
                 await update.message.reply_text("❌ مشکلی پیش اومد. دوباره تلاش کن!")
                 return
 
+        # پروفایل خصوصی: تعداد بازی‌ها نامعلوم است، نه صفر
+        game_count = library[0] if library else "نامشخص"
+
         # اگر اطلاعات بدست آمد → نمایشش بده
         nickname = random.choice(self.nicknames)
         state = summary.get("personastate", 0)
@@ -186,7 +278,7 @@ class SteamBot:
 
         caption = (
             f"🧑‍🚀 {summary.get('personaname','')}\n"
-            f"🎮 تعداد بازی‌هات: {len(games)}\n"
+            f"🎮 تعداد بازی‌هات: {game_count}\n"
             f"🏷️ لقبت: {nickname}\n"
             f"📶 وضعیت: {status}" + (f" | 🎲 {game}" if game else "") + "\n"
             f"🌍 ریجن: {country}"
@@ -214,51 +306,77 @@ class SteamBot:
 
         if data.startswith("games_"):
             try:
-                games = self.steam_api.get_owned_games(steam_id)
-                top_games = sorted(
-                    [g for g in games if g.get("playtime_forever", 0) > 0],
-                    key=lambda g: g["playtime_forever"],
-                    reverse=True
-                )[:5]
+                library = await self.library.overview(steam_id)
+                top_games = library[2] if library else []
 
                 if not top_games:
                     await query.message.reply_text("هنوز بازی‌ای ثبت نشده!")
                     return
 
                 msg = "🎮 پرپلی‌ترین‌ بازی‌هات:\n\n" + "\n".join(
-                    f"{i+1}. {g.get('name','نامشخص')} - {g.get('playtime_forever',0)//60} ساعت"
-                    for i, g in enumerate(top_games)
+                    f"{i+1}. {name} - {playtime//60} ساعت"
+                    for i, (name, playtime) in enumerate(top_games)
                 )
                 await query.message.reply_text(msg)
             except Exception as e:
                 await query.message.reply_text(f"خطا در پردازش بازی‌ها: {str(e)}")
 
         elif data.startswith("stats_"):
-            games = self.steam_api.get_owned_games(steam_id)
-            total = sum(g["playtime_forever"] for g in games) // 60
+            library = await self.library.overview(steam_id)
+            if not library:
+                await query.message.reply_text("🔒 کتابخانه‌ی این پروفایل در دسترس نیست (احتمالاً خصوصی است).")
+                return
+            game_count, total_minutes, _ = library
+            total = total_minutes // 60
             nickname = "نوب سگ" if total < 100 else (
                 "تازه‌کار جان‌سخت" if total < 500 else (
                     "افسانه‌ی خواب‌ندیده" if total < 1000 else "رئیس قبیله"
                 )
             )
             await query.message.reply_text(
-                f"📊 آمار کلی:\nتعداد بازی‌هات: {len(games)}\n"
+                f"📊 آمار کلی:\nتعداد بازی‌هات: {game_count}\n"
                 f"تایم پلی: {total} ساعت\nلقب: {nickname}"
             )
 
         elif data.startswith("profilepic_"):
-            summary = self.steam_api.get_player_summary(steam_id)
-            games = self.steam_api.get_owned_games(steam_id)
-            filename = f"/tmp/{steam_id}_card.png"
-            generate_profile_card(
-                display_name=summary.get("personaname",""),
-                avatar_url=summary.get("avatarfull",""),
-                total_games=len(games),
-                last_seen=datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC"),
-                filename=filename
+            summary, library = await asyncio.gather(
+                self.steam_api.get_player_summary(steam_id),
+                self.library.overview(steam_id)
+            )
+            game_count = library[0] if library else 0
+            display_name = summary.get("personaname", "")
+            avatar_hash = summary.get("avatarhash", "")
+            # آخرین خروج واقعی کاربر (به‌جای زمان رندر) تا کارت برای محتوای یکسان ثابت بماند
+            if summary.get("personastate", 0) > 0:
+                last_seen = "Online"
+            elif summary.get("lastlogoff"):
+                last_seen = datetime.utcfromtimestamp(summary["lastlogoff"]).strftime("%Y-%m-%d %H:%M UTC")
+            else:
+                last_seen = "-"
+
+            # PIL فقط برای کارت پروفایل لازم است؛ در اولین استفاده بارگذاری می‌شود
+            from imagegen import generate_profile_card_async, card_fingerprint
+
+            # اگر کارت تغییری نکرده، همان فایل قبلی تلگرام بدون آپلود دوباره ارسال می‌شود
+            fingerprint = card_fingerprint(display_name, avatar_hash, game_count, last_seen)
+            file_id = self.db.get_card_file_id(steam_id, fingerprint)
+            if file_id:
+                try:
+                    await query.message.reply_photo(photo=file_id)
+                    return
+                except BadRequest as e:
+                    logging.warning(f"file_id کارت {steam_id} نامعتبر است: {e}")
+
+            card = await generate_profile_card_async(
+                self.http,
+                display_name=display_name,
+                avatar_url=summary.get("avatarfull", ""),
+                avatar_hash=avatar_hash,
+                total_games=game_count,
+                last_seen=last_seen
             )
-            with open(filename, "rb") as photo:
-                await query.message.reply_photo(photo=photo)
+            message = await query.message.reply_photo(photo=card)
+            self.db.save_card_file_id(steam_id, fingerprint, message.photo[-1].file_id)
 
     # ---------------------------------------
     # /// دستور /status @username
@@ -274,7 +392,7 @@ class SteamBot:
             return
 
         try:
-            summary = self.steam_api.get_player_summary(steam_id)
+            summary = await self.steam_api.get_player_summary(steam_id)
             state = summary.get("personastate", 0)
             status_map = {
                 0: "🔴 آفلاین", 1: "🟢 آنلاین", 2: "🟠 مشغول",
@@ -299,22 +417,171 @@ class SteamBot:
             return
 
         group_id = str(update.effective_chat.id)
-        users = self.db.get_users_in_group(group_id)
-        online = []
-        for username, steam_id in users:
-            try:
-                summary = self.steam_api.get_player_summary(steam_id)
+
+        # نتیجه‌ی اخیر همین گروه (جلوگیری از اسپم /online)
+        result = self.cache.get("online", group_id)
+        if result is None:
+            users = self.db.get_users_in_group(group_id)
+            # یک درخواست دسته‌ای و همزمان برای کل گروه، با سقف زمانی
+            summaries = await self.steam_api.get_player_summaries(
+                (steam_id for _, steam_id in users if steam_id),
+                timeout=ONLINE_LOOKUP_TIMEOUT
+            )
+            online = []
+            unchecked = 0
+            for username, steam_id in users:
+                summary = summaries.get(steam_id)
+                if summary is None:
+                    unchecked += 1
+                    continue
                 if summary.get("personastate", 0) > 0:
                     game = summary.get("gameextrainfo", "بدون بازی")
                     online.append(f"👤 @{username} – 🎮 {game}")
-            except:
-                continue
+            result = {"online": online, "unchecked": unchecked}
+            if not unchecked:
+                self.cache.set("online", group_id, result)
 
-        if not online:
-            await update.message.reply_text("هیچ‌کس آنلاین نیست 😢")
+        if not result["online"]:
+            msg = "هیچ‌کس آنلاین نیست 😢"
         else:
-            msg = "🎮 اعضای آنلاین گروه:\n\n" + "\n".join(online)
+            msg = "🎮 اعضای آنلاین گروه:\n\n" + "\n".join(result["online"])
+        if result["unchecked"]:
+            msg += f"\n\n⚠️ وضعیت {result['unchecked']} نفر به‌موقع دریافت نشد."
+        await update.message.reply_text(msg)
+
+    # ---------------------------------------
+    # /// دستور /activity (گروه): چه کسی در دو هفته‌ی اخیر چه بازی‌ای کرده
+    # از داده‌ی ذخیره‌شده (refresh_activity در پس‌زمینه)، بدون درخواست زنده به Steam
+    async def activity(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_chat.type not in ["group", "supergroup"]:
+            await update.message.reply_text("این دستور فقط در گروه‌ها قابل استفاده است.")
+            return
+
+        group_id = str(update.effective_chat.id)
+        rows = self.db.get_group_activity(group_id, limit=30)
+        if not rows:
+            await update.message.reply_text("در دو هفته‌ی اخیر فعالیتی از اعضای گروه ثبت نشده 💤")
+            return
+
+        msg = "🕹️ فعالیت دو هفته‌ی اخیر اعضای گروه:\n\n" + "\n".join(
+            f"👤 @{username} – 🎮 {name} ({minutes // 60} ساعت و {minutes % 60} دقیقه)"
+            for username, name, minutes in rows
+        )
+        checked_at = self.db.get_group_activity_checked_at(group_id)
+        if checked_at:
+            minutes_ago = int((time.time() - checked_at) // 60)
+            msg += f"\n\n⏱️ به‌روزرسانی: حداکثر {minutes_ago} دقیقه پیش"
+        await update.message.reply_text(msg)
+
+    # ---------------------------------------
+    # /// دستور /rank [recent|games|top|GameName] (گروه)
+    # فقط از جدول‌های از پیش محاسبه‌شده (user_stats / group_stats / group_games)
+    async def rank(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_chat.type not in ["group", "supergroup"]:
+            await update.message.reply_text("این دستور فقط در گروه‌ها قابل استفاده است.")
+            return
+
+        group_id = str(update.effective_chat.id)
+        mode = " ".join(context.args).strip()
+        medals = ["🥇", "🥈", "🥉"]
+
+        def place(i):
+            return medals[i] if i < len(medals) else f"{i + 1}."
+
+        if mode.lower() == "top":
+            rows = self.db.get_group_top_games(group_id, limit=10)
+            if not rows:
+                await update.message.reply_text("هنوز آماری برای این گروه ثبت نشده!")
+                return
+            msg = "🏆 پرطرفدارترین بازی‌های گروه:\n\n" + "\n".join(
+                f"{place(i)} {name} – {minutes // 60} ساعت ({players} نفر)"
+                for i, (name, players, minutes) in enumerate(rows)
+            )
             await update.message.reply_text(msg)
+            return
+
+        if mode and mode.lower() not in self.db.RANKING_COLUMNS:
+            match = self.catalog.resolve(mode)
+            if not match:
+                await update.message.reply_text(f"🔍 بازی «{mode}» پیدا نشد.")
+                return
+            appid, game_name = match
+            rows = self.db.get_game_top_players(group_id, appid, limit=10)
+            if not rows:
+                await update.message.reply_text(f"کسی در این گروه {game_name} بازی نکرده!")
+                return
+            msg = f"🏆 بهترین‌های {game_name} در گروه:\n\n" + "\n".join(
+                f"{place(i)} @{username} – {minutes // 60} ساعت"
+                for i, (username, minutes) in enumerate(rows)
+            )
+            await update.message.reply_text(msg)
+            return
+
+        by = mode.lower() or "total"
+        rows = self.db.get_group_ranking(group_id, by=by, limit=10)
+        if not rows:
+            await update.message.reply_text("هنوز آماری برای این گروه ثبت نشده!")
+            return
+        titles = {"total": "ساعت بازی کل", "recent": "ساعت بازی دو هفته‌ی اخیر", "games": "تعداد بازی‌ها"}
+
+        def value(v):
+            return f"{v} بازی" if by == "games" else f"{v // 60} ساعت"
+
+        msg = f"🏆 رتبه‌بندی گروه ({titles[by]}):\n\n" + "\n".join(
+            f"{place(i)} @{username} – {value(v)}" for i, (_, username, v) in enumerate(rows)
+        )
+        group_stats = self.db.get_group_stats(group_id)
+        if group_stats:
+            members, _, total_minutes, recent_minutes = group_stats
+            msg += f"\n\n👥 {members} عضو | ⏱️ مجموع: {total_minutes // 60} ساعت | 📅 دو هفته: {recent_minutes // 60} ساعت"
+
+        # جایگاه خود کاربر اگر در ۱۰ نفر اول نیست
+        user_id = str(update.effective_user.id)
+        if all(telegram_id != user_id for telegram_id, _, _ in rows):
+            steam_id = self.db.get_steam_id_by_telegram_id(user_id)
+            position = self.db.get_group_rank_of(group_id, steam_id, by=by) if steam_id else None
+            if position:
+                msg += f"\n📍 جایگاه شما: {position}"
+        await update.message.reply_text(msg)
+
+    # ---------------------------------------
+    # /// دستور /compare @user1 @user2
+    async def compare(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if len(context.args) != 2:
+            await update.message.reply_text("🚫 مثال: /compare @user1 @user2")
+            return
+
+        usernames = [arg.lstrip("@") for arg in context.args]
+        steam_ids = self.db.get_steam_ids_by_usernames(usernames)
+        missing = [username for username in usernames if username not in steam_ids]
+        if missing:
+            await update.message.reply_text(
+                "❌ این کاربرها هنوز /linksteam نزدن: " + "، ".join(f"@{u}" for u in missing)
+            )
+            return
+
+        a, b = (steam_ids[username] for username in usernames)
+        stats_a = self.db.get_user_stats(a) or (0, 0, 0)
+        stats_b = self.db.get_user_stats(b) or (0, 0, 0)
+        shared_count, shared = self.db.get_shared_games(a, b, limit=5)
+
+        def side(label, x, y, fmt):
+            crown_x = " 👑" if x > y else ""
+            crown_y = " 👑" if y > x else ""
+            return f"{label}: {fmt(x)}{crown_x} | {fmt(y)}{crown_y}"
+
+        msg = (
+            f"⚔️ @{usernames[0]} در برابر @{usernames[1]}\n\n"
+            + side("🎮 تعداد بازی", stats_a[0], stats_b[0], str) + "\n"
+            + side("⏱️ ساعت بازی", stats_a[1], stats_b[1], lambda m: f"{m // 60}") + "\n"
+            + side("📅 دو هفته‌ی اخیر", stats_a[2], stats_b[2], lambda m: f"{m // 60}") + "\n\n"
+            + f"🤝 بازی‌های مشترک: {shared_count}"
+        )
+        if shared:
+            msg += "\n" + "\n".join(
+                f"• {name}: {minutes_a // 60} | {minutes_b // 60} ساعت" for name, minutes_a, minutes_b in shared
+            )
+        await update.message.reply_text(msg)
 
     # ---------------------------------------
     # /// دستور /setdeals [topic_id]
@@ -339,35 +606,81 @@ class SteamBot:
         )
 
     # ---------------------------------------
-    # /// تسک دوره‌ای ارسال تخفیف‌ها (فعلاً mock)
-    async def post_mock_deals(self):
-        games = fetch_discounted_games(limit=10)
-        text = "🔥 بازی‌های دارای بیشترین تخفیف:\n\n"
-        for i, g in enumerate(games, 1):
-            text += f"{i}. {g['title']} {g['discount']} ➡️ {g['final_price']} (قبل: {g['original_price']})\n{g['link']}\n\n" 
-        await asyncio.sleep(10)  # صبر اولیه قبل از استارت پریود
-        while True:
-            targets = self.db.get_post_targets_by_purpose("deals")
-            for group_id, topic_id in targets:
-                try:
-                    text = "🔥 تخفیف‌های امروز Steam:\n\n"
-                    for i in range(1, 11):
-                        # اینجا می‌آید درصد تخفیف واقعی را از API دریافت کنی
-                        text += f"{i}. Game {{i}} - {{random.randint(40,90)}}% Off\n"
-                    text += "\n🎮 ادامه دارد..."
-
-                    await self.bot.send_message(
-                        chat_id=group_id,
-                        message_thread_id=int(topic_id),
-                        text=text
-                    )
-                except Exception as e:
-                    logging.error(f"خطا در ارسال تخفیف‌ها: {e}")
-
-            await asyncio.sleep(86400)  # هر ۲۴ ساعت
+    # /// دریافت و ذخیره‌ی snapshot روزانه‌ی تخفیف‌ها؛ steam_deals فقط روزی یک‌بار لازم است
+    @property
+    def deals(self):
+        if self._deals is None:
+            from steam_deals import DealsIngestor
+            self._deals = DealsIngestor(self.http, self.db)
+        return self._deals
 
     # ---------------------------------------
-    # /// دستور /notify @username GameName [here]
+    # /// به‌روزرسانی کاتالوگ اپ‌ها؛ درخواست‌های /notify که قبلاً پیدا نشده بودند (مثلاً قبل از اولین
+    # دریافت کاتالوگ) یک‌بار دوباره تطبیق داده می‌شوند. pollerهای worker.py آن‌ها را در reload بعدی
+    # می‌گیرند و تا آن موقع با نام بازی تطبیق می‌دهند
+    async def refresh_catalog(self):
+        await self.catalog.refresh()
+        resolved = []
+        last_id = int(self.db.get_meta("notify_resolved_id") or 0)
+        for request_id, game_name in self.db.get_unresolved_notify_requests(last_id):
+            match = self.catalog.resolve(game_name)
+            if match:
+                resolved.append((match[0], match[1], request_id))
+            last_id = request_id
+        self.db.set_meta("notify_resolved_id", str(last_id))
+        if resolved:
+            self.db.set_notify_appids(resolved)
+            self.notifier.resolve_watches(resolved)
+            logging.info(f"app catalog: {len(resolved)} notify requests resolved")
+
+    # ---------------------------------------
+    # /// تسک دوره‌ای دریافت و ارسال تخفیف‌ها
+    async def post_daily_deals(self):
+        await run_every(DEALS_INTERVAL, self.post_deals)  # هر ۲۴ ساعت
+
+    # یک snapshot مشترک برای همه‌ی گروه‌ها؛ متن فقط یک‌بار ساخته می‌شود
+    async def post_deals(self):
+        diff = None
+        try:
+            snapshot_id, diff = await self.deals.ingest()
+        except Exception as e:
+            logging.error(f"خطا در دریافت تخفیف‌ها: {e}")
+            latest = self.db.get_latest_deal_snapshot()
+            # اگر دریافت شکست خورد، فقط snapshot تازه (کمتر از ۳۶ ساعت) ارسال می‌شود
+            if not latest or datetime.utcnow() - datetime.fromisoformat(str(latest[1])) > timedelta(hours=36):
+                return
+            snapshot_id = latest[0]
+
+        targets = self.db.get_post_targets_by_purpose("deals")
+        if not targets:
+            return
+        text = self._format_deals(snapshot_id, diff)
+
+        # ارسال از طریق صف پیام‌ها (محدودیت flood تلگرام و تلاش مجدد را dispatcher مدیریت می‌کند)
+        for group_id, topic_id in targets:
+            self.dispatcher.enqueue(
+                group_id, text, thread_id=int(topic_id), kind="deals",
+                ref=str(snapshot_id), disable_preview=True
+            )
+
+    def _format_deals(self, snapshot_id, diff=None, limit=10):
+        deals = self.db.get_snapshot_deals(snapshot_id, limit=limit)
+        new = {d["appid"] for d in diff["new"]} if diff else set()
+        deeper = {d["appid"] for d in diff["deeper"]} if diff else set()
+        text = "🔥 تخفیف‌های امروز Steam:\n\n"
+        for i, g in enumerate(deals.values(), 1):
+            mark = " 🆕" if g["appid"] in new else (" ⬇️" if g["appid"] in deeper else "")
+            text += (
+                f"{i}. {g['title']}{mark} -{g['discount_pct']}% ➡️ {g['final_price']} "
+                f"(قبل: {g['original_price']})\n{g['link']}\n\n"
+            )
+        # ended فقط وقتی هر دو snapshot کامل باشند محاسبه می‌شود (None یعنی نامعلوم)
+        if diff and diff["ended"]:
+            text += f"⌛ {len(diff['ended'])} تخفیف از دیروز تمام شده."
+        return text
+
+    # ---------------------------------------
+    # /// دستور /notify @username GameName [here] [every=2h] [quiet=23-8] [session]
     async def notify(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         args = context.args
         if len(args) < 2:
@@ -375,38 +688,62 @@ class SteamBot:
                 "🚫 ترکیب نادرست!\n"
                 "مثال‌ها:\n"
                 "/notify @username Rust\n"
-                "/notify @username Rust here"
+                "/notify @username Rust here\n"
+                "/notify @username Counter-Strike 2 here\n"
+                "/notify @username Dota 2 every=3h quiet=23-8 session"
             )
             return
 
         watcher_id = str(update.effective_user.id)
         target_username = args[0].lstrip("@")
-        game_name = args[1]
         scope = "private"
         group_id = None
 
-        # اگر آرگومان سوم "here" باشد → ارسال در همین گروه
-        if len(args) == 3 and args[2].lower() == "here":
+        # گزینه‌های انتهای دستور: here (ارسال در همین گروه)، every= (تکرارشونده)، quiet=، session
+        try:
+            game_args, options = parse_watch_options(args[1:])
+        except ValueError as e:
+            await update.message.reply_text(f"🚫 {e}")
+            return
+        if options["here"]:
             if update.effective_chat.type not in ["group", "supergroup"]:
                 await update.message.reply_text("برای نوتیف در گروه باید این دستور را در گروه بنویسی.")
                 return
             scope = "group"
             group_id = str(update.effective_chat.id)
-
-        req_id = self.db.add_notify_request(watcher_id, target_username, game_name, scope, group_id)
-        await update.message.reply_text(f"✅ درخواست نوتیف با ID {req_id} ثبت شد.")
+        game_name = " ".join(game_args)
+
+        # تبدیل نام بازی به appid از روی کاتالوگ محلی (تطبیق دقیق هنگام poll)
+        match = self.catalog.resolve(game_name)
+        appid = None
+        if match:
+            appid, game_name = match
+
+        cooldown, quiet, session_only = options["cooldown"], options["quiet"], options["session_only"]
+        req_id = self.db.add_notify_request(
+            watcher_id, target_username, game_name, scope, group_id, appid=appid,
+            cooldown=cooldown, quiet=quiet, session_only=session_only
+        )
+        self.notifier.add_watch(
+            req_id, watcher_id, target_username, game_name, scope, group_id, appid,
+            cooldown=cooldown, quiet=quiet, session_only=session_only
+        )
+        details = describe_watch_options(cooldown, *(quiet or (None, None)), session_only)
+        if appid:
+            await update.message.reply_text(
+                f"✅ درخواست نوتیف با ID {req_id} برای بازی «{game_name}» ثبت شد. ({details})"
+            )
+        else:
+            await update.message.reply_text(
+                f"✅ درخواست نوتیف با ID {req_id} ثبت شد. ({details})\n"
+                f"⚠️ «{game_name}» در کاتالوگ استیم پیدا نشد؛ تطبیق فقط با نام کامل بازی انجام می‌شود."
+            )
 
     # ---------------------------------------
     # /// دستور /mynotifs
     async def my_notifs(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         watcher_id = str(update.effective_user.id)
-        cursor = self.db.conn.cursor()
-        cursor.execute("""
-            SELECT id, target_username, game_name, scope, group_id
-            FROM notify_requests
-            WHERE watcher_telegram_id = ?
-        """, (watcher_id,))
-        rows = cursor.fetchall()
+        rows = self.db.get_notify_requests_for_watcher(watcher_id)
 
         if not rows:
             await update.message.reply_text("🚫 شما هیچ درخواست نوتیفی ندارید.")
@@ -414,8 +751,11 @@ class SteamBot:
 
         text = "🔔 درخواست‌های نوتیف شما:\n"
         for row in rows:
-            _id, target, game, scope, grp = row
-            text += f"{_id}. @{target} بازی {game} – {'در گروه ' + grp if scope == 'group' else 'پیام خصوصی'}\n"
+            _id, target, game, scope, grp = row[:5]
+            text += (
+                f"{_id}. @{target} بازی {game} – {'در گروه ' + grp if scope == 'group' else 'پیام خصوصی'}"
+                f" ({describe_watch_options(*row[5:])})\n"
+            )
 
         await update.message.reply_text(text)
 
@@ -428,67 +768,253 @@ class SteamBot:
         try:
             req_id = int(context.args[0])
             self.db.remove_notify_request(req_id)
+            self.notifier.remove_watch(req_id)
             await update.message.reply_text("✅ درخواست نوتیف حذف شد.")
         except Exception:
             await update.message.reply_text("❌ امکان حذف وجود ندارد. ID را بررسی کن.")
 
+    # ---------------------------------------
+    # /// دستور /cachestats (فقط ادمین‌ها)
+    async def cache_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user.id not in self.ADMINS:
+            return
+        stats = self.cache.stats()
+        if not stats:
+            await update.message.reply_text("کش هنوز استفاده نشده.")
+            return
+        text = "🗃️ آمار کش:\n"
+        for endpoint, counts in stats.items():
+            total = counts["hits"] + counts["misses"]
+            ratio = counts["hits"] * 100 // total if total else 0
+            text += f"{endpoint}: {counts['hits']} hit / {counts['misses']} miss ({ratio}%)\n"
+        await update.message.reply_text(text)
+
+    # ---------------------------------------
+    # /// دستور /apiusage (فقط ادمین‌ها): مصرف امروز Steam API به تفکیک endpoint
+    async def api_usage(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user.id not in self.ADMINS:
+            return
+        usage = self.quota.usage_today()
+        used = self.quota.used_today()
+        text = f"📈 مصرف امروز Steam API: {used} از {self.scheduler.daily_budget}\n\n"
+        for endpoint, (requests, throttled) in usage.items():
+            text += f"{endpoint}: {requests}" + (f" (429: {throttled})" if throttled else "") + "\n"
+        history = self.db.get_api_usage_totals(days=7)
+        if history:
+            text += "\n🗓️ ۷ روز اخیر:\n"
+            for day, requests, throttled in history:
+                text += f"{day}: {requests}" + (f" (429: {throttled})" if throttled else "") + "\n"
+        await update.message.reply_text(text)
+
+    # ---------------------------------------
+    # /// دستور /outbox (فقط ادمین‌ها): وضعیت صف پیام‌های خروجی
+    async def outbox_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user.id not in self.ADMINS:
+            return
+        rows = self.db.get_outbox_stats()
+        if not rows:
+            await update.message.reply_text("صف پیام‌ها خالی است.")
+            return
+        text = "📬 صف پیام‌ها:\n" + "\n".join(f"{kind} / {status}: {count}" for kind, status, count in rows)
+        await update.message.reply_text(text)
+
+    # ---------------------------------------
+    # /// زمان‌سنجی راه‌اندازی: imports → database → setup → initialize (getMe) → first_update
+    def mark_startup(self, phase):
+        now = time.perf_counter()
+        self.startup[phase] = now - self._startup_mark
+        self._startup_mark = now
+
+    def log_startup(self):
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.startup.items())
+        logging.info(f"startup: {phases} (total {time.perf_counter() - STARTUP_T0:.2f}s)")
+
+    # اولین update بعد از استارت (group -2، قبل از همه‌ی handlerها)
+    async def first_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if self._first_update_seen:
+            return
+        self._first_update_seen = True
+        self.mark_startup("first_update")
+        self.log_startup()
+
+    # ---------------------------------------
+    # /// متریک‌هایی که از شمارنده‌های موجود خوانده می‌شوند (هنگام درخواست /metrics)
+    def _register_metrics(self):
+        metrics.collected(
+            "cache_hits_total", "Response cache hits per endpoint",
+            lambda: {(endpoint,): counts["hits"] for endpoint, counts in self.cache.stats().items()},
+            kind="counter", labels=("endpoint",)
+        )
+        metrics.collected(
+            "cache_misses_total", "Response cache misses per endpoint",
+            lambda: {(endpoint,): counts["misses"] for endpoint, counts in self.cache.stats().items()},
+            kind="counter", labels=("endpoint",)
+        )
+        metrics.collected(
+            "outbox_messages", "Outbox messages by kind and status",
+            lambda: {(kind or "", status): count for kind, status, count in self.db.get_outbox_stats()},
+            labels=("kind", "status")
+        )
+        metrics.collected(
+            "startup_seconds", "Duration of each startup phase",
+            lambda: {(phase,): seconds for phase, seconds in self.startup.items()},
+            labels=("phase",)
+        )
+        metrics.collected(
+            "notify_poll_targets", "Steam ids scheduled for /notify polling",
+            lambda: {(): len(self.scheduler.watch_counts)}
+        )
+        metrics.collected(
+            "notify_watches", "Pending /notify requests held in the in-memory watch index",
+            lambda: {(): len(self.notifier.watches or ())}
+        )
+
+    # ---------------------------------------
+    # /// زمان اجرای هر دستور (handler_seconds) + ثبت در command_logs
+    # (ردیف‌ها در حافظه جمع و با flush دوره‌ای دیتابیس یک‌جا نوشته می‌شوند)
+    def instrumented(self, command, handler):
+        async def run(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            start = time.perf_counter()
+            status = "ok"
+            try:
+                await handler(update, context)
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - start, command, status)
+                if update.effective_user:
+                    self.db.log_command(str(update.effective_user.id), command)
+        return run
+
+    # ---------------------------------------
+    # /// Taskهای پس‌زمینه (از post_init روی همان event loop برنامه)
+    def start_background_tasks(self):
+        jobs = [
+            self.post_daily_deals(),
+            self.db.commit_loop(),
+            self.membership.flush_loop(),
+            run_every(PRUNE_INTERVAL, self.membership.prune, initial_delay=60),
+            run_every(PRUNE_INTERVAL, self.notifier.prune_watch_changes, initial_delay=120),
+            run_every(CATALOG_REFRESH_INTERVAL, self.refresh_catalog, initial_delay=1),
+            run_every(LIBRARY_SYNC_TICK, self.library.sync_due, initial_delay=30),
+            run_every(ACTIVITY_REFRESH_TICK, self.library.refresh_activity, initial_delay=20),
+        ]
+        # در حالت worker، poll نوتیف‌ها و ارسال صف outbox در worker.py انجام می‌شود
+        if not NOTIFY_WORKERS:
+            self.notifier.load_watches()
+            jobs += [self.check_notify_requests(), self.dispatcher.run()]
+        if METRICS_PORT:
+            jobs.append(metrics.serve(METRICS_PORT, METRICS_HOST))
+        self._tasks = [asyncio.create_task(job) for job in jobs]
+
+    # ---------------------------------------
+    # /// بستن اتصال‌های باز هنگام خاموش شدن
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.steam_api.close()
+        self.membership.flush()
+        self.quota.flush()
+        self.db.close()
+
+    # ---------------------------------------
+    # /// ثبت عضویت از پیام‌های گروه (ورود، خروج و هر پیام عادی)؛ نوشتن در دیتابیس دسته‌ای است
+    async def track_membership(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        message = update.effective_message
+        group_id = str(update.effective_chat.id)
+        if message.left_chat_member:
+            if not message.left_chat_member.is_bot:
+                self.membership.left(str(message.left_chat_member.id), group_id)
+            return
+        for member in message.new_chat_members or ():
+            if not member.is_bot:
+                self.membership.observe(str(member.id), group_id, member.username)
+        user = update.effective_user
+        if user and not user.is_bot:
+            self.membership.observe(str(user.id), group_id, user.username)
+
+    # ---------------------------------------
+    # /// ذخیره‌ی updateهای ورودی (RECORD_UPDATES) برای بازپخش در loadtest.py
+    async def record_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with open(self.record_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(update.to_dict(), ensure_ascii=False) + "\n")
+
     # ---------------------------------------
     # /// تسک دوره‌ای چک کردن درخواست‌های نوتیف
     async def check_notify_requests(self):
-        await asyncio.sleep(10)  # صبر اولیه
-        while True:
-            rows = self.db.get_all_notify_requests()
-            for row in rows:
-                _id, watcher_id, target_username, game_name, scope, grp = row
-                # ابتدا steam_id هدف را از جدول users دریافت کن
-                steam_id = self.db.get_user_by_username(target_username)
-                if not steam_id:
-                    continue
-                try:
-                    summary = self.steam_api.get_player_summary(steam_id)
-                    current_game = summary.get("gameextrainfo", "")
-                    # اگر اسم بازی موردنظر در جزییات بازی فعلی پیدا شد
-                    if current_game and game_name.lower() in current_game.lower():
-                        if scope == "private":
-                            await self.bot.send_message(
-                                chat_id=int(watcher_id),
-                                text=f"🔔 @{target_username} هم‌اکنون در حال بازی {game_name} است!"
-                            )
-                        else:
-                            await self.bot.send_message(
-                                chat_id=int(grp),
-                                text=f"🔔 @{target_username} هم‌اکنون در حال بازی {game_name} است!"
-                            )
-                        # حذف درخواست (فقط یک‌بار ارسال می‌شود)
-                        self.db.remove_notify_request(_id)
-                except Exception:
-                    continue
+        # هر هدف با فاصله‌ی خودش (۳۰ ثانیه تا ۳۰ دقیقه) poll می‌شود؛ scheduler تعیین می‌کند
+        await run_every(NOTIFY_TICK, self.notifier.sweep)
 
-            await asyncio.sleep(300)  # هر ۵ دقیقه
 
-if __name__ == "__main__":
-    load_dotenv()
-    nest_asyncio.apply()
+# ساخت Application و ثبت handlerها؛ loadtest.py هم از همین استفاده می‌کند
+def build_application(builder=None, http=None):
+    async def on_startup(application):
+        bot.mark_startup("initialize")
+        bot.log_startup()
+        bot.start_background_tasks()
 
-    app = ApplicationBuilder().token(os.getenv("TELEGRAM_TOKEN")).build()
-    bot = SteamBot(app)
+    async def on_shutdown(application):
+        await bot.close()
+
+    builder = builder or ApplicationBuilder().token(os.getenv("TELEGRAM_TOKEN"))
+    app = (
+        builder.concurrent_updates(UPDATE_CONCURRENCY)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    bot = SteamBot(app, http=http)
 
     # ثبت handler ها
-    app.add_handler(CommandHandler("start", bot.start))
-    app.add_handler(CommandHandler("help", bot.help_command))
-    app.add_handler(CommandHandler("linksteam", bot.linksteam))
-    app.add_handler(CommandHandler("steam", bot.steam))
-    app.add_handler(CommandHandler("status", bot.status))
-    app.add_handler(CommandHandler("online", bot.online_users))
-    app.add_handler(CommandHandler("setdeals", bot.set_deals_topic))
-    app.add_handler(CommandHandler("notify", bot.notify))
-    app.add_handler(CommandHandler("mynotifs", bot.my_notifs))
-    app.add_handler(CommandHandler("removenotif", bot.remove_notif))
-    app.add_handler(CallbackQueryHandler(bot.button_handler))
-
-    # Taskهای پس‌زمینه
-    asyncio.get_event_loop().create_task(bot.post_mock_deals())
-    asyncio.get_event_loop().create_task(bot.check_notify_requests())
-
-    print("🤖 SteamSyncBot داره گوش می‌دهد...")
-    asyncio.get_event_loop().run_until_complete(app.run_polling())
+    app.add_handler(TypeHandler(Update, bot.first_update), group=-2)
+    if bot.record_path:
+        app.add_handler(TypeHandler(Update, bot.record_update), group=-1)
+    commands = {
+        "start": bot.start,
+        "help": bot.help_command,
+        "linksteam": bot.linksteam,
+        "steam": bot.steam,
+        "status": bot.status,
+        "online": bot.online_users,
+        "activity": bot.activity,
+        "rank": bot.rank,
+        "compare": bot.compare,
+        "setdeals": bot.set_deals_topic,
+        "notify": bot.notify,
+        "mynotifs": bot.my_notifs,
+        "removenotif": bot.remove_notif,
+        "cachestats": bot.cache_stats,
+        "apiusage": bot.api_usage,
+        "outbox": bot.outbox_stats,
+    }
+    for command, handler in commands.items():
+        app.add_handler(CommandHandler(command, bot.instrumented(command, handler)))
+    app.add_handler(CallbackQueryHandler(bot.instrumented("button", bot.button_handler)))
+    # گروه جدا تا بعد از CommandHandlerها هم اجرا شود
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS, bot.track_membership), group=1)
+    return app, bot
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    app, bot = build_application()
+
+    # با WEBHOOK_URL، تلگرام updateها را push می‌کند (بدون تأخیر long polling)
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url:
+        url_path = os.getenv("WEBHOOK_PATH", "telegram")
+        print(f"🤖 SteamSyncBot روی webhook {webhook_url} داره گوش می‌دهد...")
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=int(os.getenv("PORT", "8443")),
+            url_path=url_path,
+            webhook_url=f"{webhook_url.rstrip('/')}/{url_path}",
+            secret_token=os.getenv("WEBHOOK_SECRET"),
+            drop_pending_updates=False
+        )
+    else:
+        print("🤖 SteamSyncBot داره گوش می‌دهد...")
+        app.run_polling()
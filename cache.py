@@ -0,0 +1,100 @@
+import json
+import sqlite3
+import time
+from collections import OrderedDict, defaultdict
+
+# مدت اعتبار (ثانیه) برای هر endpoint: وضعیت آنلاین کوتاه، کتابخانه و vanity طولانی
+DEFAULT_TTLS = {
+    "summary": 60,
+    "online": 30,
+    "recent": 15 * 60,
+    "owned_games": 6 * 3600,
+    "vanity": 7 * 86400,
+}
+
+# endpointهایی که در لایه‌ی SQLite هم ذخیره می‌شوند (بعد از ری‌دیپلوی گرم می‌مانند)
+DEFAULT_PERSISTED = {"recent", "owned_games", "vanity"}
+
+
+class ResponseCache:
+    def __init__(self, max_entries=5000, ttls=None, db_path=None, persisted=None):
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.persisted = DEFAULT_PERSISTED if persisted is None else set(persisted)
+        self._entries = OrderedDict()  # (endpoint, key) → (expires_at, value)
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.conn = None
+        if db_path:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS api_cache (
+                    endpoint TEXT,
+                    key TEXT,
+                    value TEXT,
+                    expires_at REAL,
+                    PRIMARY KEY (endpoint, key)
+                )
+            """)
+            self.conn.execute("DELETE FROM api_cache WHERE expires_at < ?", (time.time(),))
+            self.conn.commit()
+
+    def get(self, endpoint, key):
+        now = time.time()
+        entry = self._entries.get((endpoint, key))
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end((endpoint, key))
+                self.hits[endpoint] += 1
+                return value
+            del self._entries[(endpoint, key)]
+
+        if self.conn is not None and endpoint in self.persisted:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM api_cache WHERE endpoint = ? AND key = ? AND expires_at > ?",
+                (endpoint, key, now)
+            ).fetchone()
+            if row:
+                value = json.loads(row[0])
+                self._store(endpoint, key, value, row[1])
+                self.hits[endpoint] += 1
+                return value
+
+        self.misses[endpoint] += 1
+        return None
+
+    def set(self, endpoint, key, value):
+        expires_at = time.time() + self.ttls.get(endpoint, 60)
+        self._store(endpoint, key, value, expires_at)
+        if self.conn is not None and endpoint in self.persisted:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO api_cache (endpoint, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (endpoint, key, json.dumps(value), expires_at)
+            )
+            self.conn.commit()
+
+    def invalidate(self, endpoint, key):
+        self._entries.pop((endpoint, key), None)
+        if self.conn is not None:
+            self.conn.execute("DELETE FROM api_cache WHERE endpoint = ? AND key = ?", (endpoint, key))
+            self.conn.commit()
+
+    def _store(self, endpoint, key, value, expires_at):
+        self._entries[(endpoint, key)] = (expires_at, value)
+        self._entries.move_to_end((endpoint, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # شمارنده‌های hit/miss برای هر endpoint
+    def stats(self):
+        endpoints = sorted(set(self.hits) | set(self.misses))
+        return {
+            endpoint: {"hits": self.hits[endpoint], "misses": self.misses[endpoint]}
+            for endpoint in endpoints
+        }
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
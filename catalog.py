@@ -0,0 +1,173 @@
+import bisect
+import heapq
+import logging
+import math
+import re
+import time
+from array import array
+from collections import defaultdict
+
+_NON_ALNUM = re.compile(r"[\W_]+")
+_TRADEMARKS = re.compile(r"[™®©]")
+
+MIN_TRIGRAM_SCORE = 0.45
+# سقف اپ‌هایی که در جستجوی trigram امتیازشان کامل حساب می‌شود
+MAX_TRIGRAM_CANDIDATES = 2000
+APP_LIST_PAGE = 50000
+
+
+def normalize_name(name):
+    name = _TRADEMARKS.sub("", (name or "").lower())
+    return " ".join(_NON_ALNUM.sub(" ", name).split())
+
+
+def trigrams(norm):
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AppCatalog:
+    # کاتالوگ محلی اپ‌های Steam (جدول apps) با ایندکس‌های درون‌حافظه:
+    # نام دقیق، پیشوند (لیست مرتب + bisect) و trigram برای جستجوی تقریبی
+    def __init__(self, db, steam_api):
+        self.db = db
+        self.steam_api = steam_api
+        self.names = {}                     # appid → نام اصلی
+        self._norms = {}                    # appid → نام نرمال‌شده
+        self._exact = defaultdict(list)     # نام نرمال‌شده → [appid]
+        self._sorted = []                   # [(نام نرمال‌شده, appid)] برای جستجوی پیشوندی
+        self._trigrams = defaultdict(lambda: array("I"))     # trigram → appidهای مرتب
+        self._gram_counts = {}              # appid → تعداد trigramهای نام (برای امتیاز Jaccard)
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.names)
+
+    def load(self):
+        rows = self.db.get_apps()
+        for appid, name in rows:
+            self._index(appid, name, sort=False)
+        self._sorted.sort()
+        for gram, postings in self._trigrams.items():
+            self._trigrams[gram] = array("I", sorted(postings))
+        self.loaded = True
+        logging.info(f"app catalog: {len(self.names)} apps loaded")
+
+    def _index(self, appid, name, sort=True):
+        norm = normalize_name(name)
+        if not norm:
+            return
+        if appid in self.names:
+            if self._norms[appid] == norm:
+                self.names[appid] = name
+                return
+            self._unindex(appid)
+        self.names[appid] = name
+        self._norms[appid] = norm
+        self._exact[norm].append(appid)
+        grams = trigrams(norm)
+        self._gram_counts[appid] = len(grams)
+        if sort:
+            bisect.insort(self._sorted, (norm, appid))
+            for gram in grams:
+                bisect.insort(self._trigrams[gram], appid)
+        else:
+            self._sorted.append((norm, appid))
+            for gram in grams:
+                self._trigrams[gram].append(appid)
+
+    def _unindex(self, appid):
+        norm = self._norms.pop(appid)
+        del self.names[appid]
+        del self._gram_counts[appid]
+        self._exact[norm].remove(appid)
+        i = bisect.bisect_left(self._sorted, (norm, appid))
+        if i < len(self._sorted) and self._sorted[i] == (norm, appid):
+            del self._sorted[i]
+        for gram in trigrams(norm):
+            postings = self._trigrams[gram]
+            if appid in postings:
+                postings.remove(appid)
+
+    # به‌روزرسانی افزایشی از IStoreService/GetAppList (فقط اپ‌های تغییرکرده از آخرین بار)
+    async def refresh(self):
+        if not self.loaded:
+            self.load()
+        since = int(self.db.get_meta("catalog_refreshed_at") or 0)
+        started = int(time.time())
+        last_appid = 0
+        changed = []
+        while True:
+            page = await self.steam_api.get_app_list(
+                if_modified_since=since, last_appid=last_appid, max_results=APP_LIST_PAGE
+            )
+            apps = page.get("apps", [])
+            changed.extend((app["appid"], app.get("name", "")) for app in apps)
+            if not page.get("have_more_results") or not apps:
+                break
+            last_appid = page.get("last_appid", apps[-1]["appid"])
+
+        if changed:
+            self.db.save_apps(changed)
+            for appid, name in changed:
+                self._index(appid, name)
+        self.db.set_meta("catalog_refreshed_at", str(started))
+        logging.info(f"app catalog: {len(changed)} apps updated, {len(self.names)} total")
+
+    # بهترین تطبیق برای نام وارد‌شده توسط کاربر → (appid, name) یا None
+    # قبل از اولین refresh همان نسخه‌ی ذخیره‌شده در جدول apps بارگذاری می‌شود
+    def resolve(self, query):
+        if not self.loaded:
+            self.load()
+        results = self.search(query, limit=1)
+        return results[0] if results else None
+
+    def search(self, query, limit=5):
+        norm = normalize_name(query)
+        if not norm:
+            return []
+
+        exact = self._exact.get(norm)
+        if exact:
+            return [(appid, self.names[appid]) for appid in sorted(exact)[:limit]]
+
+        # پیشوند: کوتاه‌ترین نام‌ها اول (نزدیک‌ترین به عبارت کاربر)
+        i = bisect.bisect_left(self._sorted, (norm, 0))
+        prefixed = []
+        while i < len(self._sorted) and self._sorted[i][0].startswith(norm) and len(prefixed) < 200:
+            prefixed.append(self._sorted[i])
+            i += 1
+        if prefixed:
+            prefixed.sort(key=lambda item: (len(item[0]), item[1]))
+            return [(appid, self.names[appid]) for _, appid in prefixed[:limit]]
+
+        # trigram: شباهت Jaccard بین مجموعه‌ی trigramها
+        # اپی با امتیاز ≥ MIN_TRIGRAM_SCORE حداقل need تا از trigramهای عبارت را دارد، پس حتماً یکی از
+        # len(grams) - need + 1 کم‌تکرارترین آن‌ها را هم دارد: فقط postingهای همین‌ها پیمایش می‌شوند
+        # و بقیه‌ی trigramها فقط برای نامزدها (با bisect روی posting مرتب) شمرده می‌شوند
+        grams = sorted(trigrams(norm), key=lambda gram: len(self._trigrams.get(gram, ())))
+        need = math.ceil(MIN_TRIGRAM_SCORE * len(grams))
+        rare, common = grams[:len(grams) - need + 1], grams[len(grams) - need + 1:]
+        counts = defaultdict(int)
+        for gram in rare:
+            for appid in self._trigrams.get(gram, ()):
+                counts[appid] += 1
+        if len(counts) > MAX_TRIGRAM_CANDIDATES:
+            counts = dict(heapq.nlargest(
+                MAX_TRIGRAM_CANDIDATES, counts.items(), key=lambda item: (item[1], -item[0])
+            ))
+        for gram in common:
+            postings = self._trigrams.get(gram)
+            if not postings:
+                continue
+            for appid in counts:
+                i = bisect.bisect_left(postings, appid)
+                if i < len(postings) and postings[i] == appid:
+                    counts[appid] += 1
+        scored = []
+        for appid, shared in counts.items():
+            score = shared / (len(grams) + self._gram_counts[appid] - shared)
+            if score >= MIN_TRIGRAM_SCORE:
+                scored.append((score, appid))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(appid, self.names[appid]) for _, appid in scored[:limit]]
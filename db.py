@@ -1,59 +1,123 @@
+import os
+import sys
 import sqlite3
 import json
+import time
+import asyncio
 from datetime import datetime
 
+import metrics
+import migrations
+
+DB_QUERY_SECONDS = metrics.histogram(
+    "db_query_seconds", "SQLite statement time by Database method", ("method",)
+)
+DB_COMMIT_SECONDS = metrics.histogram("db_commit_seconds", "SQLite commit time")
+
+
+# نام متد Database که execute را صدا زده؛ comprehension و generator داخل متد (<listcomp>، <genexpr>)
+# قاب جدای خودشان را دارند و رد می‌شوند تا برچسب همان نام متد باشد
+def _caller_name(depth=2):
+    frame = sys._getframe(depth)
+    while frame.f_code.co_name.startswith("<") and frame.f_back is not None:
+        frame = frame.f_back
+    return frame.f_code.co_name
+
+
+class _TimedCursor(sqlite3.Cursor):
+    # زمان هر execute با نام متد Database که آن را صدا زده
+    # (برای SELECT فقط اجرای statement و اولین ردیف؛ fetch بقیه‌ی ردیف‌ها حساب نمی‌شود)
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, _caller_name())
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, _caller_name())
+
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+
 class Database:
-    def __init__(self, db_name="steamsync_users.db"):
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)
-        self._create_tables()
+    # نوشتن‌ها جمع می‌شوند و با هم commit می‌شوند: هر COMMIT_BATCH_SIZE نوشتن
+    # یا حداکثر هر COMMIT_INTERVAL ثانیه (flush دوره‌ای از commit_loop)
+    # با shared=True (چند پروسه روی یک فایل: bot.py + worker.py) هر نوشتن بلافاصله commit می‌شود؛
+    # وگرنه قفل نوشتن تا commit بعدی دست این پروسه می‌ماند و بقیه در busy_timeout (همزمان، روی event loop) منتظر می‌مانند
+    COMMIT_BATCH_SIZE = 100
+    COMMIT_INTERVAL = 1.0
+    # معیارهای مجاز رتبه‌بندی گروه → ستون user_stats
+    RANKING_COLUMNS = {"total": "total_minutes", "recent": "recent_minutes", "games": "game_count"}
+    # ستون‌های هر درخواست /notify به ترتیب آرگومان‌های WatchIndex.add
+    NOTIFY_COLUMNS = ("id, watcher_telegram_id, target_username, game_name, scope, group_id, appid,"
+                      " cooldown, quiet_start, quiet_end, session_only, last_fired_at")
 
-    def _create_tables(self):
-        cursor = self.conn.cursor()
-        cursor.executescript("""
-            CREATE TABLE IF NOT EXISTS users (
-                telegram_id TEXT PRIMARY KEY,
-                username TEXT,
-                steam_id TEXT UNIQUE,
-                display_name TEXT,
-                last_seen TIMESTAMP,
-                last_fetched_data TEXT
-            );
-
-            CREATE TABLE IF NOT EXISTS user_groups (
-                telegram_id TEXT,
-                group_id TEXT,
-                username TEXT,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (telegram_id, group_id)
-            );
-
-            CREATE TABLE IF NOT EXISTS auto_post_targets (
-                group_id TEXT,
-                topic_id TEXT,
-                purpose TEXT,
-                PRIMARY KEY (group_id, purpose)
-            );
-
-            CREATE TABLE IF NOT EXISTS command_logs (
-                telegram_id TEXT,
-                command TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS notify_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                watcher_telegram_id TEXT,
-                target_username TEXT,
-                game_name TEXT,
-                scope TEXT CHECK(scope IN ('private', 'group')),
-                group_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        self.conn.commit()
+    def __init__(self, db_name="steamsync_users.db", shared=None):
+        if shared is None:
+            shared = int(os.getenv("NOTIFY_WORKERS", "0")) > 0
+        self.commit_batch_size = 1 if shared else self.COMMIT_BATCH_SIZE
+        # cached_statements: استفاده‌ی مجدد از statementهای آماده برای کوئری‌های پرتکرار
+        self.conn = sqlite3.connect(
+            db_name, check_same_thread=False, cached_statements=256, factory=_TimedConnection
+        )
+        self._configure()
+        self._pending_writes = 0
+        # ردیف‌های command_logs تا flush بعدی در حافظه جمع می‌شوند
+        self._command_log = []
+        self._last_commit = time.monotonic()
+        # ساخت/به‌روزرسانی schema (migrations.py)؛ اگر به‌روز باشد فقط PRAGMA user_version خوانده می‌شود
+        migrations.migrate(self)
+
+    def _configure(self):
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-16000")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+
+    # ---- صف نوشتن ----
+
+    def _write_done(self):
+        self._pending_writes += 1
+        if (self._pending_writes >= self.commit_batch_size
+                or time.monotonic() - self._last_commit >= self.COMMIT_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        if self._command_log:
+            rows, self._command_log = self._command_log, []
+            self.conn.cursor().executemany(
+                "INSERT INTO command_logs (telegram_id, command, timestamp) VALUES (?, ?, ?)", rows
+            )
+            self._pending_writes += 1
+        if self._pending_writes:
+            with DB_COMMIT_SECONDS.time():
+                self.conn.commit()
+            self._pending_writes = 0
+        self._last_commit = time.monotonic()
+
+    async def commit_loop(self):
+        while True:
+            await asyncio.sleep(self.COMMIT_INTERVAL)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
 
     def save_user_data(self, telegram_id, username, steam_id, display_name, last_data):
         cursor = self.conn.cursor()
+        cursor.execute("SELECT steam_id FROM users WHERE telegram_id = ?", (telegram_id,))
+        row = cursor.fetchone()
+        old_steam_id = row[0] if row else None
         cursor.execute("""
             INSERT INTO users (
                 telegram_id, username, steam_id, display_name, last_seen, last_fetched_data
@@ -65,7 +129,418 @@ class Database:
                 last_fetched_data=excluded.last_fetched_data
         """, (telegram_id, username, steam_id, display_name, datetime.utcnow(), json.dumps(last_data)))
 
-        self.conn.commit()
+        # steam_id عوض شد → آمار گروه‌های این کاربر از حساب قبلی به حساب جدید منتقل می‌شود
+        # (عضویت‌های کاربری که تازه Steam وصل کرده هم از قبل ثبت شده‌اند؛ MembershipTracker)
+        if old_steam_id != steam_id:
+            cursor.execute("SELECT group_id FROM user_groups WHERE telegram_id = ?", (telegram_id,))
+            group_ids = [r[0] for r in cursor.fetchall()]
+            if old_steam_id:
+                self._apply_membership(old_steam_id, group_ids, -1)
+            if steam_id:
+                self._apply_membership(steam_id, group_ids, 1)
+        self._write_done()
+
+    # ---- کتابخانه‌ی بازی‌ها ----
+
+    def save_owned_games(self, steam_id, games, commit=True):
+        if not games:
+            # پاسخ خالی (پروفایل خصوصی) یعنی «داده‌ای نیست»؛ کتابخانه‌ی ذخیره‌شده پاک نمی‌شود
+            return
+        now = datetime.utcnow()
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO games (appid, name, icon) VALUES (?, ?, ?)
+            ON CONFLICT(appid) DO UPDATE SET
+                name=COALESCE(excluded.name, games.name),
+                icon=COALESCE(excluded.icon, games.icon)
+        """, [(g["appid"], g.get("name"), g.get("img_icon_url")) for g in games])
+        cursor.executemany("""
+            INSERT INTO user_games (steam_id, appid, playtime_forever, playtime_2weeks, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(steam_id, appid) DO UPDATE SET
+                playtime_forever=excluded.playtime_forever,
+                playtime_2weeks=excluded.playtime_2weeks,
+                updated_at=excluded.updated_at
+        """, [
+            (steam_id, g["appid"], g.get("playtime_forever", 0), g.get("playtime_2weeks", 0), now)
+            for g in games
+        ])
+        # بازی‌هایی که دیگر در کتابخانه نیستند
+        cursor.execute("DELETE FROM user_games WHERE steam_id = ? AND updated_at < ?", (steam_id, now))
+        if commit:
+            self._write_done()
+
+    def has_library(self, steam_id):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT 1 FROM user_games WHERE steam_id = ? LIMIT 1", (steam_id,))
+        return cursor.fetchone() is not None
+
+    def get_top_games(self, steam_id, limit=5):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT COALESCE(g.name, 'نامشخص'), ug.playtime_forever
+            FROM user_games ug
+            LEFT JOIN games g ON g.appid = ug.appid
+            WHERE ug.steam_id = ? AND ug.playtime_forever > 0
+            ORDER BY ug.playtime_forever DESC
+            LIMIT ?
+        """, (steam_id, limit))
+        return cursor.fetchall()
+
+    # (تعداد بازی‌ها، مجموع دقیقه‌های بازی)
+    def get_library_stats(self, steam_id):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*), COALESCE(SUM(playtime_forever), 0)
+            FROM user_games WHERE steam_id = ?
+        """, (steam_id,))
+        return cursor.fetchone()
+
+    # ---- همگام‌سازی افزایشی کتابخانه ----
+
+    # (version, synced_at, checked_at) یا None اگر هنوز همگام نشده
+    def get_library_state(self, steam_id):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT version, synced_at, checked_at FROM library_sync WHERE steam_id = ?", (steam_id,))
+        return cursor.fetchone()
+
+    # {appid: (playtime_forever, playtime_2weeks)}؛ با appids فقط همان بازی‌ها
+    # به‌علاوه‌ی بازی‌هایی که هنوز playtime_2weeks دارند (برای صفر کردن آن‌هایی که از لیست اخیر خارج شده‌اند)
+    def get_playtimes(self, steam_id, appids=None):
+        cursor = self.conn.cursor()
+        if appids is None:
+            cursor.execute(
+                "SELECT appid, playtime_forever, playtime_2weeks FROM user_games WHERE steam_id = ?", (steam_id,)
+            )
+        else:
+            appids = list(appids)
+            cursor.execute(f"""
+                SELECT appid, playtime_forever, playtime_2weeks FROM user_games
+                WHERE steam_id = ? AND (playtime_2weeks > 0 OR appid IN ({",".join("?" * len(appids))}))
+            """, (steam_id, *appids))
+        return {appid: (forever, two_weeks) for appid, forever, two_weeks in cursor.fetchall()}
+
+    # فقط ردیف‌های تغییرکرده نوشته می‌شوند؛ upserts: [(appid, playtime_forever, playtime_2weeks)]
+    # full=True یعنی کل کتابخانه بررسی شده (synced_at هم به‌روز می‌شود)
+    def apply_library_delta(self, steam_id, upserts, removed=(), full=False):
+        now = datetime.utcnow()
+        cursor = self.conn.cursor()
+        changed = int(bool(upserts or removed))
+        if changed:
+            self._apply_stats_delta(steam_id, self.get_playtimes(steam_id), upserts, removed)
+        cursor.executemany("""
+            INSERT INTO user_games (steam_id, appid, playtime_forever, playtime_2weeks, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(steam_id, appid) DO UPDATE SET
+                playtime_forever=excluded.playtime_forever,
+                playtime_2weeks=excluded.playtime_2weeks,
+                updated_at=excluded.updated_at
+        """, [(steam_id, appid, forever, two_weeks, now) for appid, forever, two_weeks in upserts])
+        cursor.executemany(
+            "DELETE FROM user_games WHERE steam_id = ? AND appid = ?", [(steam_id, appid) for appid in removed]
+        )
+        checked_at = time.time()
+        cursor.execute("""
+            INSERT INTO library_sync (steam_id, version, synced_at, checked_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(steam_id) DO UPDATE SET
+                version=library_sync.version + ?,
+                synced_at=COALESCE(excluded.synced_at, library_sync.synced_at),
+                checked_at=excluded.checked_at
+        """, (steam_id, changed, checked_at if full else None, checked_at, changed))
+        self._write_done()
+        return changed
+
+    # ---- جدول‌های رتبه‌بندی (user_stats / group_stats / group_games) ----
+    # با هر تغییر کتابخانه یا عضویت فقط تفاضل‌ها اعمال می‌شوند؛ /rank و /compare فقط از این جدول‌ها می‌خوانند
+
+    # ساخت کامل از روی user_games و user_groups (در مهاجرت‌ها، برای دیتابیس‌های قدیمی)
+    def rebuild_leaderboards(self):
+        cursor = self.conn.cursor()
+        cursor.executescript("""
+            DELETE FROM user_stats;
+            DELETE FROM group_stats;
+            DELETE FROM group_games;
+
+            INSERT INTO user_stats (steam_id, game_count, total_minutes, recent_minutes)
+            SELECT steam_id, COUNT(*), SUM(playtime_forever), SUM(playtime_2weeks)
+            FROM user_games GROUP BY steam_id;
+
+            INSERT INTO group_stats (group_id, members, game_count, total_minutes, recent_minutes)
+            SELECT g.group_id, COUNT(*), COALESCE(SUM(s.game_count), 0),
+                   COALESCE(SUM(s.total_minutes), 0), COALESCE(SUM(s.recent_minutes), 0)
+            FROM user_groups g
+            JOIN users u ON u.telegram_id = g.telegram_id
+            LEFT JOIN user_stats s ON s.steam_id = u.steam_id
+            WHERE u.steam_id IS NOT NULL
+            GROUP BY g.group_id;
+
+            INSERT INTO group_games (group_id, appid, players, total_minutes)
+            SELECT g.group_id, ug.appid, COUNT(*), SUM(ug.playtime_forever)
+            FROM user_groups g
+            JOIN users u ON u.telegram_id = g.telegram_id
+            JOIN user_games ug ON ug.steam_id = u.steam_id
+            WHERE ug.playtime_forever > 0
+            GROUP BY g.group_id, ug.appid;
+        """)
+
+    def _groups_of(self, steam_id):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT g.group_id FROM user_groups g
+            JOIN users u ON u.telegram_id = g.telegram_id
+            WHERE u.steam_id = ?
+        """, (steam_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    # old: {appid: (playtime_forever, playtime_2weeks)} قبل از اعمال upserts/removed
+    def _apply_stats_delta(self, steam_id, old, upserts, removed):
+        count_delta = total_delta = recent_delta = 0
+        game_deltas = []  # (appid, players_delta, minutes_delta)
+        for appid, forever, two_weeks in upserts:
+            old_forever, old_two_weeks = old.get(appid, (0, 0))
+            count_delta += appid not in old
+            total_delta += forever - old_forever
+            recent_delta += two_weeks - old_two_weeks
+            game_deltas.append((appid, (forever > 0) - (old_forever > 0), forever - old_forever))
+        for appid in removed:
+            if appid not in old:
+                continue
+            old_forever, old_two_weeks = old[appid]
+            count_delta -= 1
+            total_delta -= old_forever
+            recent_delta -= old_two_weeks
+            game_deltas.append((appid, -(old_forever > 0), -old_forever))
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO user_stats (steam_id, game_count, total_minutes, recent_minutes) VALUES (?, ?, ?, ?)
+            ON CONFLICT(steam_id) DO UPDATE SET
+                game_count=game_count + excluded.game_count,
+                total_minutes=total_minutes + excluded.total_minutes,
+                recent_minutes=recent_minutes + excluded.recent_minutes
+        """, (steam_id, count_delta, total_delta, recent_delta))
+
+        game_deltas = [delta for delta in game_deltas if delta[1] or delta[2]]
+        for group_id in self._groups_of(steam_id):
+            cursor.execute("""
+                UPDATE group_stats SET
+                    game_count=game_count + ?, total_minutes=total_minutes + ?, recent_minutes=recent_minutes + ?
+                WHERE group_id = ?
+            """, (count_delta, total_delta, recent_delta, group_id))
+            self._apply_game_deltas(group_id, game_deltas)
+
+    def _apply_game_deltas(self, group_id, game_deltas):
+        if not game_deltas:
+            return
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO group_games (group_id, appid, players, total_minutes) VALUES (?, ?, ?, ?)
+            ON CONFLICT(group_id, appid) DO UPDATE SET
+                players=players + excluded.players,
+                total_minutes=total_minutes + excluded.total_minutes
+        """, [(group_id, appid, players, minutes) for appid, players, minutes in game_deltas])
+        cursor.execute("DELETE FROM group_games WHERE group_id = ? AND players <= 0", (group_id,))
+
+    # sign=1: اضافه شدن steam_id به گروه‌ها، sign=-1: خروج از گروه‌ها
+    def _apply_membership(self, steam_id, group_ids, sign):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT game_count, total_minutes, recent_minutes FROM user_stats WHERE steam_id = ?", (steam_id,)
+        )
+        game_count, total, recent = cursor.fetchone() or (0, 0, 0)
+        cursor.execute(
+            "SELECT appid, playtime_forever FROM user_games WHERE steam_id = ? AND playtime_forever > 0", (steam_id,)
+        )
+        game_deltas = [(appid, sign, sign * forever) for appid, forever in cursor.fetchall()]
+        for group_id in group_ids:
+            cursor.execute("""
+                INSERT INTO group_stats (group_id, members, game_count, total_minutes, recent_minutes)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(group_id) DO UPDATE SET
+                    members=members + excluded.members,
+                    game_count=game_count + excluded.game_count,
+                    total_minutes=total_minutes + excluded.total_minutes,
+                    recent_minutes=recent_minutes + excluded.recent_minutes
+            """, (group_id, sign, sign * game_count, sign * total, sign * recent))
+            self._apply_game_deltas(group_id, game_deltas)
+
+    # (game_count, total_minutes, recent_minutes) یا None
+    def get_user_stats(self, steam_id):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT game_count, total_minutes, recent_minutes FROM user_stats WHERE steam_id = ?", (steam_id,)
+        )
+        return cursor.fetchone()
+
+    # (members, game_count, total_minutes, recent_minutes) یا None
+    def get_group_stats(self, group_id):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT members, game_count, total_minutes, recent_minutes FROM group_stats WHERE group_id = ?",
+            (group_id,)
+        )
+        return cursor.fetchone()
+
+    # [(telegram_id, username, value)] مرتب‌شده بر اساس معیار (total / recent / games)
+    def get_group_ranking(self, group_id, by="total", limit=10):
+        column = self.RANKING_COLUMNS[by]
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            SELECT u.telegram_id, u.username, s.{column}
+            FROM user_groups g
+            JOIN users u ON u.telegram_id = g.telegram_id
+            JOIN user_stats s ON s.steam_id = u.steam_id
+            WHERE g.group_id = ? AND s.{column} > 0
+            ORDER BY s.{column} DESC
+            LIMIT ?
+        """, (group_id, limit))
+        return cursor.fetchall()
+
+    # جایگاه یک steam_id در گروه (۱ = اول) یا None
+    def get_group_rank_of(self, group_id, steam_id, by="total"):
+        column = self.RANKING_COLUMNS[by]
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            SELECT 1 + COUNT(*) FROM user_groups g
+            JOIN users u ON u.telegram_id = g.telegram_id
+            JOIN user_stats s ON s.steam_id = u.steam_id
+            WHERE g.group_id = ? AND s.{column} > (SELECT {column} FROM user_stats WHERE steam_id = ?)
+        """, (group_id, steam_id))
+        row = cursor.fetchone()
+        return row[0] if row and self.get_user_stats(steam_id) else None
+
+    # [(name, players, total_minutes)] پرطرفدارترین بازی‌های گروه
+    def get_group_top_games(self, group_id, limit=10):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT COALESCE(gm.name, 'نامشخص'), gg.players, gg.total_minutes
+            FROM group_games gg
+            LEFT JOIN games gm ON gm.appid = gg.appid
+            WHERE gg.group_id = ?
+            ORDER BY gg.total_minutes DESC
+            LIMIT ?
+        """, (group_id, limit))
+        return cursor.fetchall()
+
+    # [(username, playtime_forever)] بهترین بازیکن‌های یک بازی در گروه
+    def get_game_top_players(self, group_id, appid, limit=10):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT u.username, ug.playtime_forever
+            FROM user_groups g
+            JOIN users u ON u.telegram_id = g.telegram_id
+            JOIN user_games ug ON ug.steam_id = u.steam_id AND ug.appid = ?
+            WHERE g.group_id = ? AND ug.playtime_forever > 0
+            ORDER BY ug.playtime_forever DESC
+            LIMIT ?
+        """, (appid, group_id, limit))
+        return cursor.fetchall()
+
+    # (تعداد بازی مشترک، [(name, minutes_a, minutes_b)] پربازی‌ترین‌های مشترک)
+    def get_shared_games(self, steam_id_a, steam_id_b, limit=5):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT COALESCE(gm.name, 'نامشخص'), a.playtime_forever, b.playtime_forever
+            FROM user_games a
+            JOIN user_games b ON b.steam_id = ? AND b.appid = a.appid
+            LEFT JOIN games gm ON gm.appid = a.appid
+            WHERE a.steam_id = ?
+            ORDER BY a.playtime_forever + b.playtime_forever DESC
+        """, (steam_id_b, steam_id_a))
+        rows = cursor.fetchall()
+        return len(rows), rows[:limit]
+
+    def save_game_names(self, games):
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO games (appid, name, icon) VALUES (?, ?, ?)
+            ON CONFLICT(appid) DO UPDATE SET
+                name=COALESCE(excluded.name, games.name),
+                icon=COALESCE(excluded.icon, games.icon)
+        """, [(g["appid"], g.get("name"), g.get("img_icon_url")) for g in games])
+        self._write_done()
+
+    # نام بازی‌های جدید از کاتالوگ محلی (apps)؛ appidهایی که هنوز نام ندارند برگردانده می‌شوند
+    def fill_game_names(self, appids):
+        appids = list(appids)
+        if not appids:
+            return []
+        placeholders = ",".join("?" * len(appids))
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO games (appid, name)
+            SELECT appid, name FROM apps WHERE appid IN ({placeholders})
+            ON CONFLICT(appid) DO UPDATE SET name=COALESCE(games.name, excluded.name)
+        """, appids)
+        cursor.execute(f"""
+            SELECT appid FROM games WHERE appid IN ({placeholders}) AND name IS NOT NULL
+        """, appids)
+        named = {row[0] for row in cursor.fetchall()}
+        self._write_done()
+        return [appid for appid in appids if appid not in named]
+
+    # steam_idهای ثبت‌شده که کتابخانه‌شان از checked_before بررسی نشده (قدیمی‌ترین اول)
+    def get_stale_libraries(self, checked_before, limit=20):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT u.steam_id FROM users u
+            LEFT JOIN library_sync ls ON ls.steam_id = u.steam_id
+            WHERE u.steam_id IS NOT NULL AND COALESCE(ls.checked_at, 0) < ?
+            ORDER BY COALESCE(ls.checked_at, 0)
+            LIMIT ?
+        """, (checked_before, limit))
+        return [row[0] for row in cursor.fetchall()]
+
+    # steam_idهای اعضای گروه‌ها که کتابخانه‌شان از checked_before بررسی نشده
+    def get_grouped_steam_ids(self, checked_before, limit=200):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT u.steam_id FROM user_groups g
+            JOIN users u ON u.telegram_id = g.telegram_id
+            LEFT JOIN library_sync ls ON ls.steam_id = u.steam_id
+            WHERE u.steam_id IS NOT NULL AND COALESCE(ls.checked_at, 0) < ?
+            ORDER BY COALESCE(ls.checked_at, 0)
+            LIMIT ?
+        """, (checked_before, limit))
+        return [row[0] for row in cursor.fetchall()]
+
+    # چه کسی در دو هفته‌ی اخیر چه بازی‌ای کرده → [(username, game_name, playtime_2weeks)]
+    def get_group_activity(self, group_id, limit=30):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT u.username, COALESCE(gm.name, 'نامشخص'), ug.playtime_2weeks
+            FROM user_groups g
+            JOIN users u ON u.telegram_id = g.telegram_id
+            JOIN user_games ug ON ug.steam_id = u.steam_id
+            LEFT JOIN games gm ON gm.appid = ug.appid
+            WHERE g.group_id = ? AND ug.playtime_2weeks > 0
+            ORDER BY ug.playtime_2weeks DESC
+            LIMIT ?
+        """, (group_id, limit))
+        return cursor.fetchall()
+
+    # قدیمی‌ترین زمان بررسی بین اعضای گروه (برای نمایش تازگی /activity)
+    def get_group_activity_checked_at(self, group_id):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT MIN(ls.checked_at) FROM user_groups g
+            JOIN users u ON u.telegram_id = g.telegram_id
+            JOIN library_sync ls ON ls.steam_id = u.steam_id
+            WHERE g.group_id = ?
+        """, (group_id,))
+        return cursor.fetchone()[0]
+
+    def get_steam_id_by_telegram_id(self, telegram_id):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT steam_id FROM users WHERE telegram_id = ?", (telegram_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    # آیا این steam_id به یک کاربر تلگرام وصل است (فقط کتابخانه‌ی این حساب‌ها ذخیره می‌شود)
+    def is_linked_steam_id(self, steam_id):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT 1 FROM users WHERE steam_id = ? LIMIT 1", (steam_id,))
+        return cursor.fetchone() is not None
 
     def get_user_by_username(self, username):
         cursor = self.conn.cursor()
@@ -73,6 +548,21 @@ class Database:
         row = cursor.fetchone()
         return row[0] if row else None
 
+    # نگاشت username → steam_id برای چند کاربر با یک کوئری (در دسته‌های ۵۰۰تایی)
+    def get_steam_ids_by_usernames(self, usernames):
+        usernames = list(usernames)
+        result = {}
+        cursor = self.conn.cursor()
+        for i in range(0, len(usernames), 500):
+            chunk = usernames[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT username, steam_id FROM users WHERE username IN ({placeholders}) AND steam_id IS NOT NULL",
+                chunk
+            )
+            result.update(cursor.fetchall())
+        return result
+
     def get_users_in_group(self, group_id):
         cursor = self.conn.cursor()
         cursor.execute("""
@@ -85,12 +575,87 @@ class Database:
 
     def link_user_to_group(self, telegram_id, group_id, username):
         cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT u.steam_id FROM users u
+            WHERE u.telegram_id = ? AND NOT EXISTS (
+                SELECT 1 FROM user_groups g WHERE g.telegram_id = ? AND g.group_id = ?
+            )
+        """, (telegram_id, telegram_id, group_id))
+        new_member = cursor.fetchone()
         cursor.execute("""
             INSERT INTO user_groups (telegram_id, group_id, username)
             VALUES (?, ?, ?)
             ON CONFLICT(telegram_id, group_id) DO UPDATE SET last_active=CURRENT_TIMESTAMP
         """, (telegram_id, group_id, username))
-        self.conn.commit()
+        if new_member and new_member[0]:
+            self._apply_membership(new_member[0], [group_id], 1)
+        self._write_done()
+
+    # ---- عضویت دسته‌ای (MembershipTracker) ----
+
+    # rows: (telegram_id, group_id, username, last_active)؛ یک executemany برای کل دسته
+    # اعضای جدیدی که Steam وصل کرده‌اند به آمار گروه (group_stats / group_games) اضافه می‌شوند
+    def touch_group_members(self, rows):
+        new_pairs = self._missing_memberships([(row[0], row[1]) for row in rows])
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO user_groups (telegram_id, group_id, username, last_active) VALUES (?, ?, ?, ?)
+            ON CONFLICT(telegram_id, group_id) DO UPDATE SET
+                username=COALESCE(excluded.username, user_groups.username),
+                last_active=MAX(excluded.last_active, user_groups.last_active)
+        """, rows)
+        self._apply_memberships(new_pairs, 1)
+        self._write_done()
+
+    # pairs: (telegram_id, group_id)
+    def remove_group_members(self, pairs):
+        missing = set(self._missing_memberships(pairs))
+        self._apply_memberships([pair for pair in pairs if pair not in missing], -1)
+        cursor = self.conn.cursor()
+        cursor.executemany("DELETE FROM user_groups WHERE telegram_id = ? AND group_id = ?", pairs)
+        self._write_done()
+
+    # حذف اعضایی که از before (متن UTC مثل CURRENT_TIMESTAMP) به بعد در گروه فعالیتی نداشته‌اند
+    def prune_group_members(self, before):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT telegram_id, group_id FROM user_groups WHERE last_active < ?", (before,))
+        pairs = cursor.fetchall()
+        if pairs:
+            self.remove_group_members(pairs)
+        return len(pairs)
+
+    # زوج‌هایی که هنوز در user_groups نیستند (دسته‌های ۴۰۰تایی به خاطر سقف پارامترهای SQLite)
+    def _missing_memberships(self, pairs):
+        existing = set()
+        cursor = self.conn.cursor()
+        for i in range(0, len(pairs), 400):
+            chunk = pairs[i:i + 400]
+            cursor.execute(f"""
+                SELECT telegram_id, group_id FROM user_groups
+                WHERE (telegram_id, group_id) IN (VALUES {",".join(["(?, ?)"] * len(chunk))})
+            """, [value for pair in chunk for value in pair])
+            existing.update(cursor.fetchall())
+        return [pair for pair in dict.fromkeys(pairs) if pair not in existing]
+
+    def _apply_memberships(self, pairs, sign):
+        if not pairs:
+            return
+        telegram_ids = list({telegram_id for telegram_id, _ in pairs})
+        steam_ids = {}
+        cursor = self.conn.cursor()
+        for i in range(0, len(telegram_ids), 500):
+            chunk = telegram_ids[i:i + 500]
+            cursor.execute(
+                f"SELECT telegram_id, steam_id FROM users WHERE telegram_id IN ({','.join('?' * len(chunk))})"
+                " AND steam_id IS NOT NULL", chunk
+            )
+            steam_ids.update(cursor.fetchall())
+        groups_by_steam_id = {}
+        for telegram_id, group_id in pairs:
+            if telegram_id in steam_ids:
+                groups_by_steam_id.setdefault(steam_ids[telegram_id], []).append(group_id)
+        for steam_id, group_ids in groups_by_steam_id.items():
+            self._apply_membership(steam_id, group_ids, sign)
 
     def set_auto_post_target(self, group_id, topic_id, purpose):
         cursor = self.conn.cursor()
@@ -98,7 +663,7 @@ class Database:
             INSERT INTO auto_post_targets VALUES (?, ?, ?)
             ON CONFLICT(group_id, purpose) DO UPDATE SET topic_id=excluded.topic_id
         """, (group_id, topic_id, purpose))
-        self.conn.commit()
+        self._write_done()
 
     def get_post_targets_by_purpose(self, purpose):
         cursor = self.conn.cursor()
@@ -107,24 +672,105 @@ class Database:
 
     # ---- قابلیت‌های نوتیف ----
 
-    def add_notify_request(self, watcher_telegram_id, target_username, game_name, scope, group_id=None):
+    # cooldown=None: یک‌باره؛ quiet: (شروع, پایان) به دقیقه از نیمه‌شب
+    def add_notify_request(self, watcher_telegram_id, target_username, game_name, scope, group_id=None, appid=None,
+                           cooldown=None, quiet=None, session_only=False):
+        quiet_start, quiet_end = quiet or (None, None)
         cursor = self.conn.cursor()
         cursor.execute("""
-            INSERT INTO notify_requests (watcher_telegram_id, target_username, game_name, scope, group_id)
-            VALUES (?, ?, ?, ?, ?)
-        """, (watcher_telegram_id, target_username, game_name, scope, group_id))
-        self.conn.commit()
+            INSERT INTO notify_requests (watcher_telegram_id, target_username, game_name, scope, group_id, appid,
+                                         cooldown, quiet_start, quiet_end, session_only)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (watcher_telegram_id, target_username, game_name, scope, group_id, appid,
+              cooldown, quiet_start, quiet_end, int(session_only)))
+        self._write_done()
         return cursor.lastrowid
 
     def get_all_notify_requests(self):
         cursor = self.conn.cursor()
-        cursor.execute("SELECT id, watcher_telegram_id, target_username, game_name, scope, group_id FROM notify_requests")
+        cursor.execute(f"SELECT {self.NOTIFY_COLUMNS} FROM notify_requests")
+        return cursor.fetchall()
+
+    # درخواست‌هایی که بعد از after_id ثبت شده‌اند (همگام‌سازی ایندکس pollerهای worker.py)
+    def get_notify_requests_since(self, after_id):
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT {self.NOTIFY_COLUMNS} FROM notify_requests WHERE id > ? ORDER BY id", (after_id,))
         return cursor.fetchall()
 
+    # درخواست‌های چند یوزر هدف (هدفی که با وصل کردن Steam دیگری به shard این poller منتقل شده)
+    def get_notify_requests_for_targets(self, targets):
+        targets = list(targets)
+        rows = []
+        cursor = self.conn.cursor()
+        for i in range(0, len(targets), 500):
+            chunk = targets[i:i + 500]
+            cursor.execute(
+                f"SELECT {self.NOTIFY_COLUMNS} FROM notify_requests "
+                f"WHERE target_username IN ({','.join('?' * len(chunk))}) ORDER BY id",
+                chunk
+            )
+            rows += cursor.fetchall()
+        return rows
+
+    # آخرین seq گزارش تغییرات (قبل از خواندن کامل درخواست‌ها، نقطه‌ی شروع sync_watches)
+    def get_watch_change_seq(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM watch_changes")
+        return cursor.fetchone()[0]
+
+    # تغییرات بعد از after_seq → (آخرین seq، idهای درخواست‌های حذف‌شده، usernameهای تغییرکرده)
+    def get_watch_changes_since(self, after_seq):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT seq, request_id, username FROM watch_changes WHERE seq > ? ORDER BY seq", (after_seq,))
+        removed, usernames = set(), set()
+        for after_seq, request_id, username in cursor.fetchall():
+            if request_id is not None:
+                removed.add(request_id)
+            elif username:
+                usernames.add(username)
+        return after_seq, removed, usernames
+
+    def prune_watch_changes(self, before):
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM watch_changes WHERE changed_at < ?", (int(before),))
+        self._write_done()
+        return cursor.rowcount
+
+    # ارسال یک نوتیف تکرارشونده (به‌جای حذف)؛ False اگر ردیف دیگر وجود ندارد
+    def mark_notify_fired(self, request_id, fired_at):
+        cursor = self.conn.cursor()
+        cursor.execute("UPDATE notify_requests SET last_fired_at = ? WHERE id = ?", (fired_at, request_id))
+        self._write_done()
+        return cursor.rowcount > 0
+
+    def get_notify_requests_for_watcher(self, watcher_telegram_id):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id, target_username, game_name, scope, group_id, cooldown, quiet_start, quiet_end, session_only
+            FROM notify_requests
+            WHERE watcher_telegram_id = ?
+        """, (watcher_telegram_id,))
+        return cursor.fetchall()
+
+    # درخواست‌های بعد از after_id که هنگام ثبت در کاتالوگ پیدا نشدند (مثلاً قبل از اولین دریافت کاتالوگ)
+    # → [(id, game_name)]
+    def get_unresolved_notify_requests(self, after_id=0):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, game_name FROM notify_requests WHERE appid IS NULL AND id > ? ORDER BY id", (after_id,))
+        return cursor.fetchall()
+
+    # rows: [(appid, game_name, id)]
+    def set_notify_appids(self, rows):
+        cursor = self.conn.cursor()
+        cursor.executemany("UPDATE notify_requests SET appid = ?, game_name = ? WHERE id = ? AND appid IS NULL", rows)
+        self._write_done()
+
+    # True اگر ردیفی حذف شد
     def remove_notify_request(self, request_id):
         cursor = self.conn.cursor()
         cursor.execute("DELETE FROM notify_requests WHERE id = ?", (request_id,))
-        self.conn.commit()
+        self._write_done()
+        return cursor.rowcount > 0
 
     def get_requests_for_target(self, target_username):
         cursor = self.conn.cursor()
@@ -134,3 +780,233 @@ class Database:
             WHERE target_username = ?
         """, (target_username,))
         return cursor.fetchall()
+
+    # ---- وضعیت حضور (presence) ----
+
+    def load_presence_states(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT steam_id, personastate, gameid, game_name FROM presence_state")
+        return {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+
+    def save_presence_states(self, states):
+        now = datetime.utcnow()
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO presence_state (steam_id, personastate, gameid, game_name, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(steam_id) DO UPDATE SET
+                personastate=excluded.personastate,
+                gameid=excluded.gameid,
+                game_name=excluded.game_name,
+                updated_at=excluded.updated_at
+        """, [(steam_id, state, gameid, name, now) for steam_id, state, gameid, name in states])
+        self._write_done()
+
+    # ---- لاگ دستورات ----
+
+    # فقط در حافظه؛ در flush بعدی (حداکثر COMMIT_INTERVAL بعد) یک‌جا نوشته می‌شود
+    def log_command(self, telegram_id, command):
+        self._command_log.append((telegram_id, command, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")))
+
+    # ---- مصرف Steam API ----
+
+    # rows: (endpoint, requests, throttled)؛ دسته‌ی جمع‌شده در QuotaTracker با یک executemany
+    def increment_api_usage(self, day, rows):
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO api_usage (day, endpoint, requests, throttled) VALUES (?, ?, ?, ?)
+            ON CONFLICT(day, endpoint) DO UPDATE SET
+                requests=api_usage.requests + excluded.requests,
+                throttled=api_usage.throttled + excluded.throttled
+        """, [(day, endpoint, requests, throttled) for endpoint, requests, throttled in rows])
+        self._write_done()
+
+    def get_api_usage(self, day):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT endpoint, requests, throttled FROM api_usage WHERE day = ?", (day,))
+        return cursor.fetchall()
+
+    # مصرف کل یک روز از همه‌ی پروسه‌ها
+    def get_api_usage_total(self, day):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COALESCE(SUM(requests), 0) FROM api_usage WHERE day = ?", (day,))
+        return cursor.fetchone()[0]
+
+    def get_api_usage_totals(self, days=7):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT day, SUM(requests), SUM(throttled) FROM api_usage
+            GROUP BY day ORDER BY day DESC LIMIT ?
+        """, (days,))
+        return cursor.fetchall()
+
+    # ---- کش کارت پروفایل (file_id تلگرام) ----
+
+    def get_card_file_id(self, steam_id, fingerprint):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT file_id FROM card_cache WHERE steam_id = ? AND fingerprint = ?",
+            (steam_id, fingerprint)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def save_card_file_id(self, steam_id, fingerprint, file_id):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO card_cache (steam_id, fingerprint, file_id) VALUES (?, ?, ?)
+            ON CONFLICT(steam_id) DO UPDATE SET
+                fingerprint=excluded.fingerprint,
+                file_id=excluded.file_id
+        """, (steam_id, fingerprint, file_id))
+        self._write_done()
+
+    # ---- snapshotهای تخفیف ----
+
+    # complete: کل نتایج فروشگاه دریافت شده (برای محاسبه‌ی تخفیف‌های تمام‌شده لازم است)
+    def save_deal_snapshot(self, deals, keep=30, complete=False):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "INSERT INTO deal_snapshots (taken_at, deal_count, complete) VALUES (?, ?, ?)",
+            (datetime.utcnow(), len(deals), int(complete))
+        )
+        snapshot_id = cursor.lastrowid
+        cursor.executemany("""
+            INSERT OR REPLACE INTO deals (
+                snapshot_id, appid, title, link, discount_pct, original_price, final_price, final_cents
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (snapshot_id, d["appid"], d["title"], d["link"], d["discount_pct"],
+             d["original_price"], d["final_price"], d.get("final_cents"))
+            for d in deals
+        ])
+        # فقط keep تا snapshot آخر نگه داشته می‌شوند
+        cursor.execute("DELETE FROM deals WHERE snapshot_id <= ?", (snapshot_id - keep,))
+        cursor.execute("DELETE FROM deal_snapshots WHERE id <= ?", (snapshot_id - keep,))
+        self._write_done()
+        return snapshot_id
+
+    # (id, taken_at, complete) آخرین snapshot یا None
+    def get_latest_deal_snapshot(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, taken_at, complete FROM deal_snapshots ORDER BY id DESC LIMIT 1")
+        return cursor.fetchone()
+
+    def get_latest_deal_snapshot_id(self):
+        row = self.get_latest_deal_snapshot()
+        return row[0] if row else None
+
+    def get_snapshot_deals(self, snapshot_id, limit=-1):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT appid, title, link, discount_pct, original_price, final_price, final_cents
+            FROM deals WHERE snapshot_id = ?
+            ORDER BY discount_pct DESC, appid
+            LIMIT ?
+        """, (snapshot_id, limit))
+        columns = ("appid", "title", "link", "discount_pct", "original_price", "final_price", "final_cents")
+        return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+
+    # ---- صف پیام‌های خروجی (outbox) ----
+
+    def enqueue_message(self, chat_id, text, thread_id=None, kind=None, ref=None, disable_preview=False):
+        now = time.time()
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO outbox (chat_id, thread_id, text, disable_preview, kind, ref, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (chat_id, thread_id, text, int(disable_preview), kind, ref, now, now))
+        self._write_done()
+        return cursor.lastrowid
+
+    # پیام‌های سررسیدشده؛ از هر چت حداکثر per_chat پیام تا یک چت پرحجم بقیه را عقب نیندازد
+    # پیامی که پیام قدیمی‌تری از همان چت هنوز منتظر تلاش مجدد دارد برنمی‌گردد (ترتیب هر چت حفظ می‌شود)
+    def get_due_messages(self, now, limit=100, per_chat=3):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id, chat_id, thread_id, text, disable_preview, attempts FROM (
+                SELECT *,
+                       ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY id) AS rn,
+                       MAX(next_attempt_at) OVER (
+                           PARTITION BY chat_id ORDER BY id ROWS UNBOUNDED PRECEDING
+                       ) AS blocked_until
+                FROM outbox
+                WHERE status = 'pending'
+            )
+            WHERE rn <= ? AND blocked_until <= ?
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+        """, (per_chat, now, limit))
+        return cursor.fetchall()
+
+    def get_next_message_due(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'")
+        return cursor.fetchone()[0]
+
+    def mark_message_sent(self, message_id):
+        self.conn.execute(
+            "UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1 WHERE id = ?",
+            (time.time(), message_id)
+        )
+        self._write_done()
+
+    def mark_message_retry(self, message_id, next_attempt_at, error, count_attempt=True):
+        self.conn.execute("""
+            UPDATE outbox SET next_attempt_at = ?, last_error = ?, attempts = attempts + ?
+            WHERE id = ?
+        """, (next_attempt_at, error, int(count_attempt), message_id))
+        self._write_done()
+
+    # همه‌ی پیام‌های در انتظار یک چت تا زمان until عقب می‌افتند (بعد از RetryAfter)
+    def defer_chat_messages(self, chat_id, until):
+        self.conn.execute("""
+            UPDATE outbox SET next_attempt_at = MAX(next_attempt_at, ?)
+            WHERE chat_id = ? AND status = 'pending'
+        """, (until, chat_id))
+        self._write_done()
+
+    def mark_message_failed(self, message_id, error):
+        self.conn.execute(
+            "UPDATE outbox SET status = 'failed', last_error = ?, attempts = attempts + 1 WHERE id = ?",
+            (error, message_id)
+        )
+        self._write_done()
+
+    def prune_outbox(self, before):
+        self.conn.execute("DELETE FROM outbox WHERE status != 'pending' AND created_at < ?", (before,))
+        self._write_done()
+
+    # تعداد پیام‌ها به تفکیک نوع و وضعیت
+    def get_outbox_stats(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COALESCE(kind, '-'), status, COUNT(*) FROM outbox GROUP BY kind, status")
+        return cursor.fetchall()
+
+    # ---- کاتالوگ اپ‌ها و تنظیمات کلی ----
+
+    def get_apps(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT appid, name FROM apps")
+        return cursor.fetchall()
+
+    def save_apps(self, apps):
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO apps (appid, name) VALUES (?, ?)
+            ON CONFLICT(appid) DO UPDATE SET name=excluded.name
+        """, apps)
+        self._write_done()
+
+    def get_meta(self, key):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.conn.execute("""
+            INSERT INTO meta (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value=excluded.value
+        """, (key, value))
+        self._write_done()
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+import metrics
+from ratelimit import TokenBucket, backoff_delay
+
+# محدودیت‌های ارسال تلگرام
+GLOBAL_RATE = 25           # پیام در ثانیه برای کل بات (سقف تلگرام ~۳۰)
+PRIVATE_CHAT_INTERVAL = 1  # ثانیه بین دو پیام در یک چت خصوصی
+GROUP_CHAT_INTERVAL = 3    # ثانیه بین دو پیام در یک گروه (~۲۰ پیام در دقیقه)
+
+BATCH_SIZE = 100
+PER_CHAT_BATCH = 3
+MAX_CONCURRENCY = 10
+MAX_ATTEMPTS = 5
+IDLE_POLL = 5
+MAX_INLINE_WAIT = 5        # اگر چت بیش از این منتظر باشد، پیام به دور بعد موکول می‌شود
+KEEP_SENT_DAYS = 7
+
+TELEGRAM_SEND_SECONDS = metrics.histogram(
+    "telegram_send_seconds", "Bot API sendMessage latency from the outbox", ("result",)
+)
+
+
+class MessageDispatcher:
+    # صف پایدار پیام‌های خروجی (جدول outbox) با رعایت محدودیت سراسری و هر چت تلگرام
+    # همه‌ی تسک‌های پس‌زمینه به‌جای send_message مستقیم، از enqueue استفاده می‌کنند
+    # idle_poll: حداکثر انتظار بین دو بار خواندن صف وقتی پیامی نیست؛ در worker جدا
+    # پیام‌ها از پروسه‌ی دیگری اضافه می‌شوند و _wakeup خبردار نمی‌شود، پس کوتاه‌تر است
+    def __init__(self, bot, db, idle_poll=IDLE_POLL):
+        self.bot = bot
+        self.db = db
+        self.idle_poll = idle_poll
+        self.limiter = TokenBucket(rate=GLOBAL_RATE, capacity=GLOBAL_RATE)
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        self._chat_ready = {}  # chat_id → زمان (monotonic) مجاز برای پیام بعدی
+        self._wakeup = asyncio.Event()
+        self._last_prune = 0.0
+
+    def enqueue(self, chat_id, text, thread_id=None, kind=None, ref=None, disable_preview=False):
+        message_id = self.db.enqueue_message(
+            str(chat_id), text, thread_id=thread_id, kind=kind, ref=ref, disable_preview=disable_preview
+        )
+        self._wakeup.set()
+        return message_id
+
+    async def run(self):
+        while True:
+            try:
+                rows = self.db.get_due_messages(time.time(), limit=BATCH_SIZE, per_chat=PER_CHAT_BATCH)
+            except Exception as e:
+                logging.error(f"خطا در خواندن صف پیام‌ها: {e}")
+                rows = []
+            if not rows:
+                self._prune()
+                self._wakeup.clear()
+                next_due = self.db.get_next_message_due()
+                timeout = self.idle_poll if next_due is None else min(self.idle_poll, max(0.05, next_due - time.time()))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            by_chat = defaultdict(list)
+            for row in rows:
+                by_chat[row[1]].append(row)
+            await asyncio.gather(*(self._send_chat(messages) for messages in by_chat.values()))
+
+    # پیام‌های یک چت به ترتیب و با فاصله‌ی مجاز آن چت
+    async def _send_chat(self, messages):
+        for row in sorted(messages):
+            if not await self._send_one(row):
+                break
+
+    # False یعنی ارسال بقیه‌ی پیام‌های این چت به بعد موکول شد (ترتیب پیام‌ها حفظ می‌شود)
+    async def _send_one(self, row):
+        message_id, chat_id, thread_id, text, disable_preview, attempts = row
+        wait = self._chat_ready.get(chat_id, 0) - time.monotonic()
+        if wait > MAX_INLINE_WAIT:
+            self.db.defer_chat_messages(chat_id, time.time() + wait)
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        async with self._semaphore:
+            await self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                try:
+                    await self.bot.send_message(
+                        chat_id=int(chat_id),
+                        message_thread_id=int(thread_id) if thread_id else None,
+                        text=text,
+                        disable_web_page_preview=bool(disable_preview)
+                    )
+                except Exception as e:
+                    TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - start, type(e).__name__)
+                    raise
+                TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - start, "ok")
+                self.db.mark_message_sent(message_id)
+            except RetryAfter as e:
+                # محدودیت flood: تا زمان اعلام‌شده صبر و سپس دوباره تلاش می‌شود (بدون شمارش تلاش)
+                self._chat_ready[chat_id] = time.monotonic() + e.retry_after
+                self.db.defer_chat_messages(chat_id, time.time() + e.retry_after)
+                return False
+            except (Forbidden, BadRequest) as e:
+                # چت در دسترس نیست (بات حذف شده، چت پیدا نشد و ...)
+                logging.warning(f"ارسال به {chat_id} ناموفق: {e}")
+                self.db.mark_message_failed(message_id, str(e))
+            except Exception as e:
+                # خطای شبکه / timeout: تلاش مجدد با backoff
+                if attempts + 1 >= MAX_ATTEMPTS:
+                    logging.error(f"ارسال پیام {message_id} به {chat_id} پس از {MAX_ATTEMPTS} تلاش ناموفق: {e}")
+                    self.db.mark_message_failed(message_id, str(e))
+                else:
+                    # بقیه‌ی پیام‌های این چت هم تا زمان تلاش مجدد عقب می‌افتند تا از این پیام جلو نزنند
+                    retry_at = time.time() + backoff_delay(attempts, base=2.0)
+                    self.db.mark_message_retry(message_id, retry_at, str(e))
+                    self.db.defer_chat_messages(chat_id, retry_at)
+                    return False
+            interval = GROUP_CHAT_INTERVAL if chat_id.startswith("-") else PRIVATE_CHAT_INTERVAL
+            self._chat_ready[chat_id] = time.monotonic() + interval
+            return True
+
+    def _prune(self):
+        if time.time() - self._last_prune < 3600:
+            return
+        self._last_prune = time.time()
+        self.db.prune_outbox(time.time() - KEEP_SENT_DAYS * 86400)
+        now = time.monotonic()
+        self._chat_ready = {chat_id: t for chat_id, t in self._chat_ready.items() if t > now}
@@ -1,2 +1,6 @@
 #!/bin/bash
-python3 bot.py
+# NOTIFY_WORKERS > 0: poll نوتیف‌ها (sharded) و ارسال outbox در پروسه‌های جدا
+if [ "${NOTIFY_WORKERS:-0}" -gt 0 ]; then
+    python3 worker.py "$NOTIFY_WORKERS" &
+fi
+exec python3 bot.py
@@ -0,0 +1,49 @@
+import asyncio
+import httpx
+
+
+class HttpClient:
+    # یک استخر اتصال مشترک (keep-alive) برای همه‌ی درخواست‌های خروجی بات
+    # + محدودیت همزمانی برای هر هاست، تا یک سرویس کند بقیه را قفل نکند
+    # transport: برای تست/loadtest (مثلاً httpx.MockTransport) به‌جای شبکه‌ی واقعی
+    def __init__(self, max_connections=50, max_keepalive=20, per_host_limit=10,
+                 timeout=10.0, connect_timeout=5.0, transport=None):
+        self.per_host_limit = per_host_limit
+        self._transport = transport
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=30.0
+        )
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._client = None
+        self._host_semaphores = {}
+
+    @property
+    def client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=self._limits,
+                timeout=self._timeout,
+                follow_redirects=True,
+                transport=self._transport
+            )
+        return self._client
+
+    def _semaphore(self, host):
+        sem = self._host_semaphores.get(host)
+        if sem is None:
+            sem = self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return sem
+
+    async def get(self, url, params=None, headers=None):
+        host = httpx.URL(url).host
+        async with self._semaphore(host):
+            response = await self.client.get(url, params=params, headers=headers)
+        response.raise_for_status()
+        return response
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,23 +1,57 @@
 from PIL import Image, ImageDraw, ImageFont
-import requests
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from io import BytesIO
 
-def generate_profile_card(display_name, avatar_url, total_games, last_seen, filename="profile_card.png"):
+# رندر کارت‌ها خارج از event loop
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="imagegen")
+
+# آواتارهای decode‌شده، بر اساس avatar hash
+AVATAR_CACHE_SIZE = 256
+_avatars = OrderedDict()
+_avatars_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def load_font(name, size):
+    try:
+        return ImageFont.truetype(name, size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+def _cached_avatar(avatar_hash):
+    with _avatars_lock:
+        avatar = _avatars.get(avatar_hash)
+        if avatar is not None:
+            _avatars.move_to_end(avatar_hash)
+        return avatar
+
+
+def _decode_avatar(avatar_hash, content):
+    avatar = Image.open(BytesIO(content)).convert("RGB").resize((128, 128))
+    with _avatars_lock:
+        _avatars[avatar_hash] = avatar
+        while len(_avatars) > AVATAR_CACHE_SIZE:
+            _avatars.popitem(last=False)
+    return avatar
+
+
+def render_profile_card(display_name, avatar, total_games, last_seen):
     # اندازه کارت
     width, height = 800, 300
     card = Image.new("RGB", (width, height), color=(30, 30, 30))
     draw = ImageDraw.Draw(card)
 
     # فونت‌ها
-    try:
-        font_title = ImageFont.truetype("lato.ttf", 32)
-        font_text = ImageFont.truetype("lato.ttf", 24)
-    except:
-        font_title = font_text = ImageFont.load_default()
+    font_title = load_font("lato.ttf", 32)
+    font_text = load_font("lato.ttf", 24)
 
     # آواتار
-    avatar_response = requests.get(avatar_url)
-    avatar = Image.open(BytesIO(avatar_response.content)).resize((128, 128))
     card.paste(avatar, (30, 30))
 
     # متن‌ها
@@ -25,6 +59,40 @@ def generate_profile_card(display_name, avatar_url, total_games, last_seen, file
     draw.text((180, 80), f"🎮 Total Games: {total_games}", font=font_text, fill=(200, 200, 200))
     draw.text((180, 120), f"⏱️ Last Seen: {last_seen}", font=font_text, fill=(200, 200, 200))
 
+    buffer = BytesIO()
+    card.save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
+
+
+# اثر انگشت محتوای کارت؛ اگر عوض نشده باشد file_id قبلی تلگرام دوباره استفاده می‌شود
+def card_fingerprint(display_name, avatar_hash, total_games, last_seen):
+    raw = f"{display_name}|{avatar_hash}|{total_games}|{last_seen}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def generate_profile_card(display_name, avatar_url, total_games, last_seen, filename="profile_card.png"):
+    avatar = _cached_avatar(avatar_url)
+    if avatar is None:
+        import requests
+        avatar_response = requests.get(avatar_url)
+        avatar = _decode_avatar(avatar_url, avatar_response.content)
+
     # ذخیره کارت
-    card.save(filename)
+    with open(filename, "wb") as f:
+        f.write(render_profile_card(display_name, avatar, total_games, last_seen).getvalue())
     print(f"✅ کارت ذخیره شد: {filename}")
+
+
+# نسخه‌ی async: دانلود آواتار روی استخر اتصال مشترک، decode و رندر در thread pool
+# خروجی یک BytesIO است که مستقیم به reply_photo داده می‌شود
+async def generate_profile_card_async(http, display_name, avatar_url, avatar_hash, total_games, last_seen):
+    loop = asyncio.get_running_loop()
+    avatar_hash = avatar_hash or avatar_url
+    avatar = _cached_avatar(avatar_hash)
+    if avatar is None:
+        response = await http.get(avatar_url)
+        avatar = await loop.run_in_executor(_executor, _decode_avatar, avatar_hash, response.content)
+    return await loop.run_in_executor(
+        _executor, render_profile_card, display_name, avatar, total_games, last_seen
+    )
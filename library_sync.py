@@ -0,0 +1,143 @@
+import time
+import logging
+
+from steam_api import recent_playtimes
+
+# دریافت کامل کتابخانه حداقل هر این مدت (برای بازی‌های خریده‌شده اما اجرانشده و حذف‌شده‌ها)
+FULL_REFRESH_INTERVAL = 7 * 86400
+# بررسی ارزان (GetRecentlyPlayedGames) در زمان‌بندی پس‌زمینه
+CHECK_INTERVAL = 6 * 3600
+# درخواست‌های کاربر (/steam، دکمه‌ها) زودتر از این دوباره بررسی نمی‌شوند
+ON_DEMAND_INTERVAL = 600
+SYNC_BATCH = 20
+# فعالیت اعضای گروه‌ها حداکثر این‌قدر قدیمی است
+ACTIVITY_INTERVAL = 3600
+ACTIVITY_BATCH = 200
+
+
+class LibrarySync:
+    # همگام‌سازی افزایشی کتابخانه‌ی بازی‌ها (user_games) با نسخه‌ی هر کاربر در library_sync:
+    # - بررسی ارزان: فقط بازی‌های دو هفته‌ی اخیر؛ اگر بازی ناشناخته‌ای دیده شود → دریافت کامل
+    # - دریافت کامل: GetOwnedGames بدون appinfo و مقایسه با نسخه‌ی محلی
+    # در هر دو حالت فقط appidهای تغییرکرده نوشته می‌شوند
+    def __init__(self, db, steam_api):
+        self.db = db
+        self.steam_api = steam_api
+
+    # کتابخانه را در صورت نیاز به‌روز می‌کند؛ True اگر چیزی تغییر کرده باشد
+    async def sync(self, steam_id, max_age=ON_DEMAND_INTERVAL, force=False):
+        state = self.db.get_library_state(steam_id)
+        now = time.time()
+        if force or state is None or not state[1] or now - state[1] > FULL_REFRESH_INTERVAL:
+            return await self.full_refresh(steam_id)
+        if now - (state[2] or 0) < max_age:
+            return False
+
+        return await self.apply_recent(steam_id, await self.steam_api.get_recent_playtimes(steam_id))
+
+    # اعمال بازی‌های دو هفته‌ی اخیر ({appid: (playtime_forever, playtime_2weeks)}) روی نسخه‌ی محلی
+    async def apply_recent(self, steam_id, recent):
+        local = self.db.get_playtimes(steam_id, recent)
+        refreshed = False
+        if any(appid not in local for appid in recent):
+            # بازی جدید → دریافت کامل، سپس اعمال playtime دقیق دو هفته‌ی اخیر روی آن
+            refreshed = await self.full_refresh(steam_id)
+            local = self.db.get_playtimes(steam_id, recent)
+
+        upserts = [
+            (appid, forever, two_weeks) for appid, (forever, two_weeks) in recent.items()
+            if local.get(appid) != (forever, two_weeks)
+        ]
+        # بازی‌هایی که از لیست دو هفته‌ی اخیر خارج شده‌اند
+        upserts += [
+            (appid, forever, 0) for appid, (forever, two_weeks) in local.items()
+            if appid not in recent and two_weeks
+        ]
+        return bool(self.db.apply_library_delta(steam_id, upserts)) or refreshed
+
+    async def full_refresh(self, steam_id):
+        local = self.db.get_playtimes(steam_id)
+        # اولین دریافت با appinfo (نام بازی‌ها)؛ بعد از آن فقط appid و playtime
+        games = await self.steam_api.get_owned_games(steam_id, include_appinfo=not local, fresh=True)
+        if not games:
+            # پروفایل خصوصی یا پاسخ خالی یعنی «داده‌ای نیست»، نه صفر بازی: کتابخانه‌ی محلی پاک نمی‌شود
+            # و synced_at ثبت نمی‌شود تا دفعه‌ی بعد دوباره دریافت کامل انجام شود
+            logging.warning(f"library {steam_id}: empty GetOwnedGames response, keeping local copy")
+            self.db.apply_library_delta(steam_id, [])
+            return False
+        if not local:
+            self.db.save_game_names(games)
+
+        remote = {game["appid"]: (game.get("playtime_forever", 0), game.get("playtime_2weeks", 0)) for game in games}
+        upserts = [
+            (appid, forever, two_weeks) for appid, (forever, two_weeks) in remote.items()
+            if local.get(appid) != (forever, two_weeks)
+        ]
+        removed = [appid for appid in local if appid not in remote]
+
+        new_appids = [appid for appid in remote if appid not in local]
+        if local and self.db.fill_game_names(new_appids):
+            # بازی جدیدی که در کاتالوگ هم نیست → یک‌بار دیگر با appinfo
+            self.db.save_game_names(await self.steam_api.get_owned_games(steam_id, fresh=True))
+
+        changed = self.db.apply_library_delta(steam_id, upserts, removed, full=True)
+        logging.info(f"library {steam_id}: {len(upserts)} changed, {len(removed)} removed of {len(remote)}")
+        return bool(changed)
+
+    # کتابخانه‌ی محلی برای دکمه‌ها: فقط اگر هنوز وجود ندارد دریافت می‌شود
+    async def ensure(self, steam_id):
+        if self.db.get_library_state(steam_id) is None and not self.db.has_library(steam_id):
+            await self.full_refresh(steam_id)
+
+    # کتابخانه‌ی یک SteamID برای نمایش: (تعداد بازی‌ها، مجموع دقیقه‌ها، [(نام، دقیقه) پرپلی‌ترین‌ها])
+    # یا None اگر داده‌ای نیست (پروفایل خصوصی). فقط حساب‌های وصل‌شده به یک کاربر در user_games ذخیره
+    # و همگام می‌شوند؛ بقیه (/steam <id>) فقط از پاسخ کش‌شده‌ی GetOwnedGames خوانده می‌شوند
+    async def overview(self, steam_id, top=5, refresh=False):
+        if self.db.is_linked_steam_id(steam_id):
+            await (self.sync(steam_id) if refresh else self.ensure(steam_id))
+            if not self.db.has_library(steam_id):
+                return None
+            game_count, total_minutes = self.db.get_library_stats(steam_id)
+            return game_count, total_minutes, self.db.get_top_games(steam_id, limit=top)
+
+        games = await self.steam_api.get_owned_games(steam_id)
+        if not games:
+            return None
+        played = sorted(
+            (game for game in games if game.get("playtime_forever")),
+            key=lambda game: game["playtime_forever"], reverse=True
+        )
+        return (
+            len(games), sum(game.get("playtime_forever", 0) for game in games),
+            [(game.get("name") or "نامشخص", game["playtime_forever"]) for game in played[:top]]
+        )
+
+    # فعالیت اخیر اعضای گروه‌ها (برای /activity): یک درخواست GetRecentlyPlayedGames برای هر کاربر،
+    # همزمان و کش‌شده؛ نتیجه در user_games ذخیره می‌شود و /activity فقط از دیتابیس می‌خواند
+    async def refresh_activity(self):
+        steam_ids = self.db.get_grouped_steam_ids(time.time() - ACTIVITY_INTERVAL, limit=ACTIVITY_BATCH)
+        if not steam_ids:
+            return
+        recent = await self.steam_api.get_recently_played_many(steam_ids, count=0)
+        for steam_id in steam_ids:
+            if steam_id not in recent:
+                # درخواست شکست خورد؛ تا دور بعدی ACTIVITY_INTERVAL دوباره امتحان نمی‌شود
+                self.db.apply_library_delta(steam_id, [])
+        for steam_id, games in recent.items():
+            try:
+                # پاسخ این endpoint نام بازی را دارد؛ appidهای ناشناخته نیازی به appinfo جدا ندارند
+                self.db.save_game_names(games)
+                await self.apply_recent(steam_id, recent_playtimes(games))
+            except Exception as e:
+                logging.error(f"خطا در به‌روزرسانی فعالیت {steam_id}: {e}")
+                self.db.apply_library_delta(steam_id, [])
+
+    # یک دور زمان‌بندی: قدیمی‌ترین کتابخانه‌های کاربران ثبت‌شده
+    async def sync_due(self):
+        for steam_id in self.db.get_stale_libraries(time.time() - CHECK_INTERVAL, limit=SYNC_BATCH):
+            try:
+                await self.sync(steam_id, max_age=CHECK_INTERVAL)
+            except Exception as e:
+                logging.error(f"خطا در همگام‌سازی کتابخانه‌ی {steam_id}: {e}")
+                # تا دور بعدی CHECK_INTERVAL دوباره امتحان نمی‌شود (بقیه عقب نمی‌افتند)
+                self.db.apply_library_delta(steam_id, [])
@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from benchmarks.fakes import StubTelegramRequest, FakeSteam
+
+# بازپخش updateهای ضبط‌شده (RECORD_UPDATES=updates.jsonl در bot.py) روی همان handlerهای بات
+# تلگرام و Steam هر دو شبیه‌سازی می‌شوند (با تأخیر قابل تنظیم)؛ هیچ درخواستی به بیرون نمی‌رود
+# مثال:
+#   python loadtest.py updates.jsonl --rate 200 --repeat 5 --concurrency 32 --db steamsync_users.db
+
+
+def load_updates(path, repeat):
+    with open(path, encoding="utf-8") as f:
+        raw = [json.loads(line) for line in f if line.strip()]
+    updates = []
+    for _ in range(repeat):
+        for data in raw:
+            data = dict(data, update_id=len(updates) + 1)
+            updates.append(data)
+    return updates
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(args):
+    os.environ["UPDATE_CONCURRENCY"] = str(args.concurrency)
+    os.environ.pop("RECORD_UPDATES", None)
+    # ایمپورت بعد از تنظیم env (ثابت‌های bot.py هنگام ایمپورت خوانده می‌شوند)
+    from bot import build_application
+    from http_client import HttpClient
+
+    telegram_request = StubTelegramRequest(latency=args.telegram_latency)
+    builder = ApplicationBuilder().token("123456:loadtest").request(telegram_request).updater(None)
+    app, bot = build_application(builder=builder, http=HttpClient(transport=FakeSteam(latency=args.steam_latency).transport()))
+
+    started = {}
+    latencies = []
+    finished = asyncio.Event()
+    updates = load_updates(args.updates, args.repeat)
+
+    async def done(update, context):
+        latencies.append(time.perf_counter() - started[update.update_id])
+        if len(latencies) == len(updates):
+            finished.set()
+
+    app.add_handler(TypeHandler(Update, done), group=99)
+
+    async with app:
+        await app.start()
+        t0 = time.perf_counter()
+        for i, data in enumerate(updates):
+            if args.rate:
+                delay = t0 + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = Update.de_json(data, app.bot)
+            started[update.update_id] = time.perf_counter()
+            await app.update_queue.put(update)
+        try:
+            await asyncio.wait_for(finished.wait(), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ timeout: {len(updates) - len(latencies)} updates unfinished")
+        elapsed = time.perf_counter() - t0
+        await app.stop()
+    await bot.close()
+
+    result = {
+        "updates": len(updates),
+        "completed": len(latencies),
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies, default=0) * 1000, 1),
+        "telegram_calls": telegram_request.calls,
+    }
+    print(json.dumps(result, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Telegram updates against the bot handlers")
+    parser.add_argument("updates", help="JSON lines file recorded with RECORD_UPDATES")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=0, help="updates per second (0 = all at once)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--steam-latency", type=float, default=0.1)
+    parser.add_argument("--db", help="copy of this database is used (default: empty database)")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+    args.updates = os.path.abspath(args.updates)
+
+    # دیتابیس موقت تا اجرای loadtest روی دیتابیس اصلی چیزی ننویسد
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="steamsync-loadtest-")
+    if args.db:
+        shutil.copy(args.db, os.path.join(workdir, "steamsync_users.db"))
+    os.chdir(workdir)
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+# فاصله‌ی نوشتن دسته‌ای عضویت‌ها در user_groups
+FLUSH_INTERVAL = 60
+# last_active هر عضو حداکثر یک بار در این بازه به‌روز می‌شود
+ACTIVE_RESOLUTION = 3600
+# عضوی که این مدت در گروه پیامی نداده از user_groups حذف می‌شود
+STALE_AFTER = 90 * 86400
+# فاصله‌ی اجرای حذف اعضای قدیمی
+PRUNE_INTERVAL = 86400
+
+
+class MembershipTracker:
+    # عضویت کاربران در گروه‌ها را از پیام‌های گروه برداشت می‌کند؛ تغییرات در حافظه جمع
+    # و هر FLUSH_INTERVAL با یک executemany در user_groups نوشته می‌شوند (نه یک write به ازای هر پیام)
+    def __init__(self, db):
+        self.db = db
+        # (telegram_id, group_id) → (username, زمان آخرین پیام)
+        self._dirty = {}
+        # (telegram_id, group_id) → زمان آخرین ثبت (برای رد کردن پیام‌های پشت‌سرهم)
+        self._seen = {}
+        # اعضایی که گروه را ترک کرده‌اند
+        self._left = set()
+
+    def observe(self, telegram_id, group_id, username, now=None):
+        now = now or time.time()
+        key = (telegram_id, group_id)
+        if key in self._dirty:
+            self._dirty[key] = (username, now)
+            return
+        if now - self._seen.get(key, 0) < ACTIVE_RESOLUTION:
+            return
+        self._seen[key] = now
+        self._dirty[key] = (username, now)
+        self._left.discard(key)
+
+    def left(self, telegram_id, group_id):
+        key = (telegram_id, group_id)
+        self._dirty.pop(key, None)
+        self._seen.pop(key, None)
+        self._left.add(key)
+
+    def flush(self):
+        if not self._dirty and not self._left:
+            return
+        dirty, self._dirty = self._dirty, {}
+        left, self._left = list(self._left), set()
+        rows = [
+            (telegram_id, group_id, username, datetime.utcfromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S"))
+            for (telegram_id, group_id), (username, ts) in dirty.items()
+        ]
+        try:
+            if rows:
+                self.db.touch_group_members(rows)
+            if left:
+                self.db.remove_group_members(left)
+        except Exception as e:
+            logging.error(f"خطا در ذخیره‌ی عضویت گروه‌ها: {e}")
+            # دسته‌ی بعدی دوباره امتحان می‌کند
+            for key, value in dirty.items():
+                self._dirty.setdefault(key, value)
+            self._left.update(key for key in left if key not in self._dirty)
+            return
+        # کلیدهای قدیمی‌تر از ACTIVE_RESOLUTION دیگر جلوی ثبت را نمی‌گیرند
+        cutoff = time.time() - ACTIVE_RESOLUTION
+        self._seen = {key: ts for key, ts in self._seen.items() if ts >= cutoff}
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    async def prune(self):
+        self.flush()
+        before = (datetime.utcnow() - timedelta(seconds=STALE_AFTER)).strftime("%Y-%m-%d %H:%M:%S")
+        removed = self.db.prune_group_members(before)
+        if removed:
+            logging.info(f"{removed} عضو غیرفعال از user_groups حذف شد")
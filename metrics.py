@@ -0,0 +1,157 @@
+import time
+import bisect
+import asyncio
+import logging
+from contextlib import contextmanager
+
+# متریک‌های داخل پروسه با خروجی متنی Prometheus روی یک endpoint محلی (METRICS_PORT)
+# مقدار labelها به‌صورت آرگومان‌های موقعیتی و به همان ترتیب labels داده می‌شوند:
+#   STEAM_REQUEST_SECONDS.observe(0.12, "GetPlayerSummaries", "ok")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = {}
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values → [تعداد هر bucket..., +Inf, sum, count]
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Collected:
+    # مقدارهایی که از قبل جای دیگری شمرده می‌شوند (مثل hit/miss کش)، هنگام خواندن endpoint
+    # collect یک دیکشنری label values → مقدار برمی‌گرداند
+    def __init__(self, name, help, kind, labels, collect):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = labels
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.collect()
+        except Exception as e:
+            logging.error(f"خطا در خواندن متریک {self.name}: {e}")
+            return lines
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+# ثبت با نام؛ ثبت دوباره‌ی همان نام (مثلاً ساخت دوباره‌ی SteamBot در loadtest) همان متریک را برمی‌گرداند
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    if name not in _metrics:
+        _metrics[name] = Histogram(name, help, labels, buckets)
+    return _metrics[name]
+
+
+def counter(name, help, labels=()):
+    if name not in _metrics:
+        _metrics[name] = Counter(name, help, labels)
+    return _metrics[name]
+
+
+def collected(name, help, collect, kind="gauge", labels=()):
+    # برخلاف بقیه جایگزین می‌شود، تا به آخرین شیء (مثلاً کش فعلی) اشاره کند
+    _metrics[name] = Collected(name, help, kind, labels, collect)
+    return _metrics[name]
+
+
+def render():
+    lines = []
+    for name in sorted(_metrics):
+        lines.extend(_metrics[name].render())
+    return "\n".join(lines) + "\n"
+
+
+# سرور HTTP حداقلی برای GET /metrics (بدون وابستگی اضافه)
+# پیش‌فرض فقط loopback؛ برای scrape از بیرون METRICS_HOST=0.0.0.0 (پشت فایروال)
+async def serve(port, host="127.0.0.1"):
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[1].split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logging.error(f"خطا در پاسخ metrics: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"metrics endpoint on {host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
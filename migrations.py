@@ -0,0 +1,508 @@
+import sys
+import json
+import time
+import logging
+import sqlite3
+
+# تنها تعریف schema دیتابیس: مهاجرت‌های شماره‌دار که به ترتیب اجرا می‌شوند
+# نسخه‌ی هر دیتابیس در PRAGMA user_version است؛ Database() هنگام باز شدن دیتابیس را به آخرین نسخه می‌رساند
+# (اگر از قبل به‌روز باشد فقط همان یک PRAGMA خوانده می‌شود)
+# قانون: مهاجرت‌های منتشرشده تغییر نمی‌کنند؛ هر تغییر schema یک مهاجرت جدید در انتهای MIGRATIONS است
+# اجرای دستی:
+#   python migrations.py [steamsync_users.db]
+
+# تعداد ردیف در هر دسته‌ی کپی online_rebuild (بین دسته‌ها قفل نوشتن آزاد می‌شود)
+BATCH_SIZE = 2000
+# قفل مهاجرت (ردیف meta) اگر این‌قدر به‌روز نشده باشد رها‌شده فرض می‌شود
+LOCK_TIMEOUT = 600
+LOCK_POLL = 0.5
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+# افزودن ستون به جدول‌های قدیمی‌تر (CREATE TABLE IF NOT EXISTS ستون جدید اضافه نمی‌کند)
+def add_column(conn, table, column, declaration):
+    if column not in table_columns(conn, table):
+        try:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+        except sqlite3.OperationalError as e:
+            # پروسه‌ی دیگری (worker.py) همزمان همین ستون را اضافه کرده است
+            if "duplicate column" not in str(e):
+                raise
+
+
+def has_unique_index(conn, table, column):
+    for _seq, name, unique, *_rest in conn.execute(f"PRAGMA index_list({table})"):
+        if unique and [row[2] for row in conn.execute(f"PRAGMA index_info({name})")] == [column]:
+            return True
+    return False
+
+
+# ساخت دوباره‌ی یک جدول بدون توقف بات (برای تغییر کلید، constraint یا نوع ستون):
+# ۱. جدول جدید {table}__new با create_sql ساخته می‌شود
+# ۲. triggerها هر INSERT/UPDATE/DELETE روی جدول اصلی را در جدول جدید هم اعمال می‌کنند
+# ۳. ردیف‌هایی که قبل از ساخت triggerها بوده‌اند دسته‌دسته (بر اساس rowid، هر دسته یک تراکنش کوتاه) کپی می‌شوند؛
+#    conflict="IGNORE" یعنی ردیفی که trigger زودتر نوشته جدیدتر است و حفظ می‌شود
+# ۴. در یک تراکنش کوتاه: حذف triggerها و جدول قدیمی، تغییر نام و ساخت ایندکس‌ها
+# create_sql شامل {table} است؛ key_columns کلید یکتای جدول جدید
+def online_rebuild(conn, table, create_sql, columns, key_columns, conflict="IGNORE", indexes=(),
+                   batch_size=BATCH_SIZE):
+    new = f"{table}__new"
+    cols = ", ".join(columns)
+    placeholders = ", ".join("?" * len(columns))
+    new_values = ", ".join(f"NEW.{column}" for column in columns)
+    old_key = " AND ".join(f"{column} = OLD.{column}" for column in key_columns)
+
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    # باقی‌مانده‌ی یک اجرای نیمه‌تمام
+    for suffix in ("ins", "upd", "del"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {new}_{suffix}")
+    conn.execute(f"DROP TABLE IF EXISTS {new}")
+    conn.execute(create_sql.format(table=new))
+    conn.execute(f"""
+        CREATE TRIGGER {new}_ins AFTER INSERT ON {table} BEGIN
+            INSERT OR REPLACE INTO {new} ({cols}) VALUES ({new_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER {new}_upd AFTER UPDATE ON {table} BEGIN
+            DELETE FROM {new} WHERE {old_key};
+            INSERT OR REPLACE INTO {new} ({cols}) VALUES ({new_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER {new}_del AFTER DELETE ON {table} BEGIN
+            DELETE FROM {new} WHERE {old_key};
+        END
+    """)
+    # ردیف‌هایی که بعد از ساخت triggerها اضافه می‌شوند را trigger کپی می‌کند
+    max_rowid = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+    conn.commit()
+
+    copied = 0
+    last_rowid = -1
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid, {cols} FROM {table} WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?",
+            (last_rowid, max_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            f"INSERT OR {conflict} INTO {new} ({cols}) VALUES ({placeholders})", [row[1:] for row in rows]
+        )
+        last_rowid = rows[-1][0]
+        copied += len(rows)
+        _touch_lock(conn)
+        conn.commit()
+
+    conn.execute("BEGIN IMMEDIATE")
+    sequence = None
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+        sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    for suffix in ("ins", "upd", "del"):
+        conn.execute(f"DROP TRIGGER {new}_{suffix}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {new} RENAME TO {table}")
+    if sequence:
+        # شناسه‌های AUTOINCREMENT حذف‌شده دوباره استفاده نشوند
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table))
+    for statement in indexes:
+        conn.execute(statement)
+    conn.commit()
+    logging.info(f"migration: rebuilt {table} ({copied} rows)")
+
+
+# ---- قفل بین پروسه‌ها (bot.py و worker.py همزمان استارت می‌شوند) ----
+
+# True اگر این پروسه باید مهاجرت را اجرا کند؛ False اگر پروسه‌ی دیگری آن را تمام کرد
+def _acquire_lock(conn):
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) >= LATEST:
+                return False
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = conn.execute("SELECT value FROM meta WHERE key = 'migration_lock'").fetchone()
+            if row is None or time.time() - float(row[0]) > LOCK_TIMEOUT:
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('migration_lock', ?)", (str(time.time()),)
+                )
+                return True
+        finally:
+            conn.commit()
+        time.sleep(LOCK_POLL)
+
+
+def _touch_lock(conn):
+    conn.execute("UPDATE meta SET value = ? WHERE key = 'migration_lock'", (str(time.time()),))
+
+
+def _release_lock(conn):
+    conn.execute("DELETE FROM meta WHERE key = 'migration_lock'")
+    conn.commit()
+
+
+# ---- مهاجرت‌ها ----
+
+# 1: schema پایه (همه‌ی جدول‌های قبل از موتور مهاجرت) + انتقال لیست بازی‌ها از JSON و ساخت جدول‌های رتبه‌بندی
+BASELINE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        telegram_id TEXT PRIMARY KEY,
+        username TEXT,
+        steam_id TEXT UNIQUE,
+        display_name TEXT,
+        last_seen TIMESTAMP,
+        last_fetched_data TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS user_groups (
+        telegram_id TEXT,
+        group_id TEXT,
+        username TEXT,
+        last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (telegram_id, group_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS auto_post_targets (
+        group_id TEXT,
+        topic_id TEXT,
+        purpose TEXT,
+        PRIMARY KEY (group_id, purpose)
+    );
+
+    CREATE TABLE IF NOT EXISTS command_logs (
+        telegram_id TEXT,
+        command TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS notify_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        watcher_telegram_id TEXT,
+        target_username TEXT,
+        game_name TEXT,
+        scope TEXT CHECK(scope IN ('private', 'group')),
+        group_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS games (
+        appid INTEGER PRIMARY KEY,
+        name TEXT,
+        icon TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS user_games (
+        steam_id TEXT,
+        appid INTEGER,
+        playtime_forever INTEGER DEFAULT 0,
+        playtime_2weeks INTEGER DEFAULT 0,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (steam_id, appid)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_user_games_playtime
+        ON user_games (steam_id, playtime_forever DESC);
+
+    CREATE TABLE IF NOT EXISTS library_sync (
+        steam_id TEXT PRIMARY KEY,
+        version INTEGER DEFAULT 0,
+        synced_at REAL,
+        checked_at REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS user_stats (
+        steam_id TEXT PRIMARY KEY,
+        game_count INTEGER DEFAULT 0,
+        total_minutes INTEGER DEFAULT 0,
+        recent_minutes INTEGER DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS group_stats (
+        group_id TEXT PRIMARY KEY,
+        members INTEGER DEFAULT 0,
+        game_count INTEGER DEFAULT 0,
+        total_minutes INTEGER DEFAULT 0,
+        recent_minutes INTEGER DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS group_games (
+        group_id TEXT,
+        appid INTEGER,
+        players INTEGER DEFAULT 0,
+        total_minutes INTEGER DEFAULT 0,
+        PRIMARY KEY (group_id, appid)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_group_games_minutes ON group_games (group_id, total_minutes DESC);
+
+    CREATE TABLE IF NOT EXISTS presence_state (
+        steam_id TEXT PRIMARY KEY,
+        personastate INTEGER,
+        gameid TEXT,
+        game_name TEXT,
+        updated_at TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS api_usage (
+        day TEXT,
+        endpoint TEXT,
+        requests INTEGER DEFAULT 0,
+        throttled INTEGER DEFAULT 0,
+        PRIMARY KEY (day, endpoint)
+    );
+
+    CREATE TABLE IF NOT EXISTS card_cache (
+        steam_id TEXT PRIMARY KEY,
+        fingerprint TEXT,
+        file_id TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS deal_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        taken_at TIMESTAMP,
+        deal_count INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS deals (
+        snapshot_id INTEGER,
+        appid INTEGER,
+        title TEXT,
+        link TEXT,
+        discount_pct INTEGER,
+        original_price TEXT,
+        final_price TEXT,
+        final_cents INTEGER,
+        PRIMARY KEY (snapshot_id, appid)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_deals_discount ON deals (snapshot_id, discount_pct DESC);
+    CREATE INDEX IF NOT EXISTS idx_deals_appid ON deals (appid);
+
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id TEXT,
+        thread_id INTEGER,
+        text TEXT,
+        disable_preview INTEGER DEFAULT 0,
+        kind TEXT,
+        ref TEXT,
+        status TEXT DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at REAL,
+        last_error TEXT,
+        created_at REAL,
+        sent_at REAL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+
+    CREATE TABLE IF NOT EXISTS apps (
+        appid INTEGER PRIMARY KEY,
+        name TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+    CREATE INDEX IF NOT EXISTS idx_notify_target ON notify_requests (target_username);
+    CREATE INDEX IF NOT EXISTS idx_notify_watcher ON notify_requests (watcher_telegram_id);
+    CREATE INDEX IF NOT EXISTS idx_auto_post_purpose ON auto_post_targets (purpose);
+"""
+
+
+def _baseline(db):
+    db.conn.executescript(BASELINE_SCHEMA)
+    add_column(db.conn, "notify_requests", "appid", "INTEGER")
+    _migrate_games_blobs(db)
+    db.rebuild_leaderboards()
+
+
+# انتقال یک‌باره‌ی لیست بازی‌ها از JSON داخل users.last_fetched_data به user_games
+def _migrate_games_blobs(db):
+    cursor = db.conn.cursor()
+    cursor.execute("""
+        SELECT telegram_id, steam_id, last_fetched_data FROM users
+        WHERE last_fetched_data LIKE '%"games"%'
+    """)
+    for telegram_id, steam_id, blob in cursor.fetchall():
+        try:
+            data = json.loads(blob)
+        except (TypeError, ValueError):
+            continue
+        games = data.pop("games", None) or []
+        if steam_id and games:
+            db.save_owned_games(steam_id, games, commit=False)
+        db.conn.execute(
+            "UPDATE users SET last_fetched_data = ? WHERE telegram_id = ?",
+            (json.dumps(data), telegram_id)
+        )
+    db.conn.commit()
+
+
+# 2: جدول‌هایی که init_db.py با شکل دیگری ساخته بود
+AUTO_POST_TARGETS_V2 = """
+    CREATE TABLE {table} (
+        group_id TEXT,
+        topic_id TEXT,
+        purpose TEXT,
+        PRIMARY KEY (group_id, purpose)
+    )
+"""
+
+NOTIFY_REQUESTS_V2 = """
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        watcher_telegram_id TEXT,
+        target_username TEXT,
+        game_name TEXT,
+        scope TEXT CHECK(scope IN ('private', 'group')),
+        group_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        appid INTEGER
+    )
+"""
+
+
+def _legacy_tables(db):
+    conn = db.conn
+    # auto_post_targets با ستون id و بدون کلید (group_id, purpose): INSERT ... VALUES (?, ?, ?) و
+    # ON CONFLICT در set_auto_post_target روی آن کار نمی‌کند؛ از چند ردیف تکراری آخرین ثبت می‌ماند
+    if "id" in table_columns(conn, "auto_post_targets"):
+        online_rebuild(
+            conn, "auto_post_targets", AUTO_POST_TARGETS_V2, ["group_id", "topic_id", "purpose"],
+            ["group_id", "purpose"], conflict="REPLACE",
+            indexes=["CREATE INDEX IF NOT EXISTS idx_auto_post_purpose ON auto_post_targets (purpose)"]
+        )
+    # notify_requests بدون created_at و CHECK روی scope
+    if "created_at" not in table_columns(conn, "notify_requests"):
+        columns = [column for column in table_columns(conn, "notify_requests") if column != "created_at"]
+        online_rebuild(
+            conn, "notify_requests", NOTIFY_REQUESTS_V2, columns, ["id"],
+            indexes=[
+                "CREATE INDEX IF NOT EXISTS idx_notify_target ON notify_requests (target_username)",
+                "CREATE INDEX IF NOT EXISTS idx_notify_watcher ON notify_requests (watcher_telegram_id)",
+            ]
+        )
+    # users.steam_id بدون UNIQUE: هر حساب Steam فقط برای آخرین کاربری که آن را وصل کرده می‌ماند
+    if not has_unique_index(conn, "users", "steam_id"):
+        cursor = conn.execute("""
+            UPDATE users SET steam_id = NULL
+            WHERE steam_id IS NOT NULL AND rowid NOT IN (
+                SELECT MAX(rowid) FROM users WHERE steam_id IS NOT NULL GROUP BY steam_id
+            )
+        """)
+        if cursor.rowcount:
+            logging.warning(f"migration: unlinked {cursor.rowcount} duplicate steam_id row(s)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_steam_id ON users (steam_id)")
+        conn.commit()
+        if cursor.rowcount:
+            db.rebuild_leaderboards()
+
+
+# 3: ایندکس‌های کوئری‌های پرتکرار
+def _hot_path_indexes(db):
+    db.conn.executescript("""
+        -- همه‌ی دستورات گروهی (/online، /activity، /rank) اعضا را با group_id می‌خوانند؛
+        -- کلید اصلی (telegram_id, group_id) برای این جستجو قابل استفاده نیست
+        CREATE INDEX IF NOT EXISTS idx_user_groups_group ON user_groups (group_id);
+        -- defer_chat_messages بعد از هر RetryAfter
+        CREATE INDEX IF NOT EXISTS idx_outbox_chat ON outbox (chat_id, status);
+    """)
+
+
+# 4: نوتیف‌های تکرارشونده (/notify ... every=2h quiet=23-8 session)
+#   cooldown: فاصله‌ی حداقل بین دو ارسال (ثانیه)؛ NULL یعنی یک‌باره (بعد از اولین ارسال حذف می‌شود)
+#   quiet_start/quiet_end: ساعت سکوت به دقیقه از نیمه‌شب (وقت محلی)، last_fired_at: unix time آخرین ارسال
+def _recurring_watches(db):
+    conn = db.conn
+    add_column(conn, "notify_requests", "cooldown", "INTEGER")
+    add_column(conn, "notify_requests", "quiet_start", "INTEGER")
+    add_column(conn, "notify_requests", "quiet_end", "INTEGER")
+    add_column(conn, "notify_requests", "session_only", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "notify_requests", "last_fired_at", "INTEGER")
+
+
+# 5: گزارش تغییرات برای همگام‌سازی افزایشی ایندکس /notify در pollerهای worker.py (sync_watches)
+#   triggerها حذف درخواست‌ها (/removenotif در پروسه‌ی bot) و تغییر steam_id/username کاربران را ثبت می‌کنند؛
+#   request_id: درخواست حذف‌شده، username: یوزری که باید دوباره به steam_id وصل شود
+def _watch_changes(db):
+    db.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS watch_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_id INTEGER,
+            username TEXT,
+            changed_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_watch_changes_time ON watch_changes (changed_at);
+
+        CREATE TRIGGER IF NOT EXISTS trg_notify_requests_deleted AFTER DELETE ON notify_requests BEGIN
+            INSERT INTO watch_changes (request_id) VALUES (OLD.id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_users_inserted AFTER INSERT ON users
+        WHEN NEW.steam_id IS NOT NULL BEGIN
+            INSERT INTO watch_changes (username) VALUES (NEW.username);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_users_relinked AFTER UPDATE OF steam_id, username ON users
+        WHEN NEW.steam_id IS NOT OLD.steam_id OR NEW.username IS NOT OLD.username BEGIN
+            INSERT INTO watch_changes (username) VALUES (OLD.username);
+            INSERT INTO watch_changes (username) SELECT NEW.username WHERE NEW.username IS NOT OLD.username;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_users_deleted AFTER DELETE ON users BEGIN
+            INSERT INTO watch_changes (username) VALUES (OLD.username);
+        END;
+    """)
+
+
+# 6: snapshotهای تخفیف کامل/ناقص؛ snapshotهای قبلی (۵۰۰ ردیف اول جستجو) ناقص حساب می‌شوند
+def _complete_deal_snapshots(db):
+    add_column(db.conn, "deal_snapshots", "complete", "INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS = [
+    (1, "baseline", _baseline),
+    (2, "legacy init_db.py tables", _legacy_tables),
+    (3, "hot path indexes", _hot_path_indexes),
+    (4, "recurring notify watches", _recurring_watches),
+    (5, "notify watch change log", _watch_changes),
+    (6, "complete deal snapshots", _complete_deal_snapshots),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def migrate(db):
+    conn = db.conn
+    if schema_version(conn) >= LATEST:
+        return
+    if not _acquire_lock(conn):
+        return
+    try:
+        for version, name, step in MIGRATIONS:
+            if schema_version(conn) >= version:
+                continue
+            start = time.perf_counter()
+            step(db)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+            logging.info(f"schema migration {version} ({name}) done in {time.perf_counter() - start:.2f}s")
+    finally:
+        _release_lock(conn)
+
+
+if __name__ == "__main__":
+    from db import Database
+    logging.basicConfig(level=logging.INFO)
+    db = Database(sys.argv[1] if len(sys.argv) > 1 else "steamsync_users.db")
+    print(f"schema version {schema_version(db.conn)}")
+    db.close()
@@ -0,0 +1,249 @@
+import os
+import re
+import time
+import zlib
+
+import metrics
+from presence import STARTED_PLAYING, WENT_OFFLINE, WENT_ONLINE
+from watches import WatchIndex
+
+# هر چند ثانیه scheduler برای هدف‌های سررسیدشده بررسی می‌شود
+NOTIFY_TICK = 10
+# کمترین فاصله‌ی مجاز بین دو ارسال یک نوتیف تکرارشونده (every=...)
+MIN_COOLDOWN = 600
+# ردیف‌های watch_changes بعد از این مدت پاک می‌شوند (pollerها هر دقیقه می‌خوانند و هر ساعت کامل reload می‌کنند)
+WATCH_CHANGES_TTL = 86400
+# اختلاف وقت محلی با UTC (دقیقه) برای ساعت سکوت؛ پیش‌فرض وقت ایران
+QUIET_HOURS_UTC_OFFSET = int(os.getenv("QUIET_HOURS_UTC_OFFSET", "210"))
+
+NOTIFY_SKIPPED = metrics.counter("notify_skipped_total", "Matched /notify watches that were not sent", ("reason",))
+
+_DURATION = re.compile(r"(\d+)([mhd])")
+_DURATION_UNITS = {"m": 60, "h": 3600, "d": 86400}
+_QUIET = re.compile(r"(\d{1,2})(?::(\d{2}))?-(\d{1,2})(?::(\d{2}))?")
+
+
+# شماره‌ی shard هر steam_id؛ crc32 بین پروسه‌ها ثابت است (برخلاف hash())
+def shard_of(steam_id, shard_count):
+    return zlib.crc32(str(steam_id).encode("utf-8")) % shard_count
+
+
+# گزینه‌های انتهای /notify: here، every=2h، quiet=23-8 (یا 23:30-07:00)، session
+# خروجی: (آرگومان‌های باقی‌مانده = نام بازی, گزینه‌ها)؛ ValueError با پیام قابل نمایش
+def parse_watch_options(args):
+    args = list(args)
+    options = {"here": False, "cooldown": None, "quiet": None, "session_only": False}
+    while len(args) > 1:
+        token = args[-1].lower()
+        if token == "here":
+            options["here"] = True
+        elif token == "session":
+            options["session_only"] = True
+        elif token.startswith("every="):
+            match = _DURATION.fullmatch(token[6:])
+            if not match:
+                raise ValueError("فاصله‌ی every نامعتبر است (مثال: every=30m، every=2h، every=1d)")
+            options["cooldown"] = max(MIN_COOLDOWN, int(match.group(1)) * _DURATION_UNITS[match.group(2)])
+        elif token.startswith("quiet="):
+            match = _QUIET.fullmatch(token[6:])
+            start_h, start_m, end_h, end_m = (int(part or 0) for part in match.groups()) if match else (None,) * 4
+            if not match or start_h > 23 or end_h > 23 or start_m > 59 or end_m > 59:
+                raise ValueError("ساعت سکوت نامعتبر است (مثال: quiet=23-8 یا quiet=23:30-07:00)")
+            options["quiet"] = (start_h * 60 + start_m, end_h * 60 + end_m)
+        else:
+            break
+        args.pop()
+    return args, options
+
+
+def _format_duration(seconds):
+    for unit, size in (("d", 86400), ("h", 3600)):
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds // 60}m"
+
+
+# توضیح کوتاه تنظیم‌های یک نوتیف برای /notify و /mynotifs
+def describe_watch_options(cooldown, quiet_start, quiet_end, session_only):
+    parts = [f"🔁 حداکثر هر {_format_duration(cooldown)}" if cooldown else "یک‌باره"]
+    if session_only:
+        parts.append("فقط شروع session")
+    if quiet_start is not None:
+        parts.append(f"🌙 سکوت {quiet_start // 60:02d}:{quiet_start % 60:02d}-{quiet_end // 60:02d}:{quiet_end % 60:02d}")
+    return "، ".join(parts)
+
+
+def local_minute(now):
+    return int(now // 60 + QUIET_HOURS_UTC_OFFSET) % 1440
+
+
+class NotifyPoller:
+    # بررسی درخواست‌های /notify: poll هدف‌های سررسیدشده و صف کردن پیام برای شروع بازی
+    # با shard_count > 1 فقط هدف‌هایی که shard_of آن‌ها برابر shard است بررسی می‌شوند
+    # enqueue همان امضای MessageDispatcher.enqueue را دارد
+    def __init__(self, db, steam_api, scheduler, presence, enqueue, shard=0, shard_count=1):
+        self.db = db
+        self.steam_api = steam_api
+        self.scheduler = scheduler
+        self.presence = presence
+        self.enqueue = enqueue
+        self.shard = shard
+        self.shard_count = shard_count
+        # ایندکس درخواست‌ها در حافظه (load_watches، یا اولین sweep)
+        self.watches = None
+        # (version ایندکس, scheduler) آخرین set_targets
+        self._scheduled = None
+        # steam_idهایی که از آخرین WENT_ONLINE هنوز بازی‌ای شروع نکرده‌اند (session باز)؛
+        # اولین STARTED_PLAYING بعد از آن شروع session است، حتی اگر چند poll بعد دیده شود
+        # (فقط در حافظه: بعد از استارت از اولین آنلاین شدن هر هدف شمرده می‌شود)
+        self._open_sessions = set()
+
+    def owns(self, steam_id):
+        return self.shard_count <= 1 or shard_of(steam_id, self.shard_count) == self.shard
+
+    # ---- ایندکس درخواست‌ها ----
+
+    def load_watches(self):
+        # seq قبل از ردیف‌ها خوانده می‌شود تا تغییری که وسط خواندن ثبت شده در sync بعدی از دست نرود
+        change_seq = self.db.get_watch_change_seq()
+        rows = self.db.get_all_notify_requests()
+        # reload: وضعیت «مقایسه‌شده با وضعیت فعلی هدف» از ایندکس قبلی حفظ می‌شود
+        previous, self.watches = self.watches, WatchIndex(self.owns)
+        self.watches.load(rows, self.db.get_steam_ids_by_usernames({row[2] for row in rows}), previous)
+        self.watches.change_seq = change_seq
+
+    # فراخوانی از /notify، /removenotif و /linksteam در همان پروسه (قبل از load کاری نمی‌کنند)
+    def add_watch(self, id, watcher_id, target, game_name, scope, group_id=None, appid=None,
+                  cooldown=None, quiet=None, session_only=False):
+        if self.watches is None:
+            return
+        if target not in self.watches.steam_ids:
+            self.watches.link(target, self.db.get_user_by_username(target))
+        quiet_start, quiet_end = quiet or (None, None)
+        self.watches.add(id, watcher_id, target, game_name, scope, group_id, appid,
+                         cooldown, quiet_start, quiet_end, session_only)
+
+    def remove_watch(self, watch_id):
+        if self.watches is not None:
+            self.watches.remove(watch_id)
+
+    def link_target(self, target, steam_id):
+        if self.watches is not None:
+            self.watches.link(target, steam_id)
+
+    # rows: [(appid, game_name, id)] مثل Database.set_notify_appids
+    def resolve_watches(self, rows):
+        if self.watches is not None:
+            for appid, game_name, watch_id in rows:
+                self.watches.resolve(watch_id, appid, game_name)
+
+    # pollerهای worker.py: درخواست‌های تازه‌ی پروسه‌ی bot، و از watch_changes درخواست‌های حذف‌شده
+    # و هدف‌هایی که Steam وصل/عوض کرده‌اند یا username دیگری گرفته‌اند
+    async def sync_watches(self):
+        if self.watches is None:
+            self.load_watches()
+            return
+        watches = self.watches
+        # اول تغییرات، بعد ردیف‌های تازه: درخواستی که بین این دو حذف شود در sync بعدی حذف می‌شود
+        change_seq, removed, usernames = self.db.get_watch_changes_since(watches.change_seq)
+        rows = self.db.get_notify_requests_since(watches.max_id)
+        targets = {target for target in usernames if target in watches.steam_ids}
+        targets |= {row[2] for row in rows if row[2] not in watches.steam_ids}
+        steam_ids = self.db.get_steam_ids_by_usernames(targets)
+        moved = set()
+        for target in targets:
+            steam_id = steam_ids.get(target)
+            # درخواست‌های هدفی که از shard دیگری به این shard آمده هیچ‌وقت بارگذاری نشده‌اند
+            if self.shard_count > 1 and steam_id and self.owns(steam_id) and watches.steam_ids.get(target) != steam_id:
+                moved.add(target)
+            watches.link(target, steam_id)
+        moved -= {row[2] for row in rows}
+        for row in rows + (self.db.get_notify_requests_for_targets(moved) if moved else []):
+            watches.add(*row)
+        for watch_id in removed:
+            watches.remove(watch_id)
+        watches.change_seq = change_seq
+
+    async def reload_watches(self):
+        self.load_watches()
+
+    async def prune_watch_changes(self):
+        self.db.prune_watch_changes(time.time() - WATCH_CHANGES_TTL)
+
+    # یک دور بررسی: فقط هدف‌های سررسیدشده poll می‌شوند و فقط آن‌هایی که
+    # وضعیتشان عوض شده (شروع بازی) بررسی می‌شوند؛ بدون خواندن از دیتابیس
+    async def sweep(self):
+        if self.watches is None:
+            self.load_watches()
+        watches = self.watches
+        now = time.time()
+        # هدف‌هایی که همه‌ی درخواست‌هایشان در cooldown هستند تا wake_at از scheduler بیرون می‌روند
+        if self._scheduled != (watches.version, self.scheduler) or now >= watches.wake_at:
+            self.scheduler.set_targets(watches.target_counts(now))
+            self._scheduled = (watches.version, self.scheduler)
+        due = self.scheduler.due()
+        if not due:
+            return
+
+        summaries = await self.steam_api.get_player_summaries(due, fresh=True)
+        for steam_id in due:
+            summary = summaries.get(steam_id)
+            self.scheduler.reschedule(steam_id, online=bool(summary and summary.get("personastate", 0) > 0))
+        events = self.presence.update(summaries)
+
+        # شروع session: اولین شروع بازی بعد از آنلاین شدن هدف (رویدادهای هر هدف به ترتیب‌اند)
+        session_starts = set()
+        for event in events:
+            if event.kind == WENT_ONLINE:
+                self._open_sessions.add(event.steam_id)
+            elif event.kind == WENT_OFFLINE:
+                self._open_sessions.discard(event.steam_id)
+            elif event.kind == STARTED_PLAYING and event.steam_id in self._open_sessions:
+                self._open_sessions.discard(event.steam_id)
+                session_starts.add(event.steam_id)
+        minute = local_minute(now)
+        # هر (چت، هدف، بازی) در یک دور فقط یک پیام می‌گیرد، حتی با چند درخواست مشابه
+        sent = set()
+        fired = set()
+        for event in events:
+            if event.kind != STARTED_PLAYING or not event.game_name:
+                continue
+            for watch in watches.match(event.steam_id, event.gameid, event.game_name, now):
+                if watch.session_only and event.steam_id not in session_starts:
+                    continue
+                self._fire_watch(watch, now, minute, sent)
+                fired.add(watch.id)
+
+        # درخواست‌های تازه یک‌بار با وضعیت فعلی مقایسه می‌شوند
+        # (اگر هدف از قبل مشغول همان بازی باشد، رویداد شروعی نخواهیم داشت)
+        for steam_id, watch in watches.take_pending(summaries):
+            if watch.id in fired or watch.session_only:
+                continue
+            current_gameid, current_game = self.presence.current_game(steam_id)
+            if current_game and watch in watches.match(steam_id, current_gameid, current_game, now):
+                self._fire_watch(watch, now, minute, sent)
+
+    def _fire_watch(self, watch, now, minute, sent):
+        if watch.is_quiet(minute):
+            NOTIFY_SKIPPED.inc("quiet")
+            return
+        # یک‌باره: حذف ردیف؛ تکرارشونده: فقط last_fired_at (بدون حذف و ثبت دوباره)
+        # اگر ردیف دیگر نیست (/removenotif در پروسه‌ی دیگر) پیامی نمی‌رود
+        self.watches.fired(watch, now)
+        if watch.cooldown is None:
+            exists = self.db.remove_notify_request(watch.id)
+        else:
+            exists = self.db.mark_notify_fired(watch.id, int(now))
+        if not exists:
+            self.watches.remove(watch.id)
+            return
+        chat_id = watch.watcher_id if watch.scope == "private" else watch.group_id
+        if (chat_id, watch.target, watch.game_name) in sent:
+            NOTIFY_SKIPPED.inc("duplicate")
+            return
+        sent.add((chat_id, watch.target, watch.game_name))
+        self.enqueue(
+            chat_id,
+            f"🔔 @{watch.target} هم‌اکنون در حال بازی {watch.game_name} است!",
+            kind="notify", ref=str(watch.id)
+        )
@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+# انواع تغییر وضعیت
+WENT_ONLINE = "went_online"
+WENT_OFFLINE = "went_offline"
+STARTED_PLAYING = "started_playing"
+STOPPED_PLAYING = "stopped_playing"
+
+PresenceEvent = namedtuple("PresenceEvent", ["steam_id", "kind", "gameid", "game_name"])
+
+
+class PresenceTracker:
+    # آخرین وضعیت شناخته‌شده‌ی هر steam_id (personastate, gameid, game_name)
+    # را نگه می‌دارد و از هر poll فقط تغییرات را به‌صورت رویداد بیرون می‌دهد
+    def __init__(self, db):
+        self.db = db
+        self.states = db.load_presence_states()
+
+    def update(self, summaries):
+        events = []
+        changed = []
+        for steam_id, summary in summaries.items():
+            personastate = summary.get("personastate", 0)
+            gameid = summary.get("gameid")
+            game_name = summary.get("gameextrainfo")
+            new_state = (personastate, gameid, game_name)
+
+            old_state = self.states.get(steam_id)
+            if old_state == new_state:
+                continue
+            old_personastate, old_gameid, old_game_name = old_state or (0, None, None)
+
+            if old_personastate == 0 and personastate > 0:
+                events.append(PresenceEvent(steam_id, WENT_ONLINE, gameid, game_name))
+            if old_gameid and old_gameid != gameid:
+                events.append(PresenceEvent(steam_id, STOPPED_PLAYING, old_gameid, old_game_name))
+            if gameid and gameid != old_gameid:
+                events.append(PresenceEvent(steam_id, STARTED_PLAYING, gameid, game_name))
+            if old_personastate > 0 and personastate == 0:
+                events.append(PresenceEvent(steam_id, WENT_OFFLINE, old_gameid, old_game_name))
+
+            self.states[steam_id] = new_state
+            changed.append((steam_id, personastate, gameid, game_name))
+
+        if changed:
+            self.db.save_presence_states(changed)
+        return events
+
+    def current_game(self, steam_id):
+        state = self.states.get(steam_id)
+        return (state[1], state[2]) if state else (None, None)
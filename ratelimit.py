@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+
+
+class TokenBucket:
+    # محدودکننده‌ی نرخ مشترک برای همه‌ی درخواست‌های Steam API
+    def __init__(self, rate=5.0, capacity=20):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    # بعد از 429 همه‌ی فراخوانی‌ها برای مدتی متوقف می‌شوند
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# تأخیر exponential با jitter برای تلاش مجدد شماره‌ی attempt (از صفر)
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+# مقدار هدر Retry-After (ثانیه) اگر وجود داشته باشد
+def retry_after(response):
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class QuotaTracker:
+    # شمارش روزانه‌ی درخواست‌ها برای هر endpoint، ذخیره‌شده در جدول api_usage
+    # شمارش‌ها در حافظه جمع و هر FLUSH_INTERVAL ثانیه با یک executemany نوشته می‌شوند (نه یک write به ازای هر درخواست)
+    # used_today مصرف کل روز است (bot.py و همه‌ی shardهای worker.py روی یک دیتابیس)،
+    # هر TOTAL_SYNC_INTERVAL ثانیه دوباره از دیتابیس خوانده می‌شود و بین دو خواندن با record جلو می‌رود
+    FLUSH_INTERVAL = 10
+    TOTAL_SYNC_INTERVAL = 30
+
+    def __init__(self, db):
+        self.db = db
+        self._day = None
+        # endpoint → [requests, throttled] که هنوز در api_usage نوشته نشده‌اند
+        self._pending = {}
+        self._flushed_at = time.monotonic()
+        self._roll_day()
+
+    def _roll_day(self):
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        if today != self._day:
+            # شمارش‌های روز قبل به همان روز نوشته می‌شوند
+            self.flush()
+            self._day = today
+            self._total = self.db.get_api_usage_total(today)
+            self._total_synced_at = time.monotonic()
+
+    def _count(self, endpoint, requests, throttled):
+        self._roll_day()
+        counts = self._pending.setdefault(endpoint, [0, 0])
+        counts[0] += requests
+        counts[1] += throttled
+        if time.monotonic() - self._flushed_at >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def record(self, endpoint):
+        self._count(endpoint, 1, 0)
+        self._total += 1
+
+    def record_throttled(self, endpoint):
+        self._count(endpoint, 0, 1)
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            self.db.increment_api_usage(
+                self._day, [(endpoint, requests, throttled) for endpoint, (requests, throttled) in pending.items()]
+            )
+        except Exception as e:
+            logging.error(f"خطا در ذخیره‌ی مصرف Steam API: {e}")
+            # دسته‌ی بعدی دوباره امتحان می‌کند
+            for endpoint, (requests, throttled) in pending.items():
+                counts = self._pending.setdefault(endpoint, [0, 0])
+                counts[0] += requests
+                counts[1] += throttled
+
+    def used_today(self):
+        self._roll_day()
+        if time.monotonic() - self._total_synced_at >= self.TOTAL_SYNC_INTERVAL:
+            self.flush()
+            self._total = self.db.get_api_usage_total(self._day)
+            self._total_synced_at = time.monotonic()
+        return self._total
+
+    # {endpoint: (requests, throttled)} برای امروز، از همه‌ی پروسه‌ها (جدول api_usage)
+    def usage_today(self):
+        self._roll_day()
+        self.flush()
+        return {
+            endpoint: (requests, throttled)
+            for endpoint, requests, throttled in sorted(self.db.get_api_usage(self._day))
+        }
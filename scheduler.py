@@ -0,0 +1,127 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+
+import metrics
+from steam_api import SUMMARIES_BATCH_SIZE
+
+# فاصله‌ی poll (ثانیه) بر اساس وضعیت هدف
+HOT_INTERVAL = 30          # آنلاین با چند درخواست نوتیف
+ONLINE_INTERVAL = 60       # آنلاین
+RECENT_INTERVAL = 300      # در یک ساعت اخیر آنلاین بوده
+DORMANT_INTERVAL = 900     # آفلاین
+DEEP_DORMANT_INTERVAL = 1800  # بیش از یک روز آفلاین
+
+HOT_WATCH_COUNT = 3
+MAX_PRESSURE = 10
+
+JOB_SECONDS = metrics.histogram("job_seconds", "Background job run time", ("job",))
+# تأخیر شروع هر اجرا نسبت به زمان برنامه‌ریزی‌شده (اجرای قبلی طولانی‌تر از interval بوده)
+JOB_LAG_SECONDS = metrics.histogram("job_lag_seconds", "Background job start delay past its schedule", ("job",))
+
+
+class PollScheduler:
+    # زمان‌بندی poll هر steam_id بر اساس تعداد نوتیف‌ها، آنلاین بودن اخیر
+    # و سهمیه‌ی باقی‌مانده‌ی روزانه‌ی Steam API
+    # quota: شیء با متد used_today (ratelimit.QuotaTracker)؛ مصرف واقعی درخواست‌های Steam از آن خوانده می‌شود
+    def __init__(self, quota, daily_budget=90000):
+        self.daily_budget = daily_budget
+        self.quota = quota
+        self._heap = []            # (due_at, steam_id)
+        self._due_at = {}          # steam_id → due_at (برای حذف تنبل ورودی‌های کهنه از heap)
+        self.watch_counts = {}
+        self.last_online = {}
+
+    # ---- سهمیه ----
+
+    def used_today(self):
+        return self.quota.used_today()
+
+    def budget_remaining(self):
+        return max(0, self.daily_budget - self.used_today())
+
+    # نسبت مصرف فعلی به سهم مجاز تا این لحظه از روز؛ بیشتر از ۱ یعنی جلوتر از برنامه‌ایم
+    def pressure(self):
+        now = datetime.utcnow()
+        midnight = datetime(now.year, now.month, now.day)
+        elapsed = max((now - midnight).total_seconds(), 3600)
+        allowed = self.daily_budget * elapsed / 86400
+        return min(max(self.used_today() / allowed, 1.0), MAX_PRESSURE)
+
+    # ---- هدف‌ها ----
+
+    def set_targets(self, watch_counts):
+        now = time.time()
+        for steam_id in list(self._due_at):
+            if steam_id not in watch_counts:
+                del self._due_at[steam_id]
+                self.watch_counts.pop(steam_id, None)
+                self.last_online.pop(steam_id, None)
+        for steam_id, count in watch_counts.items():
+            self.watch_counts[steam_id] = count
+            if steam_id not in self._due_at:
+                self._push(steam_id, now)
+
+    def interval_for(self, steam_id, online, now=None):
+        now = now or time.time()
+        if online:
+            base = HOT_INTERVAL if self.watch_counts.get(steam_id, 0) >= HOT_WATCH_COUNT else ONLINE_INTERVAL
+        else:
+            last_online = self.last_online.get(steam_id)
+            if last_online and now - last_online < 3600:
+                base = RECENT_INTERVAL
+            elif last_online and now - last_online < 86400:
+                base = DORMANT_INTERVAL
+            else:
+                base = DEEP_DORMANT_INTERVAL
+        return base * self.pressure()
+
+    def reschedule(self, steam_id, online):
+        if steam_id not in self._due_at:
+            return
+        now = time.time()
+        if online:
+            self.last_online[steam_id] = now
+        self._push(steam_id, now + self.interval_for(steam_id, online, now))
+
+    def _push(self, steam_id, due_at):
+        self._due_at[steam_id] = due_at
+        heapq.heappush(self._heap, (due_at, steam_id))
+
+    # steam_idهایی که وقت poll آن‌ها رسیده، محدود به سهمیه‌ی باقی‌مانده
+    def due(self, now=None):
+        now = now or time.time()
+        max_targets = self.budget_remaining() * SUMMARIES_BATCH_SIZE
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < max_targets:
+            due_at, steam_id = heapq.heappop(self._heap)
+            if self._due_at.get(steam_id) == due_at:
+                due.append(steam_id)
+        return due
+
+    def next_due_in(self, now=None):
+        now = now or time.time()
+        while self._heap and self._due_at.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - now)
+
+
+# اجرای دوره‌ای یک job با فاصله‌ی ثابت (بدون drift) و لاگ خطا بدون توقف حلقه
+async def run_every(interval, job, initial_delay=10):
+    await asyncio.sleep(initial_delay)
+    name = getattr(job, "__qualname__", None) or str(job)
+    next_run = time.monotonic()
+    while True:
+        start = time.monotonic()
+        JOB_LAG_SECONDS.observe(max(0.0, start - next_run), name)
+        try:
+            await job()
+        except Exception as e:
+            logging.error(f"خطا در اجرای {getattr(job, '__name__', job)}: {e}")
+        JOB_SECONDS.observe(time.monotonic() - start, name)
+        next_run += interval
+        await asyncio.sleep(max(0.0, next_run - time.monotonic()))
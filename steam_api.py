@@ -1,46 +1,239 @@
 import os
-import requests
-from functools import lru_cache
+import time
+import asyncio
+import logging
+import httpx
+import metrics
+from cache import ResponseCache
+from http_client import HttpClient
+from ratelimit import backoff_delay, retry_after
 
+# حداکثر تعداد steamid در هر درخواست GetPlayerSummaries
+SUMMARIES_BATCH_SIZE = 100
 
-class SteamAPI:
-    def __init__(self, api_key):
+STEAM_REQUEST_SECONDS = metrics.histogram(
+    "steam_request_seconds", "Steam Web API request latency per attempt", ("endpoint", "status")
+)
+
+
+# خروجی GetRecentlyPlayedGames → {appid: (playtime_forever, playtime_2weeks)}
+def recent_playtimes(games):
+    return {game["appid"]: (game.get("playtime_forever", 0), game.get("playtime_2weeks", 0)) for game in games}
+
+
+class AsyncSteamAPI:
+    # نسخه‌ی async برای استفاده داخل هندلرهای بات (بدون بلاک کردن event loop)
+    BASE_URL = "https://api.steampowered.com"
+
+    MAX_RETRIES = 4
+
+    def __init__(self, api_key, http=None, cache=None, limiter=None, quota=None):
         self.api_key = api_key
+        self.http = http or HttpClient()
+        self.cache = cache or ResponseCache()
+        # limiter (TokenBucket) و quota (QuotaTracker) بین همه‌ی فراخوانی‌ها مشترک‌اند
+        self.limiter = limiter
+        self.quota = quota
+        self._inflight = {}            # درخواست‌های در جریان، برای اشتراک بین فراخوانی‌های یکسان
+        self._inflight_summaries = {}  # steam_id → future خلاصه‌ی در حال دریافت
 
-    def resolve_vanity_url(self, vanity_url):
-        url = f"https://api.steampowered.com/ISteamUser/ResolveVanityURL/v1/?key={self.api_key}&vanityurl={vanity_url}"
-        response = requests.get(url)
-        data = response.json()
+    async def _call(self, path, **params):
+        key = (path, tuple(sorted(params.items())))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request(path, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    # یک درخواست با رعایت rate limit و تلاش مجدد روی 429/5xx/خطای شبکه
+    async def _request(self, path, params):
+        endpoint = path.split("/")[1]
+        params = dict(params, key=self.api_key)
+        for attempt in range(self.MAX_RETRIES + 1):
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            if self.quota is not None:
+                self.quota.record(endpoint)
+            start = time.perf_counter()
+            try:
+                response = await self.http.get(f"{self.BASE_URL}/{path}", params=params)
+                STEAM_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, "200")
+                return response.json()
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                STEAM_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, str(status))
+                if (status != 429 and status < 500) or attempt == self.MAX_RETRIES:
+                    # متن خطای httpx شامل URL کامل است؛ کلید API از آن حذف می‌شود تا در لاگ‌ها نیاید
+                    message = str(e).replace(self.api_key, "***") if self.api_key else str(e)
+                    raise httpx.HTTPStatusError(message, request=e.request, response=e.response) from None
+                delay = retry_after(e.response) or backoff_delay(attempt)
+                if status == 429:
+                    if self.quota is not None:
+                        self.quota.record_throttled(endpoint)
+                    if self.limiter is not None:
+                        self.limiter.pause(delay)
+            except httpx.TransportError:
+                STEAM_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, "transport_error")
+                if attempt == self.MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+            logging.warning(f"{endpoint}: retry {attempt + 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def resolve_vanity_url(self, vanity_url):
+        cached = self.cache.get("vanity", vanity_url.lower())
+        if cached is not None:
+            return cached
+        data = await self._call("ISteamUser/ResolveVanityURL/v1/", vanityurl=vanity_url)
         if data["response"]["success"] == 1:
+            self.cache.set("vanity", vanity_url.lower(), data["response"]["steamid"])
             return data["response"]["steamid"]
         raise Exception("Vanity URL not found")
 
-    @lru_cache(maxsize=200)
-    def get_player_summary(self, steam_id):
-        url = f"http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/?key={self.api_key}&steamids={steam_id}"
-        response = requests.get(url)
-        return response.json()["response"]["players"][0]
-
-    def get_owned_games(self, steam_id):
-        url = f"http://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/?key={self.api_key}&steamid={steam_id}&include_appinfo=1"
-        response = requests.get(url)
-        return response.json()["response"].get("games", [])
-    def get_recently_played_games(self, steam_id, count=5):
-        url = f"{self.base_url}/IPlayerService/GetRecentlyPlayedGames/v0001/"
-        params = {
-            "key": self.api_key,
-            "steamid": steam_id,
-            "count": count
-        }
+    async def get_player_summary(self, steam_id):
+        summaries = await self.get_player_summaries([steam_id])
+        if steam_id not in summaries:
+            raise Exception(f"Player summary not available: {steam_id}")
+        return summaries[steam_id]
+
+    # خلاصه‌ی پروفایل چند کاربر؛ فقط آیدی‌های خارج از کش، در دسته‌های ۱۰۰تایی
+    # حداکثر concurrency دسته همزمان؛ اگر timeout برسد نتیجه‌ی ناقص برمی‌گردد
+    # (آیدی‌هایی که جواب نگرفتند در دیکشنری خروجی نیستند)
+    # fresh=True: کش خوانده نمی‌شود (برای poller) ولی نتیجه در کش ذخیره می‌شود
+    # آیدی‌هایی که همین الان توسط فراخوانی دیگری در حال دریافت‌اند دوباره درخواست نمی‌شوند
+    async def get_player_summaries(self, steam_ids, concurrency=5, timeout=None, fresh=False):
+        summaries = {}
+        waiting = {}
+        missing = []
+        for steam_id in dict.fromkeys(steam_ids):
+            cached = None if fresh else self.cache.get("summary", steam_id)
+            if cached is not None:
+                summaries[steam_id] = cached
+            elif steam_id in self._inflight_summaries:
+                waiting[steam_id] = self._inflight_summaries[steam_id]
+            else:
+                missing.append(steam_id)
+        if not missing and not waiting:
+            return summaries
+
+        loop = asyncio.get_running_loop()
+        for steam_id in missing:
+            self._inflight_summaries[steam_id] = loop.create_future()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(chunk):
+            players = {}
+            try:
+                async with semaphore:
+                    data = await self._call("ISteamUser/GetPlayerSummaries/v0002/", steamids=",".join(chunk))
+                for player in data["response"]["players"]:
+                    players[player["steamid"]] = player
+                    self.cache.set("summary", player["steamid"], player)
+            except Exception as e:
+                logging.error(f"GetPlayerSummaries batch failed: {e}")
+            finally:
+                for steam_id in chunk:
+                    future = self._inflight_summaries.pop(steam_id, None)
+                    if future is not None and not future.done():
+                        future.set_result(players.get(steam_id))
+            return players
+
+        tasks = [
+            asyncio.create_task(fetch(missing[i:i + SUMMARIES_BATCH_SIZE]))
+            for i in range(0, len(missing), SUMMARIES_BATCH_SIZE)
+        ]
+        done, pending = await asyncio.wait(tasks + list(waiting.values()), timeout=timeout)
+        for task in tasks:
+            if task in pending:
+                task.cancel()
+        if pending:
+            logging.warning(f"GetPlayerSummaries: {len(pending)} lookup(s) timed out")
+
+        for task in tasks:
+            if task in done:
+                summaries.update(task.result())
+        for steam_id, future in waiting.items():
+            if future in done and future.result() is not None:
+                summaries[steam_id] = future.result()
+        return summaries
+
+    # include_appinfo=False: فقط appid و playtime (پاسخ بسیار کوچک‌تر برای کتابخانه‌های بزرگ)
+    async def get_owned_games(self, steam_id, include_appinfo=True, fresh=False):
+        cache_key = steam_id if include_appinfo else f"{steam_id}:ids"
+        cached = None if fresh else self.cache.get("owned_games", cache_key)
+        if cached is not None:
+            return cached
+        data = await self._call(
+            "IPlayerService/GetOwnedGames/v0001/", steamid=steam_id, include_appinfo=int(include_appinfo)
+        )
+        games = data["response"].get("games", [])
+        self.cache.set("owned_games", cache_key, games)
+        return games
+
+    # لیست اپ‌های فروشگاه (فقط بازی‌ها)؛ با if_modified_since فقط تغییرات برمی‌گردد
+    async def get_app_list(self, if_modified_since=0, last_appid=0, max_results=50000):
+        data = await self._call(
+            "IStoreService/GetAppList/v1/",
+            if_modified_since=if_modified_since, last_appid=last_appid,
+            max_results=max_results, include_games=1
+        )
+        return data.get("response", {})
+
+    async def get_recently_played_games(self, steam_id, count=5):
+        cache_key = f"{steam_id}:{count}"
+        cached = self.cache.get("recent", cache_key)
+        if cached is not None:
+            return cached
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            data = await self._call(
+                "IPlayerService/GetRecentlyPlayedGames/v0001/", steamid=steam_id, count=count
+            )
             games = data.get("response", {}).get("games", [])
+            self.cache.set("recent", cache_key, games)
             return games
-        except requests.exceptions.HTTPError as e:
-            print(f"[ERROR] HTTP error in get_recently_played_games: {e}")
+        except httpx.HTTPStatusError as e:
+            logging.error(f"HTTP error in get_recently_played_games: {e}")
         except Exception as e:
-            print(f"[ERROR] Unexpected error in get_recently_played_games: {e}")
+            logging.error(f"Unexpected error in get_recently_played_games: {e}")
         return []
-   
+
+    # بازی‌های اخیر چند کاربر (Steam نسخه‌ی چندتایی ندارد → همزمان با سقف concurrency)
+    # → {steam_id: games}؛ کاربرانی که درخواستشان شکست خورد در خروجی نیستند (نه لیست خالی)
+    async def get_recently_played_many(self, steam_ids, count=0, concurrency=5, fresh=False):
+        results = {}
+        missing = []
+        for steam_id in dict.fromkeys(steam_ids):
+            cached = None if fresh else self.cache.get("recent", f"{steam_id}:{count}")
+            if cached is not None:
+                results[steam_id] = cached
+            else:
+                missing.append(steam_id)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(steam_id):
+            async with semaphore:
+                try:
+                    data = await self._call(
+                        "IPlayerService/GetRecentlyPlayedGames/v0001/", steamid=steam_id, count=count
+                    )
+                except Exception as e:
+                    logging.error(f"GetRecentlyPlayedGames failed for {steam_id}: {e}")
+                    return
+            games = data.get("response", {}).get("games", [])
+            self.cache.set("recent", f"{steam_id}:{count}", games)
+            results[steam_id] = games
+
+        await asyncio.gather(*(fetch(steam_id) for steam_id in missing))
+        return results
+
+    # بازی‌های دو هفته‌ی اخیر (بدون کش) → {appid: (playtime_forever, playtime_2weeks)}
+    # برخلاف get_recently_played_games خطا را بالا می‌دهد تا sync روی داده‌ی ناقص تصمیم نگیرد
+    async def get_recent_playtimes(self, steam_id):
+        data = await self._call("IPlayerService/GetRecentlyPlayedGames/v0001/", steamid=steam_id, count=0)
+        return recent_playtimes(data.get("response", {}).get("games", []))
+
+    async def close(self):
+        await self.http.close()
+        self.cache.close()
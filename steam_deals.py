@@ -1,42 +1,210 @@
-import requests
-from bs4 import BeautifulSoup
+import re
+import logging
+from html.parser import HTMLParser
 
-def fetch_discounted_games(limit=10):
-    url = "https://store.steampowered.com/search/?specials=1"
-    headers = {
-        "User-Agent": "Mozilla/5.0"
+# خروجی JSON صفحه‌ی جستجو (results_html) که صفحه‌بندی با start/count دارد
+SEARCH_RESULTS_URL = "https://store.steampowered.com/search/results/"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0"
+}
+PAGE_SIZE = 100
+# کل نتایج specials دریافت می‌شود (معمولاً چند هزار تا)؛ این فقط سقف اطمینان است
+# و snapshotی که به آن برسد «ناقص» ثبت می‌شود
+MAX_DEALS = 30000
+# ترتیب ثابت (بر اساس نام) به‌جای رتبه‌بندی فروشگاه که بین صفحه‌ها و روزها جابه‌جا می‌شود؛
+# وگرنه ردیف‌ها بین صفحه‌ها جا می‌افتند یا تکرار می‌شوند
+SORT_BY = "Name_ASC"
+# تعداد snapshotهایی که در دیتابیس نگه داشته می‌شوند
+KEEP_SNAPSHOTS = 30
+
+VOID_TAGS = {"img", "br", "input", "meta", "link", "hr", "source", "wbr"}
+_DIGITS = re.compile(r"\d+")
+
+
+class SearchResultsParser(HTMLParser):
+    # پارسر جریانی ردیف‌های search_result_row (بدون ساختن درخت DOM)
+    FIELDS = {
+        "title": "title",
+        "discount_pct": "discount",
+        "search_discount": "discount",
+        "discount_original_price": "original_price",
+        "discount_final_price": "final_price",
+        "search_price": "price_parts",
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self._row = None
+        self._row_depth = 0
+        self._depth = 0
+        self._field = None
+        self._field_depth = 0
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if tag not in VOID_TAGS:
+            self._depth += 1
+
+        if tag == "a" and "search_result_row" in classes:
+            appid = (attrs.get("data-ds-appid") or "").split(",")[0]
+            self._row = {"appid": int(appid) if appid.isdigit() else None,
+                         "link": (attrs.get("href") or "").split("?")[0].strip()}
+            self._row_depth = self._depth
+            return
+        if self._row is None:
+            return
+
+        if "search_price_discount_combined" in classes:
+            if attrs.get("data-discount", "").isdigit():
+                self._row["discount_pct"] = int(attrs["data-discount"])
+            if attrs.get("data-price-final", "").isdigit():
+                self._row["final_cents"] = int(attrs["data-price-final"])
+        if self._field is None and tag not in VOID_TAGS:
+            for css_class in classes:
+                if css_class in self.FIELDS:
+                    self._field = self.FIELDS[css_class]
+                    self._field_depth = self._depth
+                    self._text = []
+                    break
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if self._field is not None and self._depth == self._field_depth:
+            parts = [" ".join(text.split()) for text in self._text if text.strip()]
+            value = parts if self._field == "price_parts" else " ".join(parts)
+            self._row.setdefault(self._field, value)
+            self._field = None
+        if self._row is not None and self._depth == self._row_depth:
+            self.rows.append(self._row)
+            self._row = None
+        self._depth -= 1
+
+    def handle_data(self, data):
+        if self._field is not None:
+            self._text.append(data)
+
+
+def _normalize(row):
+    discount = row.get("discount", "")
+    discount_pct = row.get("discount_pct")
+    if discount_pct is None:
+        match = _DIGITS.search(discount)
+        discount_pct = int(match.group()) if match else 0
+    if not discount:
+        discount = f"-{discount_pct}%" if discount_pct else ""
+
+    final_price = row.get("final_price")
+    original_price = row.get("original_price")
+    if not final_price and row.get("price_parts"):
+        # نشانه‌گذاری قدیمی: قیمت اصلی (strike) و نهایی پشت‌سرهم داخل search_price
+        price_parts = row["price_parts"]
+        final_price = price_parts[-1]
+        original_price = price_parts[0] if len(price_parts) > 1 else final_price
+
+    return {
+        "appid": row.get("appid"),
+        "title": row.get("title", ""),
+        "link": row.get("link", ""),
+        "discount": discount,
+        "discount_pct": discount_pct,
+        "original_price": original_price or final_price or "نامشخص",
+        "final_price": final_price or "نامشخص",
+        "final_cents": row.get("final_cents"),
     }
 
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, 'html.parser')
 
+def parse_discounted_games(html, limit=None):
+    parser = SearchResultsParser()
+    parser.feed(html)
+    parser.close()
+    games = [_normalize(row) for row in parser.rows]
+    return games[:limit] if limit else games
+
+
+def _page_params(start, count, sort_by=None):
+    params = {"specials": 1, "infinite": 1, "start": start, "count": count}
+    if sort_by:
+        params["sort_by"] = sort_by
+    return params
+
+
+# نسخه‌ی sync (اجرای مستقیم همین فایل)؛ بات از نسخه‌ی async استفاده می‌کند
+def fetch_discounted_games(limit=10):
+    import requests
+    response = requests.get(SEARCH_RESULTS_URL, params=_page_params(0, limit), headers=HEADERS)
+    return parse_discounted_games(response.json().get("results_html", ""), limit)
+
+
+# همه‌ی صفحه‌های تخفیف با ترتیب ثابت روی استخر اتصال مشترک (http_client.HttpClient)
+# خروجی: (تخفیف‌ها، complete)؛ complete یعنی تا total_count فروشگاه رسیده‌ایم (نه سقف limit یا صفحه‌ی خالی)
+async def fetch_discounted_games_async(http, limit=MAX_DEALS):
     games = []
-    result_rows = soup.find_all("a", class_="search_result_row")[:limit]
+    seen = set()
+    start = 0
+    complete = False
+    while start < limit:
+        count = min(PAGE_SIZE, limit - start)
+        response = await http.get(SEARCH_RESULTS_URL, params=_page_params(start, count, SORT_BY), headers=HEADERS)
+        data = response.json()
+        page = parse_discounted_games(data.get("results_html", ""))
+        for game in page:
+            if game["appid"] is not None and game["appid"] not in seen:
+                seen.add(game["appid"])
+                games.append(game)
+        start += count
+        total = data.get("total_count")
+        if total is not None and start >= total:
+            complete = True
+            break
+        if not page:
+            break
+    return games[:limit], complete
 
-    for row in result_rows:
-        title = row.find("span", class_="title").text.strip()
-        link = row["href"].split("?")[0].strip()
 
-        discount_block = row.find("div", class_="search_price_discount_combined")
-        discount_text = discount_block.find("div", class_="search_discount").text.strip() if discount_block else ""
+# تفاوت دو snapshot (دیکشنری appid → deal): تخفیف جدید، تخفیف بیشتر، تمام‌شده
+# «جدید» فقط نسبت به snapshot کامل معنا دارد و «تمام‌شده» فقط وقتی هر دو کامل‌اند؛
+# در غیر این صورت new خالی و ended برابر None است (نامعلوم، نه صفر)
+def diff_deals(previous, current, previous_complete=True, current_complete=True):
+    new = [deal for appid, deal in current.items() if appid not in previous] if previous_complete else []
+    deeper = [
+        deal for appid, deal in current.items()
+        if appid in previous and deal["discount_pct"] > previous[appid]["discount_pct"]
+    ]
+    ended = None
+    if previous_complete and current_complete:
+        ended = [deal for appid, deal in previous.items() if appid not in current]
+    return {"new": new, "deeper": deeper, "ended": ended}
 
-        price_block = discount_block.find("div", class_="search_price") if discount_block else None
-        if price_block:
-            price_parts = price_block.text.strip().split("zا")  # handles some localization
-            final_price = price_parts[-1].strip()
-            original_price = price_parts[0].strip() if len(price_parts) > 1 else final_price
-        else:
-            final_price = original_price = "نامشخص"
 
-        games.append({
-            "title": title,
-            "link": link,
-            "discount": discount_text,
-            "original_price": original_price,
-            "final_price": final_price
-        })
+class DealsIngestor:
+    # دریافت همه‌ی صفحات تخفیف، ذخیره‌ی snapshot زمان‌دار و محاسبه‌ی diff با snapshot قبلی
+    def __init__(self, http, db, max_deals=MAX_DEALS):
+        self.http = http
+        self.db = db
+        self.max_deals = max_deals
 
-    return games
+    async def ingest(self):
+        games, complete = await fetch_discounted_games_async(self.http, limit=self.max_deals)
+        if not games:
+            raise Exception("No deals parsed from store search")
+        previous = self.db.get_latest_deal_snapshot()
+        snapshot_id = self.db.save_deal_snapshot(games, keep=KEEP_SNAPSHOTS, complete=complete)
+        current = {game["appid"]: game for game in games}
+        # اولین snapshot مبنای مقایسه ندارد
+        if previous:
+            diff = diff_deals(self.db.get_snapshot_deals(previous[0]), current, bool(previous[2]), complete)
+        else:
+            diff = {"new": [], "deeper": [], "ended": None}
+        ended = "?" if diff["ended"] is None else len(diff["ended"])
+        logging.info(
+            f"deals snapshot {snapshot_id}: {len(games)} deals{'' if complete else ' (incomplete)'}, "
+            f"{len(diff['new'])} new, {len(diff['deeper'])} deeper, {ended} ended"
+        )
+        return snapshot_id, diff
 
 # مثال کاربری:
 if __name__ == "__main__":
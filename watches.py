@@ -0,0 +1,244 @@
+from catalog import normalize_name
+
+
+class Watch:
+    # یک درخواست /notify؛ با __slots__ (بدون __dict__) تا میلیون‌ها درخواست در حافظه جا شوند
+    # options: (cooldown, quiet_start, quiet_end, session_only) مشترک بین درخواست‌های هم‌تنظیم، یا None
+    # ready_at: تا این زمان (unix) درخواست تکرارشونده در cooldown است و اصلاً بررسی نمی‌شود
+    __slots__ = ("id", "watcher_id", "target", "game_name", "scope", "group_id", "appid", "options", "ready_at")
+
+    def __init__(self, id, watcher_id, target, game_name, scope, group_id, appid, options=None, ready_at=0):
+        self.id = id
+        self.watcher_id = watcher_id
+        self.target = target
+        self.game_name = game_name
+        self.scope = scope
+        self.group_id = group_id
+        self.appid = appid
+        self.options = options
+        self.ready_at = ready_at
+
+    @property
+    def cooldown(self):
+        return self.options[0] if self.options else None
+
+    @property
+    def session_only(self):
+        return bool(self.options and self.options[3])
+
+    # minute: دقیقه از نیمه‌شب به وقت محلی
+    def is_quiet(self, minute):
+        if not self.options or self.options[1] is None:
+            return False
+        start, end = self.options[1], self.options[2]
+        if start <= end:
+            return start <= minute < end
+        return minute >= start or minute < end
+
+
+def _options(cooldown, quiet_start, quiet_end, session_only):
+    if cooldown is None and quiet_start is None and not session_only:
+        return None
+    return (cooldown, quiet_start, quiet_end, int(bool(session_only)))
+
+
+# کلید تطبیق: appid، یا برای درخواستی که در کاتالوگ پیدا نشد نام نرمال‌شده‌ی کامل (یک‌بار، موقع ثبت)
+def _key(appid, game_name):
+    return appid or normalize_name(game_name)
+
+
+class WatchIndex:
+    # همه‌ی درخواست‌های /notify در حافظه، گروه‌بندی‌شده بر اساس steam_id هدف و appid:
+    #   match: steam_id → _targets → _by_target → appid (یا نام نرمال‌شده) → [Watch, ...]
+    # یک‌بار از دیتابیس خوانده و بعد با add/remove/link/fired به‌روز می‌شود؛ sweep دیگر کوئری نمی‌زند
+    # owns: فیلتر shard؛ درخواست‌های هدف‌هایی که مال shard دیگری هستند نگه داشته نمی‌شوند
+    def __init__(self, owns=None):
+        self.owns = owns or (lambda steam_id: True)
+        self._by_id = {}
+        # target_username → {appid یا نام نرمال‌شده: [Watch]}؛ با username تا درخواست هدفی که هنوز
+        # Steam وصل نکرده هم نگه داشته شود
+        self._by_target = {}
+        # target_username → steam_id (None یعنی هنوز Steam وصل نکرده)
+        self.steam_ids = {}
+        self._targets = {}         # steam_id → target_username
+        # درخواست‌هایی که هنوز یک‌بار با وضعیت فعلی هدف مقایسه نشده‌اند: target → [Watch]
+        self._pending = {}
+        # مقدارهای پرتکرار (یوزر هدف، نام بازی، گروه، options) فقط یک‌بار در حافظه
+        self._shared_values = {}
+        # با هر تغییری که تعداد درخواست‌های فعال هدف‌ها را عوض کند بالا می‌رود (برای set_targets)
+        self.version = 0
+        self.max_id = 0
+        # آخرین ردیف watch_changes که اعمال شده (sync_watches)
+        self.change_seq = 0
+        # زودترین پایان cooldown؛ از این زمان به بعد target_counts باید دوباره ساخته شود
+        self.wake_at = float("inf")
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def _shared(self, value):
+        return value if value is None else self._shared_values.setdefault(value, value)
+
+    # rows: همان ستون‌های Database.NOTIFY_COLUMNS، steam_ids: target_username → steam_id
+    # previous: ایندکس قبلی (reload)؛ فقط درخواست‌هایی که آنجا نبودند یا هنوز مقایسه نشده بودند pending می‌شوند.
+    # بدون previous (استارت) درخواستی که قبلاً ارسال شده (last_fired_at) دوباره با وضعیت فعلی مقایسه نمی‌شود،
+    # وگرنه هدفی که وسط همان بازی است بدون رویداد شروع بازی دوباره نوتیف می‌گرفت
+    def load(self, rows, steam_ids, previous=None):
+        for target in {row[2] for row in rows}:
+            self.link(target, steam_ids.get(target))
+        # همان add بدون فراخوانی تابع برای هر ردیف (استارت با میلیون‌ها درخواست)
+        shared = self._shared_values.setdefault
+        by_id, by_target, pending = self._by_id, self._by_target, self._pending
+        keys = {}
+        skipped = {target for target, steam_id in self.steam_ids.items() if steam_id and not self.owns(steam_id)}
+        if previous is not None:
+            known = previous._by_id
+            unchecked = {watch.id for watches in previous._pending.values() for watch in watches}
+        for (id, watcher_id, target, game_name, scope, group_id, appid,
+             cooldown, quiet_start, quiet_end, session_only, last_fired_at) in rows:
+            if id in by_id or target in skipped:
+                continue
+            options = _options(cooldown, quiet_start, quiet_end, session_only)
+            target = shared(target, target)
+            watch = Watch(
+                id, watcher_id, target, shared(game_name, game_name), shared(scope, scope),
+                group_id and shared(group_id, group_id), appid, options and shared(options, options),
+                last_fired_at + cooldown if cooldown and last_fired_at else 0
+            )
+            by_id[id] = watch
+            if appid:
+                key = appid
+            elif game_name in keys:
+                key = keys[game_name]
+            else:
+                key = keys[game_name] = normalize_name(game_name)
+            by_target.setdefault(target, {}).setdefault(key, []).append(watch)
+            if (last_fired_at is None) if previous is None else (id not in known or id in unchecked):
+                pending.setdefault(target, []).append(watch)
+        self.max_id = max(self.max_id, max((row[0] for row in rows), default=0))
+        self.version += 1
+
+    def add(self, id, watcher_id, target, game_name, scope, group_id=None, appid=None,
+            cooldown=None, quiet_start=None, quiet_end=None, session_only=0, last_fired_at=None):
+        self.max_id = max(self.max_id, id)
+        steam_id = self.steam_ids.get(target)
+        if id in self._by_id or (steam_id and not self.owns(steam_id)):
+            return
+        target = self._shared(target)
+        watch = Watch(
+            id, watcher_id, target, self._shared(game_name), self._shared(scope), self._shared(group_id), appid,
+            self._shared(_options(cooldown, quiet_start, quiet_end, session_only)),
+            last_fired_at + cooldown if cooldown and last_fired_at else 0
+        )
+        self._by_id[id] = watch
+        self._file(watch)
+        self._pending.setdefault(target, []).append(watch)
+        self.version += 1
+        return watch
+
+    def remove(self, watch_id):
+        watch = self._by_id.pop(watch_id, None)
+        if watch is None:
+            return None
+        self._unfile(watch)
+        # درخواستی که هنوز مقایسه نشده (هدفی که poll نشده) نباید در _pending بماند
+        pending = self._pending.get(watch.target)
+        if pending and watch in pending:
+            pending.remove(watch)
+            if not pending:
+                del self._pending[watch.target]
+        self.version += 1
+        return watch
+
+    def _file(self, watch):
+        self._by_target.setdefault(watch.target, {}).setdefault(_key(watch.appid, watch.game_name), []).append(watch)
+
+    def _unfile(self, watch):
+        groups = self._by_target[watch.target]
+        key = _key(watch.appid, watch.game_name)
+        groups[key].remove(watch)
+        if not groups[key]:
+            del groups[key]
+            if not groups:
+                del self._by_target[watch.target]
+
+    # همه‌ی درخواست‌های یک یوزر هدف
+    def _watches_of(self, target):
+        return [watch for watches in self._by_target.get(target, {}).values() for watch in watches]
+
+    # درخواستی که بعد از ثبت در کاتالوگ پیدا شد: تطبیق از این به بعد با appid
+    def resolve(self, watch_id, appid, game_name):
+        watch = self._by_id.get(watch_id)
+        if watch is not None:
+            self._unfile(watch)
+            watch.appid = appid
+            watch.game_name = self._shared(game_name)
+            self._file(watch)
+
+    # ارسال شد: یک‌باره‌ها حذف می‌شوند، تکرارشونده‌ها تا پایان cooldown کنار می‌روند
+    def fired(self, watch, now):
+        if watch.cooldown is None:
+            self.remove(watch.id)
+            return
+        watch.ready_at = now + watch.cooldown
+        self.wake_at = min(self.wake_at, watch.ready_at)
+        self.version += 1
+
+    # target_username حالا به steam_id وصل است (linksteam یا تغییر username)
+    def link(self, target, steam_id):
+        if target in self.steam_ids and self.steam_ids[target] == steam_id:
+            return
+        old = self.steam_ids.get(target)
+        if old and self._targets.get(old) == target:
+            del self._targets[old]
+        if steam_id:
+            previous = self._targets.get(steam_id)
+            if previous and previous != target:
+                self.steam_ids[previous] = None
+            self._targets[steam_id] = target
+            if not self.owns(steam_id):
+                for watch in self._watches_of(target):
+                    self.remove(watch.id)
+        self.steam_ids[self._shared(target)] = steam_id
+        self.version += 1
+
+    # تعداد درخواست‌های فعال (خارج از cooldown) هر steam_id، ورودی PollScheduler.set_targets؛
+    # هدفی که همه‌ی درخواست‌هایش در cooldown هستند poll نمی‌شود
+    def target_counts(self, now):
+        counts = {}
+        wake_at = float("inf")
+        for target, groups in self._by_target.items():
+            steam_id = self.steam_ids.get(target)
+            if not steam_id or not self.owns(steam_id):
+                continue
+            count = 0
+            for watches in groups.values():
+                for watch in watches:
+                    if watch.ready_at <= now:
+                        count += 1
+                    elif watch.ready_at < wake_at:
+                        wake_at = watch.ready_at
+            if count:
+                counts[steam_id] = count
+        self.wake_at = wake_at
+        return counts
+
+    # درخواست‌های خارج از cooldown که با شروع بازی gameid/game_name توسط steam_id فعال می‌شوند
+    def match(self, steam_id, gameid, game_name, now):
+        groups = self._by_target.get(self._targets.get(steam_id))
+        if not groups:
+            return []
+        appid = int(gameid) if gameid and str(gameid).isdigit() else None
+        norm_name = normalize_name(game_name)
+        watches = (groups.get(appid, []) if appid else []) + (groups.get(norm_name, []) if norm_name else [])
+        return [watch for watch in watches if watch.ready_at <= now]
+
+    # درخواست‌های تازه‌ی هدف‌هایی که وضعیتشان (summaries) در دست است؛ هر درخواست یک‌بار برمی‌گردد
+    def take_pending(self, summaries):
+        taken = []
+        for target in list(self._pending):
+            steam_id = self.steam_ids.get(target)
+            if steam_id not in summaries:
+                continue
+            taken += [(steam_id, watch) for watch in self._pending.pop(target) if watch.id in self._by_id]
+        return taken
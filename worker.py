@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import multiprocessing
+from dotenv import load_dotenv
+from telegram import Bot
+
+from cache import ResponseCache
+from db import Database
+from dispatcher import MessageDispatcher
+from http_client import HttpClient
+import metrics
+from notifier import NotifyPoller, NOTIFY_TICK
+from presence import PresenceTracker
+from ratelimit import TokenBucket, QuotaTracker
+from scheduler import PollScheduler, run_every
+from steam_api import AsyncSteamAPI
+
+# پروسه‌های جدا از bot.py (با NOTIFY_WORKERS > 0 در entrypoint.sh اجرا می‌شوند):
+#   python worker.py poller <shard> <shards>  → poll هدف‌های یک shard و نوشتن پیام در outbox
+#   python worker.py sender                   → ارسال پیام‌های outbox به تلگرام
+#   python worker.py [shards]                 → اجرای همه‌ی pollerها + sender و راه‌اندازی مجدد در صورت خروج
+# صف کاری بین پروسه‌ها همان جدول outbox در SQLite (WAL) است
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# در worker جدا، پیام‌های تازه از پروسه‌ی دیگری می‌آیند؛ صف زودتر خوانده می‌شود
+SENDER_IDLE_POLL = 1
+RESTART_DELAY = 5
+# درخواست‌های /notify در پروسه‌ی bot ثبت می‌شوند؛ ایندکس poller هر دقیقه تازه‌ها، حذف‌ها و
+# تغییر لینک‌ها را می‌خواند (watch_changes) و برای اطمینان هر ساعت کامل از نو ساخته می‌شود
+WATCH_SYNC_INTERVAL = 60
+WATCH_RELOAD_INTERVAL = 3600
+
+
+def shard_count():
+    return max(1, int(os.getenv("NOTIFY_WORKERS", "1")))
+
+
+# هر پروسه endpoint جدای خودش را دارد: poller i روی METRICS_PORT+1+i و sender روی METRICS_PORT+1+shards
+def _metrics_jobs(offset):
+    port = int(os.getenv("METRICS_PORT", "0"))
+    return [metrics.serve(port + offset, os.getenv("METRICS_HOST", "127.0.0.1"))] if port else []
+
+
+async def _run_until_stopped(*jobs):
+    loop = asyncio.get_running_loop()
+    tasks = [asyncio.ensure_future(job) for job in jobs]
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda: [task.cancel() for task in tasks])
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        pass
+
+
+async def run_poller(shard, shards):
+    db = Database(shared=True)
+    # نرخ Steam API بین bot.py و همه‌ی shardها تقسیم می‌شود؛ سهمیه‌ی روزانه مشترک است
+    # (QuotaTracker.used_today مصرف کل همه‌ی پروسه‌ها را با STEAM_DAILY_BUDGET مقایسه می‌کند)
+    rate_limiter = TokenBucket(rate=float(os.getenv("STEAM_RATE_LIMIT", "5")) / (shards + 1))
+    quota = QuotaTracker(db)
+    steam_api = AsyncSteamAPI(
+        os.getenv("STEAM_API_KEY"), http=HttpClient(), cache=ResponseCache(db_path=os.getenv("STEAM_CACHE_DB")),
+        limiter=rate_limiter, quota=quota
+    )
+    scheduler = PollScheduler(quota, daily_budget=int(os.getenv("STEAM_DAILY_BUDGET", "90000")))
+
+    def enqueue(chat_id, text, thread_id=None, kind=None, ref=None, disable_preview=False):
+        return db.enqueue_message(
+            str(chat_id), text, thread_id=thread_id, kind=kind, ref=ref, disable_preview=disable_preview
+        )
+
+    notifier = NotifyPoller(db, steam_api, scheduler, PresenceTracker(db), enqueue, shard=shard, shard_count=shards)
+    notifier.load_watches()
+    logging.info(f"notify poller {shard}/{shards} started with {len(notifier.watches)} watches")
+    try:
+        await _run_until_stopped(
+            run_every(NOTIFY_TICK, notifier.sweep, initial_delay=1),
+            run_every(WATCH_SYNC_INTERVAL, notifier.sync_watches, initial_delay=WATCH_SYNC_INTERVAL),
+            run_every(WATCH_RELOAD_INTERVAL, notifier.reload_watches, initial_delay=WATCH_RELOAD_INTERVAL),
+            db.commit_loop(), *_metrics_jobs(1 + shard)
+        )
+    finally:
+        await steam_api.close()
+        quota.flush()
+        db.close()
+
+
+async def run_sender():
+    db = Database(shared=True)
+    bot = Bot(os.getenv("TELEGRAM_TOKEN"))
+    dispatcher = MessageDispatcher(bot, db, idle_poll=SENDER_IDLE_POLL)
+    logging.info("outbox sender started")
+    async with bot:
+        try:
+            await _run_until_stopped(dispatcher.run(), db.commit_loop(), *_metrics_jobs(1 + shard_count()))
+        finally:
+            db.close()
+
+
+def _start(role, *args):
+    load_dotenv()
+    if role == "poller":
+        asyncio.run(run_poller(*args))
+    else:
+        asyncio.run(run_sender())
+
+
+def supervise(shards):
+    roles = [("poller", shard, shards) for shard in range(shards)] + [("sender",)]
+    processes = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        for role in roles:
+            process = processes.get(role)
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logging.error(f"worker {role} exited with code {process.exitcode}; restarting")
+                time.sleep(RESTART_DELAY)
+            process = multiprocessing.Process(target=_start, args=role, name="-".join(map(str, role)))
+            process.start()
+            processes[role] = process
+        time.sleep(1)
+
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join(timeout=10)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    args = sys.argv[1:]
+    if args and args[0] == "poller":
+        _start("poller", int(args[1]), int(args[2]))
+    elif args and args[0] == "sender":
+        _start("sender")
+    else:
+        supervise(int(args[0]) if args else shard_count())